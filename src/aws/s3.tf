@@ -4,13 +4,23 @@ resource "aws_s3_bucket" "marsha_source" {
   acl    = "private"
   region = "${var.aws_region}"
 
+  # Parts of multipart uploads are sent with PUT requests and the browser must read the
+  # ETag of each part to complete the upload
   cors_rule {
     allowed_headers = ["*"]
-    allowed_methods = ["POST"]
+    allowed_methods = ["POST", "PUT"]
     allowed_origins = ["*"]
+    expose_headers  = ["ETag"]
     max_age_seconds = 3600
   }
 
+  # Remove the parts of the multipart uploads that were neither completed nor aborted
+  lifecycle_rule {
+    id                                     = "abort-incomplete-multipart-uploads"
+    enabled                                = true
+    abort_incomplete_multipart_upload_days = 7
+  }
+
   tags {
     Name        = "marsha-source"
     Environment = "${terraform.workspace}"
@@ -22,6 +22,7 @@ from marsha.core.models import (
     TimedTextTrack,
     User,
     Video,
+    XAPIOutboxStatement,
 )
 
 
@@ -220,6 +221,7 @@ class ConsumerSiteAdmin(admin.ModelAdmin):
         "lrs_url",
         "lrs_auth_token",
         "lrs_xapi_version",
+        "lrs_outbox_active",
         "video_show_download_default",
     )
     readonly_fields = ["id", "created_on", "updated_on"]
@@ -403,3 +405,29 @@ class LTIPassportAdmin(admin.ModelAdmin):
         "playlist__title",
     )
     verbose_name = _("LTI passport")
+
+
+@admin.register(XAPIOutboxStatement, site=admin_site)
+class XAPIOutboxStatementAdmin(admin.ModelAdmin):
+    """Admin class for the XAPIOutboxStatement model."""
+
+    list_display = (
+        "id",
+        link_field("consumer_site"),
+        "attempts",
+        "next_attempt_on",
+        "created_on",
+    )
+    list_select_related = ("consumer_site",)
+    fields = (
+        "id",
+        "consumer_site",
+        "statement",
+        "attempts",
+        "next_attempt_on",
+        "last_error",
+        "created_on",
+    )
+    readonly_fields = ["id", "consumer_site", "statement", "last_error", "created_on"]
+    search_fields = ("consumer_site__name", "consumer_site__domain")
+    verbose_name = _("xAPI outbox statement")
@@ -0,0 +1,578 @@
+"""Declare API endpoints with Django RestFramework viewsets."""
+import logging
+from mimetypes import guess_extension
+from os.path import splitext
+
+from django.conf import settings
+from django.utils import timezone
+
+import requests
+from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.models import TokenUser
+
+from .. import defaults, permissions, serializers
+from ..exceptions import MissingUserIdError
+from ..lti import LTIUser
+from ..models import Document, Thumbnail, TimedTextTrack, Video
+from ..utils.cache_utils import invalidate_app_data
+from ..utils.s3_utils import get_s3_upload_policy_signature
+from ..utils.time_utils import to_timestamp
+from ..xapi import XAPI, get_xapi_context
+from .multipart import MultipartUploadMixin
+from .status import UploadStatusMixin
+
+
+logger = logging.getLogger(__name__)
+
+
+class VideoViewSet(
+    MultipartUploadMixin,
+    UploadStatusMixin,
+    mixins.RetrieveModelMixin,
+    mixins.UpdateModelMixin,
+    viewsets.GenericViewSet,
+):
+    """Viewset for the API of the video object."""
+
+    # Load all the relations needed by the serializer in a fixed number of queries
+    queryset = Video.objects.select_related("playlist", "thumbnail").prefetch_related(
+        "timedtexttracks"
+    )
+    serializer_class = serializers.VideoSerializer
+    permission_classes = [
+        permissions.IsResourceAdmin | permissions.IsResourceInstructor
+    ]
+
+    @action(methods=["post"], detail=True, url_path="initiate-upload")
+    # pylint: disable=unused-argument
+    def initate_upload(self, request, pk=None):
+        """Get an upload policy for a video.
+
+        Calling the endpoint resets the upload state to `pending` and returns an upload policy to
+        our AWS S3 source bucket.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint
+        pk: string
+            The primary key of the video
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            HttpResponse carrying the AWS S3 upload policy as a JSON object.
+
+        """
+        now = timezone.now()
+        stamp = to_timestamp(now)
+
+        video = self.get_object()
+        key = video.get_source_s3_key(stamp=stamp)
+
+        policy = get_s3_upload_policy_signature(
+            now,
+            [
+                {"key": key},
+                ["starts-with", "$Content-Type", "video/"],
+                ["content-length-range", 0, defaults.VIDEO_SOURCE_MAX_SIZE],
+            ],
+        )
+
+        policy.update(
+            {
+                "key": key,
+                "max_file_size": defaults.VIDEO_SOURCE_MAX_SIZE,
+                "stamp": stamp,
+            }
+        )
+
+        # Reset the upload state of the video
+        Video.objects.filter(pk=pk).update(upload_state=defaults.PENDING)
+        invalidate_app_data(Video, pk)
+
+        return Response(policy)
+
+
+class DocumentViewSet(
+    UploadStatusMixin,
+    mixins.RetrieveModelMixin,
+    mixins.UpdateModelMixin,
+    viewsets.GenericViewSet,
+):
+    """Viewset for the API of the Document object."""
+
+    queryset = Document.objects.select_related("playlist")
+    serializer_class = serializers.DocumentSerializer
+    permission_classes = [
+        permissions.IsResourceAdmin | permissions.IsResourceInstructor
+    ]
+
+    @action(methods=["post"], detail=True, url_path="initiate-upload")
+    # pylint: disable=unused-argument
+    def initate_upload(self, request, pk=None):
+        """Get an upload policy for a file.
+
+        Calling the endpoint resets the upload state to `pending` and returns an upload policy to
+        our AWS S3 source bucket.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint
+        pk: string
+            The primary key of the Document instance
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            HttpResponse carrying the AWS S3 upload policy as a JSON object.
+
+        """
+        serializer = serializers.InitiateUploadSerializer(data=request.data)
+
+        if serializer.is_valid() is not True:
+            return Response(serializer.errors, status=400)
+
+        now = timezone.now()
+        stamp = to_timestamp(now)
+
+        extension = splitext(serializer.validated_data["filename"])[
+            1
+        ] or guess_extension(serializer.validated_data["mimetype"])
+
+        document = self.get_object()
+        key = document.get_source_s3_key(stamp=stamp, extension=extension)
+
+        policy = get_s3_upload_policy_signature(
+            now,
+            [
+                {"key": key},
+                ["content-length-range", 0, defaults.DOCUMENT_SOURCE_MAX_SIZE],
+            ],
+        )
+
+        policy.update(
+            {
+                "key": key,
+                "max_file_size": defaults.DOCUMENT_SOURCE_MAX_SIZE,
+                "stamp": stamp,
+            }
+        )
+
+        # Reset the upload state of the document
+        Document.objects.filter(pk=pk).update(upload_state=defaults.PENDING)
+        invalidate_app_data(Document, pk)
+
+        return Response(policy)
+
+
+class InitiateUploadMixin:
+    """Build upload policies for the objects related to the video of the JWT token.
+
+    Viewsets using this mixin must define the maximum size of the uploaded files and the
+    conditions imposed on them on top of their key and their size.
+    """
+
+    upload_max_size = None
+    upload_conditions = []
+
+    def get_upload_policy(self, obj, now):
+        """Get an upload policy for an object to our AWS S3 source bucket.
+
+        Parameters
+        ----------
+        obj : Type[models.Model]
+            The object for which a file is uploaded
+        now : Type[datetime.datetime]
+            The date and time at which the upload is initiated
+
+        Returns
+        -------
+        Dictionary
+            The AWS S3 upload policy
+
+        """
+        stamp = to_timestamp(now)
+        key = obj.get_source_s3_key(stamp=stamp)
+
+        policy = get_s3_upload_policy_signature(
+            now,
+            [
+                {"key": key},
+                *self.upload_conditions,
+                ["content-length-range", 0, self.upload_max_size],
+            ],
+        )
+
+        policy.update(
+            {"key": key, "max_file_size": self.upload_max_size, "stamp": stamp}
+        )
+        return policy
+
+    @action(methods=["post"], detail=False, url_path="bulk-initiate-upload")
+    def bulk_initiate_upload(self, request):
+        """Get upload policies for several objects related to the same video.
+
+        Calling the endpoint resets the upload state of all the objects to `pending` at once
+        and returns an upload policy to our AWS S3 source bucket for each of them.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint, it should contain a payload with the list of the
+            primary keys of the objects in an "ids" field
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            HttpResponse carrying the AWS S3 upload policy of each object as a JSON object
+            indexed by primary key.
+
+        """
+        serializer = serializers.BulkInitiateUploadSerializer(data=request.data)
+
+        if serializer.is_valid() is not True:
+            return Response(serializer.errors, status=400)
+
+        ids = set(serializer.validated_data["ids"])
+        # The queryset is restricted to the objects of the video in the JWT token
+        objects = list(self.get_queryset().filter(pk__in=ids))
+        missing_ids = ids - {obj.pk for obj in objects}
+        if missing_ids:
+            return Response(
+                {
+                    "detail": "Not found.",
+                    "ids": sorted(str(missing_id) for missing_id in missing_ids),
+                },
+                status=404,
+            )
+
+        now = timezone.now()
+        policies = {str(obj.pk): self.get_upload_policy(obj, now) for obj in objects}
+
+        # Reset the upload state of all the objects
+        self.get_queryset().model.objects.filter(pk__in=ids).update(
+            upload_state=defaults.PENDING
+        )
+        invalidate_app_data(Video, request.user.id)
+
+        return Response(policies)
+
+
+class TimedTextTrackViewSet(
+    InitiateUploadMixin,
+    UploadStatusMixin,
+    mixins.CreateModelMixin,
+    mixins.DestroyModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.UpdateModelMixin,
+    viewsets.GenericViewSet,
+):
+    """Viewset for the API of the TimedTextTrack object."""
+
+    serializer_class = serializers.TimedTextTrackSerializer
+    status_resource_field = "video_id"
+    upload_max_size = defaults.SUBTITLE_SOURCE_MAX_SIZE
+
+    def get_permissions(self):
+        """Instantiate and return the list of permissions that this view requires."""
+        if self.action == "metadata":
+            permission_classes = [permissions.IsVideoToken]
+        else:
+            permission_classes = [
+                permissions.IsVideoRelatedAdmin | permissions.IsVideoRelatedInstructor
+            ]
+        return [permission() for permission in permission_classes]
+
+    def get_queryset(self):
+        """Restrict list access to timed text tracks related to the video in the JWT token."""
+        user = self.request.user
+        if isinstance(user, TokenUser):
+            return TimedTextTrack.objects.filter(video__id=user.id)
+        return TimedTextTrack.objects.none()
+
+    @action(methods=["post"], detail=True, url_path="initiate-upload")
+    # pylint: disable=unused-argument
+    def initiate_upload(self, request, pk=None):
+        """Get an upload policy for a timed text track.
+
+        Calling the endpoint resets the upload state to `pending` and returns an upload policy to
+        our AWS S3 source bucket.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint
+        pk: string
+            The primary key of the timed text track
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            HttpResponse carrying the AWS S3 upload policy as a JSON object.
+
+        """
+        timed_text_track = self.get_object()
+        policy = self.get_upload_policy(timed_text_track, timezone.now())
+
+        # Reset the upload state of the timed text track
+        TimedTextTrack.objects.filter(pk=pk).update(upload_state=defaults.PENDING)
+        invalidate_app_data(Video, timed_text_track.video_id)
+
+        return Response(policy)
+
+
+class ThumbnailViewSet(
+    InitiateUploadMixin,
+    UploadStatusMixin,
+    mixins.CreateModelMixin,
+    mixins.DestroyModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    """Viewset for the API of the Thumbnail object."""
+
+    permission_classes = [
+        permissions.IsVideoRelatedInstructor | permissions.IsVideoRelatedAdmin
+    ]
+    serializer_class = serializers.ThumbnailSerializer
+    status_resource_field = "video_id"
+    upload_max_size = defaults.THUMBNAIL_SOURCE_MAX_SIZE
+    upload_conditions = [["starts-with", "$Content-Type", "image/"]]
+
+    def get_queryset(self):
+        """Restrict list access to thumbnail related to the video in the JWT token."""
+        user = self.request.user
+        if isinstance(user, TokenUser):
+            return Thumbnail.objects.filter(video__id=user.id)
+        return Thumbnail.objects.none()
+
+    @action(methods=["post"], detail=True, url_path="initiate-upload")
+    # pylint: disable=unused-argument
+    def initiate_upload(self, request, pk=None):
+        """Get an upload policy for a thumbnail.
+
+        Calling the endpoint resets the upload state to `pending` and returns an upload policy to
+        our AWS S3 source bucket.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint
+        pk: string
+            The primary key of the thumbnail
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            HttpResponse carrying the AWS S3 upload policy as a JSON object.
+
+        """
+        thumbnail = self.get_object()
+        policy = self.get_upload_policy(thumbnail, timezone.now())
+
+        # Reset the upload state of the thumbnail
+        Thumbnail.objects.filter(pk=pk).update(upload_state=defaults.PENDING)
+        invalidate_app_data(Video, thumbnail.video_id)
+
+        return Response(policy)
+
+
+class XAPIStatementView(APIView):
+    """Viewset managing xAPI requests."""
+
+    permission_classes = [permissions.IsVideoToken]
+    http_method_names = ["post"]
+
+    def get_xapi_context(self, user):
+        """Get the xAPI context of the video targeted by the JWT token.
+
+        Parameters
+        ----------
+        user : Type[rest_framework_simplejwt.models.TokenUser]
+            The user authenticated with the JWT token
+
+        Returns
+        -------
+        tuple
+            The xAPI context of the video (see `xapi.get_xapi_context`), or None and the
+            response to return if the video does not exist or if the LRS of its consumer site
+            is not configured
+
+        """
+        try:
+            xapi_context = get_xapi_context(user.id)
+        except Video.DoesNotExist:
+            return (
+                None,
+                Response(
+                    {"reason": "video with id {id} does not exist".format(id=user.id)},
+                    status=404,
+                ),
+            )
+
+        if not xapi_context["lrs_url"] or not xapi_context["lrs_auth_token"]:
+            return (
+                None,
+                Response(
+                    {"reason": "LRS is not configured. This endpoint is not usable."},
+                    status=501,
+                ),
+            )
+
+        return xapi_context, None
+
+    def post(self, request):
+        """Send a xAPI statement to a defined LRS.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint.
+            It contains a JSON representing part of the xAPI statement
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            HttpResponse to reflect if the XAPI request failed or is successful
+
+        """
+        user = request.user
+        lti_user = LTIUser(user)
+        xapi_context, error_response = self.get_xapi_context(user)
+        if xapi_context is None:
+            return error_response
+
+        xapi_statement = serializers.XAPIStatementSerializer(data=request.data)
+
+        if not xapi_statement.is_valid():
+            return Response(xapi_statement.errors, status=400)
+
+        return self._send_statement(
+            xapi_context, xapi_statement.validated_data, lti_user
+        )
+
+    @staticmethod
+    def _send_statement(xapi_context, statement, lti_user):
+        """Send a valid statement to the LRS, or to the outbox, and build the response."""
+        xapi = XAPI(
+            xapi_context["lrs_url"],
+            xapi_context["lrs_auth_token"],
+            xapi_context["lrs_xapi_version"],
+        )
+
+        try:
+            if xapi_context["lrs_outbox_active"]:
+                xapi.enqueue(xapi_context, statement, lti_user)
+                return Response(status=202)
+
+            xapi.send(xapi_context, statement, lti_user)
+        # pylint: disable=invalid-name
+        except requests.exceptions.HTTPError as e:
+            message = "Impossible to send xAPI request to LRS."
+            logger.critical(
+                message,
+                extra={"response": e.response.text, "status": e.response.status_code},
+            )
+            return Response({"status": message}, status=501)
+        except requests.exceptions.RequestException:
+            message = "Impossible to reach the LRS."
+            logger.critical(message, exc_info=True)
+            return Response({"status": message}, status=501)
+        # pylint: disable=invalid-name
+        except MissingUserIdError:
+            return Response({"status": "Impossible to identify the actor."}, status=400)
+
+        return Response(status=204)
+
+
+class XAPIStatementBulkView(XAPIStatementView):
+    """Viewset managing xAPI requests sending several statements for the same video."""
+
+    def post(self, request):
+        """Send a list of xAPI statements related to the same video to a defined LRS.
+
+        Valid statements are sent to the LRS in one request, or stored in the outbox if the
+        consumer site sends its statements asynchronously. Invalid statements are ignored.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint.
+            It contains a JSON list, each item representing part of an xAPI statement
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            HttpResponse with the result of each statement, in the order of the request:
+            a "status" (204 if sent, 202 if stored in the outbox, 400 if invalid or 501 if
+            the LRS failed) and the "errors" of invalid statements.
+
+        """
+        if not isinstance(request.data, list):
+            return Response({"reason": "A list of statements is expected."}, status=400)
+        if len(request.data) > settings.XAPI_BULK_MAX_STATEMENTS:
+            return Response(
+                {
+                    "reason": "Too many statements, the maximum is {:d}.".format(
+                        settings.XAPI_BULK_MAX_STATEMENTS
+                    )
+                },
+                status=400,
+            )
+
+        user = request.user
+        lti_user = LTIUser(user)
+        xapi_context, error_response = self.get_xapi_context(user)
+        if xapi_context is None:
+            return error_response
+
+        xapi_statements = serializers.XAPIStatementSerializer(
+            data=request.data, many=True
+        )
+        if xapi_statements.is_valid():
+            errors = [{}] * len(request.data)
+            statements = xapi_statements.validated_data
+        else:
+            # Only keep the statements that passed validation
+            errors = xapi_statements.errors
+            statements = [
+                xapi_statements.child.run_validation(item)
+                for item, item_errors in zip(request.data, errors)
+                if not item_errors
+            ]
+
+        xapi = XAPI(
+            xapi_context["lrs_url"],
+            xapi_context["lrs_auth_token"],
+            xapi_context["lrs_xapi_version"],
+        )
+
+        status = 204
+        try:
+            if statements:
+                if xapi_context["lrs_outbox_active"]:
+                    xapi.enqueue_many(xapi_context, statements, lti_user)
+                    status = 202
+                else:
+                    xapi.send_many(xapi_context, statements, lti_user)
+        except requests.exceptions.RequestException:
+            logger.critical("Impossible to send xAPI request to LRS.", exc_info=True)
+            status = 501
+        # pylint: disable=invalid-name
+        except MissingUserIdError:
+            return Response({"status": "Impossible to identify the actor."}, status=400)
+
+        return Response(
+            [
+                {"status": 400, "errors": item_errors}
+                if item_errors
+                else {"status": status}
+                for item_errors in errors
+            ]
+        )
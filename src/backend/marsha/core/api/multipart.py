@@ -0,0 +1,254 @@
+"""Upload the source of a video to our AWS S3 source bucket in several parts."""
+import logging
+
+from django.utils import timezone
+
+from botocore.exceptions import ClientError
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .. import defaults, serializers
+from ..models import Video
+from ..utils import s3_utils
+from ..utils.cache_utils import invalidate_app_data
+from ..utils.time_utils import to_timestamp
+
+
+logger = logging.getLogger(__name__)
+
+
+class MultipartUploadMixin:
+    """Add the endpoints of a multipart upload of its source to the viewset of videos.
+
+    Large videos can be uploaded in parts, in parallel, and an interrupted upload can be
+    resumed by only sending the missing parts.
+    """
+
+    @action(methods=["post"], detail=True, url_path="initiate-multipart-upload")
+    # pylint: disable=unused-argument
+    def initiate_multipart_upload(self, request, pk=None):
+        """Start a multipart upload of a video source to our AWS S3 source bucket.
+
+        Large videos can be uploaded in parts, in parallel, and an interrupted upload can be
+        resumed by only sending the missing parts. Calling the endpoint resets the upload
+        state to `pending`.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint
+        pk: string
+            The primary key of the video
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            HttpResponse carrying the id of the multipart upload and the stamp identifying it
+            in the other multipart upload endpoints, as a JSON object.
+
+        """
+        serializer = serializers.InitiateMultipartUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        stamp = to_timestamp(timezone.now())
+        video = self.get_object()
+        key = video.get_source_s3_key(stamp=stamp)
+
+        try:
+            upload_id = s3_utils.create_multipart_upload(
+                key, serializer.validated_data["mimetype"]
+            )
+        except ClientError as error:
+            return self._get_s3_error_response(error)
+
+        # Reset the upload state of the video
+        Video.objects.filter(pk=pk).update(upload_state=defaults.PENDING)
+        invalidate_app_data(Video, pk)
+
+        return Response(
+            {
+                "key": key,
+                "max_file_size": defaults.VIDEO_SOURCE_MULTIPART_MAX_SIZE,
+                "part_size": defaults.VIDEO_MULTIPART_PART_SIZE,
+                "stamp": stamp,
+                "upload_id": upload_id,
+            }
+        )
+
+    @action(methods=["post"], detail=True, url_path="presign-multipart-upload-parts")
+    # pylint: disable=unused-argument
+    def presign_multipart_upload_parts(self, request, pk=None):
+        """Get the urls to which the parts of a multipart upload should be sent with PUT.
+
+        The urls are presigned by batches of at most `MULTIPART_UPLOAD_MAX_PART_URLS` parts,
+        without any request to AWS. The part numbers are limited so the parts can't exceed
+        `VIDEO_SOURCE_MULTIPART_MAX_SIZE` at the expected part size.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint
+        pk: string
+            The primary key of the video
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            HttpResponse carrying the presigned url of each part, indexed by part number.
+
+        """
+        serializer = serializers.PresignMultipartUploadPartsSerializer(
+            data=request.data
+        )
+        serializer.is_valid(raise_exception=True)
+
+        max_parts = -(
+            -defaults.VIDEO_SOURCE_MULTIPART_MAX_SIZE
+            // defaults.VIDEO_MULTIPART_PART_SIZE
+        )
+        part_numbers = serializer.validated_data["part_numbers"]
+        if max(part_numbers) > max_parts:
+            return Response(
+                {"part_numbers": ["Part numbers can't exceed {:d}.".format(max_parts)]},
+                status=400,
+            )
+
+        key = self.get_object().get_source_s3_key(
+            stamp=serializer.validated_data["stamp"]
+        )
+        return Response(
+            {
+                "urls": s3_utils.get_multipart_upload_part_urls(
+                    key, serializer.validated_data["upload_id"], part_numbers
+                )
+            }
+        )
+
+    @action(methods=["post"], detail=True, url_path="list-multipart-upload-parts")
+    # pylint: disable=unused-argument
+    def list_multipart_upload_parts(self, request, pk=None):
+        """List the parts already uploaded to resume an interrupted multipart upload.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint
+        pk: string
+            The primary key of the video
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            HttpResponse carrying the number, the ETag and the size of each uploaded part.
+
+        """
+        serializer = serializers.MultipartUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        key = self.get_object().get_source_s3_key(
+            stamp=serializer.validated_data["stamp"]
+        )
+        try:
+            parts = s3_utils.list_multipart_upload_parts(
+                key, serializer.validated_data["upload_id"]
+            )
+        except ClientError as error:
+            return self._get_s3_error_response(error)
+
+        return Response({"parts": parts})
+
+    @action(methods=["post"], detail=True, url_path="complete-multipart-upload")
+    # pylint: disable=unused-argument
+    def complete_multipart_upload(self, request, pk=None):
+        """Assemble the uploaded parts into the video source.
+
+        The multipart upload is aborted if its parts exceed `VIDEO_SOURCE_MULTIPART_MAX_SIZE`
+        since the size of each part can't be limited by a presigned url.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint
+        pk: string
+            The primary key of the video
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            HttpResponse carrying the key of the video source as a JSON object.
+
+        """
+        serializer = serializers.CompleteMultipartUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        key = self.get_object().get_source_s3_key(
+            stamp=serializer.validated_data["stamp"]
+        )
+        upload_id = serializer.validated_data["upload_id"]
+        part_numbers = {
+            part["part_number"] for part in serializer.validated_data["parts"]
+        }
+        try:
+            size = sum(
+                part["size"]
+                for part in s3_utils.list_multipart_upload_parts(key, upload_id)
+                if part["part_number"] in part_numbers
+            )
+            if size > defaults.VIDEO_SOURCE_MULTIPART_MAX_SIZE:
+                s3_utils.abort_multipart_upload(key, upload_id)
+                return Response(
+                    {
+                        "detail": "The video can't exceed {:d} bytes.".format(
+                            defaults.VIDEO_SOURCE_MULTIPART_MAX_SIZE
+                        )
+                    },
+                    status=400,
+                )
+            s3_utils.complete_multipart_upload(
+                key, upload_id, serializer.validated_data["parts"]
+            )
+        except ClientError as error:
+            return self._get_s3_error_response(error)
+
+        return Response({"key": key})
+
+    @action(methods=["post"], detail=True, url_path="abort-multipart-upload")
+    # pylint: disable=unused-argument
+    def abort_multipart_upload(self, request, pk=None):
+        """Abort a multipart upload and free the storage used by its parts.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint
+        pk: string
+            The primary key of the video
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            An empty HttpResponse with a 204 status.
+
+        """
+        serializer = serializers.MultipartUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        key = self.get_object().get_source_s3_key(
+            stamp=serializer.validated_data["stamp"]
+        )
+        try:
+            s3_utils.abort_multipart_upload(key, serializer.validated_data["upload_id"])
+        except ClientError as error:
+            return self._get_s3_error_response(error)
+
+        return Response(status=204)
+
+    @staticmethod
+    def _get_s3_error_response(error):
+        """Build the response forwarding an error returned by AWS S3 to the client."""
+        code = error.response.get("Error", {}).get("Code")
+        logger.warning("Multipart upload error from AWS S3: %s", error)
+        return Response(
+            {"detail": error.response.get("Error", {}).get("Message"), "code": code},
+            status=404 if code == "NoSuchUpload" else 400,
+        )
@@ -0,0 +1,64 @@
+"""Serve the upload status of the objects of the API to clients polling it."""
+from django.utils.http import parse_etags, quote_etag
+
+from rest_framework import generics
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from ..utils.time_utils import to_timestamp
+
+
+class UploadStatusMixin:
+    """Serve the upload status of an object without serializing it.
+
+    Viewsets using this mixin can set the field of their model matching the resource of the
+    JWT token if it is not the id of the object.
+    """
+
+    status_resource_field = "id"
+
+    @action(methods=["get"], detail=True, url_path="status")
+    # pylint: disable=unused-argument
+    def status(self, request, pk=None):
+        """Get the upload status of an object for clients polling it.
+
+        Only the columns needed are read, in one query on the primary key of the object and
+        the resource of the JWT token. The response carries an ETag: a client sending it back
+        in an If-None-Match header gets a 304 response while the status is unchanged.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint
+        pk: string
+            The primary key of the object
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            HttpResponse carrying the upload state, the active stamp and whether the object
+            is ready to show, as a JSON object.
+
+        """
+        model = self.get_queryset().model
+        upload_status = generics.get_object_or_404(
+            model.objects.values("upload_state", "uploaded_on"),
+            **{"pk": pk, self.status_resource_field: request.user.id},
+        )
+
+        active_stamp = to_timestamp(upload_status["uploaded_on"])
+        etag = quote_etag(
+            "{:s}-{:s}".format(upload_status["upload_state"], active_stamp or "")
+        )
+        if_none_match = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            return Response(status=304, headers={"ETag": etag})
+
+        return Response(
+            {
+                "active_stamp": active_stamp,
+                "is_ready_to_show": upload_status["uploaded_on"] is not None,
+                "upload_state": upload_status["upload_state"],
+            },
+            headers={"ETag": etag},
+        )
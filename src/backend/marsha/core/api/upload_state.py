@@ -0,0 +1,399 @@
+"""Update the upload state of the objects of the API and notify their clients.
+
+The state updates are sent by our AWS lambdas when a file is uploaded to the source bucket
+and when it is processed.
+"""
+from collections import defaultdict
+import logging
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .. import defaults, permissions, serializers
+from ..models import Document, Video
+from ..notifications import get_broker, notify_upload_state
+from ..utils.cache_utils import invalidate_app_data
+from ..utils.signature_utils import get_update_state_verifier
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_signature_valid(msg, signature):
+    """Check if a message was signed with any of the secrets shared with our AWS lambdas.
+
+    We need to do this to support 2 or more versions of our infrastructure at the same time.
+    It then enables us to do updates and change the secret without incurring downtime.
+
+    Parameters
+    ----------
+    msg : string
+        The signed message
+    signature : string
+        The hexadecimal HMAC-SHA256 signature of the message
+
+    Returns
+    -------
+    boolean
+        True if the signature is valid against any secret in our list
+
+    """
+    generation = get_update_state_verifier().verify(msg, signature)
+    if generation is None:
+        return False
+    logger.debug("State update signed with secret generation %d", generation)
+    return True
+
+
+def get_update_state_parameters(model, state, key_elements):
+    """Return the fields to update on the object targeted by a state update.
+
+    Parameters
+    ----------
+    model : Type[django.db.models.Model]
+        The model of the object targeted by the key
+    state : string
+        The new upload state
+    key_elements : Dictionary
+        The elements parsed from the key by the `UpdateStateSerializer`
+
+    Returns
+    -------
+    Dictionary
+        The values to update, indexed by field name
+
+    """
+    update_parameters = {"upload_state": state}
+    # Only update `uploaded_on` if the upload was actually successful
+    if state == defaults.READY:
+        update_parameters["uploaded_on"] = key_elements["uploaded_on"]
+        if hasattr(model, "extension"):
+            update_parameters["extension"] = key_elements.get("extension")
+    return update_parameters
+
+
+@api_view(["POST"])
+def update_state(request):
+    """View handling AWS POST request to update the state of an object by key.
+
+    The update is only applied if it can follow the current state of the object and is not
+    older than its active version (see `UploadStateMixin`), so a late or retried request
+    is acknowledged without modifying the object.
+
+    Parameters
+    ----------
+    request : Type[django.http.request.HttpRequest]
+        The request on the API endpoint, it should contain a payload with the following fields:
+            - key: the key of an object in the source bucket as delivered in the upload policy,
+            - state: state of the upload, should be either "ready" or "error",
+            - signature: has of the payload salted with a shared secret to authenticate AWS.
+
+    Returns
+    -------
+    Type[rest_framework.response.Response]
+        HttpResponse acknowledging the success or failure of the state update operation and
+        whether it was applied or ignored.
+
+    """
+    serializer = serializers.UpdateStateSerializer(data=request.data)
+
+    if serializer.is_valid() is not True:
+        return Response(serializer.errors, status=400)
+
+    # The signed message is the s3 object key
+    if not is_signature_valid(
+        serializer.validated_data["key"], serializer.validated_data["signature"]
+    ):
+        return Response("Forbidden", status=403)
+
+    # Retrieve the elements from the key
+    key_elements = serializer.get_key_elements()
+
+    # Update the object targeted by the "object_id" and "resource_id"
+    model = apps.get_model(app_label="core", model_name=key_elements["model_name"])
+    state = serializer.validated_data["state"]
+
+    # Compare-and-set: the current state of the object is checked by the update query
+    updated = model.objects.filter(
+        model.get_upload_state_filter(state, key_elements["uploaded_on"]),
+        id=key_elements["object_id"],
+    ).update(**get_update_state_parameters(model, state, key_elements))
+
+    if updated:
+        # Timed text tracks and thumbnails are served along with their video
+        invalidate_app_data(
+            Document if model is Document else Video, key_elements["resource_id"]
+        )
+        notify_upload_state(
+            key_elements["resource_id"],
+            key_elements["model_name"],
+            key_elements["object_id"],
+            state,
+            key_elements["uploaded_on"] if state == defaults.READY else None,
+        )
+        return Response({"success": True, "applied": True})
+
+    if model.objects.filter(id=key_elements["object_id"]).exists():
+        return Response({"success": True, "applied": False})
+
+    return Response({"success": False}, status=404)
+
+
+def _validate_state_updates(items):
+    """Verify the items of a bulk state update and group the valid ones by object.
+
+    Parameters
+    ----------
+    items : list
+        The items of the request, with the fields expected by the `update_state` view
+
+    Returns
+    -------
+    tuple
+        The list of the results of the items, in the order of the request, `None` for the
+        valid items, and the valid items targeting each object, indexed by model and id
+
+    """
+    results = [None] * len(items)
+    updates = defaultdict(list)
+    for index, item in enumerate(items):
+        serializer = serializers.UpdateStateSerializer(data=item)
+        if not serializer.is_valid():
+            results[index] = {"status": 400, "errors": serializer.errors}
+            continue
+
+        if not is_signature_valid(
+            serializer.validated_data["key"], serializer.validated_data["signature"]
+        ):
+            results[index] = {"status": 403, "success": False}
+            continue
+
+        key_elements = serializer.get_key_elements()
+        model = apps.get_model(app_label="core", model_name=key_elements["model_name"])
+        state = serializer.validated_data["state"]
+        updates[(model, key_elements["object_id"])].append(
+            {
+                "index": index,
+                "model_name": key_elements["model_name"],
+                "resource_id": key_elements["resource_id"],
+                "state": state,
+                "stamped_on": key_elements["uploaded_on"],
+                "parameters": get_update_state_parameters(model, state, key_elements),
+            }
+        )
+    return results, updates
+
+
+def _lock_upload_states(model, ids):
+    """Lock objects until the end of the transaction and return their upload state.
+
+    Returns
+    -------
+    dictionary
+        The upload state and the active stamp of each object found, indexed by id
+
+    """
+    return {
+        str(pk): (upload_state, uploaded_on)
+        for pk, upload_state, uploaded_on in model.objects.select_for_update()
+        .filter(id__in=ids)
+        .values_list("id", "upload_state", "uploaded_on")
+    }
+
+
+def _get_applied_updates(model, current_state, object_updates, results):
+    """Decide which of the updates targeting an object are applied, in the order received.
+
+    Each update is applied only if it can follow the state left by the previous ones. The
+    result of each update is stored in `results`.
+
+    Returns
+    -------
+    list
+        The updates applied to the object
+
+    """
+    upload_state, uploaded_on = current_state
+    applied_updates = []
+    for update in object_updates:
+        applied = model.is_upload_state_update_allowed(
+            upload_state, uploaded_on, update["state"], update["stamped_on"]
+        )
+        results[update["index"]] = {"status": 200, "success": True, "applied": applied}
+        if applied:
+            applied_updates.append(update)
+            upload_state = update["state"]
+            uploaded_on = update["parameters"].get("uploaded_on", uploaded_on)
+    return applied_updates
+
+
+def _apply_state_updates(model, ids, updates, results):
+    """Lock the objects of a model and apply the updates targeting them.
+
+    The objects ending in the same state are updated in one query.
+
+    Returns
+    -------
+    list
+        The model, the object id and the update of each update applied
+
+    """
+    current_states = _lock_upload_states(model, ids)
+
+    groups = defaultdict(list)
+    applied_updates = []
+    for object_id in ids:
+        if object_id not in current_states:
+            for update in updates[(model, object_id)]:
+                results[update["index"]] = {"status": 404, "success": False}
+            continue
+
+        object_updates = _get_applied_updates(
+            model, current_states[object_id], updates[(model, object_id)], results
+        )
+        if object_updates:
+            last_update = object_updates[-1]
+            groups[
+                (
+                    last_update["state"],
+                    last_update["stamped_on"],
+                    tuple(sorted(last_update["parameters"].items())),
+                )
+            ].append(object_id)
+            applied_updates.extend(
+                (model, object_id, update) for update in object_updates
+            )
+
+    # The objects are locked but their state is checked again by the update query on
+    # databases that don't support locks
+    for (state, stamped_on, parameters), group_ids in groups.items():
+        model.objects.filter(
+            model.get_upload_state_filter(state, stamped_on), id__in=group_ids
+        ).update(**dict(parameters))
+
+    return applied_updates
+
+
+@api_view(["POST"])
+def update_state_bulk(request):
+    """View handling AWS POST request to update the state of several objects by key.
+
+    All the items are verified before updating the objects in one transaction, with one
+    query per model to find and lock the objects and one query per set of identical updates.
+    The items targeting the same object are applied in the order of the request, each of
+    them only if it can follow the state left by the previous ones (see `UploadStateMixin`).
+
+    Parameters
+    ----------
+    request : Type[django.http.request.HttpRequest]
+        The request on the API endpoint. It contains a JSON list, each item having the fields
+        expected by the `update_state` view: "key", "state" and "signature".
+
+    Returns
+    -------
+    Type[rest_framework.response.Response]
+        HttpResponse with the result of each item, in the order of the request: a "status"
+        (200 if the object exists, 400 if invalid, 403 if the signature is invalid or 404 if
+        the object does not exist), the "success" of the request, whether the update was
+        "applied" or ignored, and the "errors" of invalid items.
+
+    """
+    if not isinstance(request.data, list):
+        return Response({"reason": "A list of state updates is expected."}, status=400)
+    if len(request.data) > settings.UPDATE_STATE_BULK_MAX_ITEMS:
+        return Response(
+            {
+                "reason": "Too many state updates, the maximum is {:d}.".format(
+                    settings.UPDATE_STATE_BULK_MAX_ITEMS
+                )
+            },
+            status=400,
+        )
+
+    results, updates = _validate_state_updates(request.data)
+
+    objects_ids = defaultdict(list)
+    for model, object_id in updates:
+        objects_ids[model].append(object_id)
+
+    applied_updates = []
+    with transaction.atomic():
+        for model, ids in objects_ids.items():
+            applied_updates.extend(_apply_state_updates(model, ids, updates, results))
+
+    # Timed text tracks and thumbnails are served along with their video
+    for resource_model, resource_id in {
+        (Document if model is Document else Video, update["resource_id"])
+        for model, _object_id, update in applied_updates
+    }:
+        invalidate_app_data(resource_model, resource_id)
+
+    for _model, object_id, update in applied_updates:
+        notify_upload_state(
+            update["resource_id"],
+            update["model_name"],
+            object_id,
+            update["state"],
+            update["parameters"].get("uploaded_on"),
+        )
+
+    return Response(results)
+
+
+class UploadStateEventsView(APIView):
+    """View waiting for the upload state changes of the objects of a resource.
+
+    Instructors of a video or a document can wait for the upload state changes sent by AWS
+    for the resource, its timed text tracks and its thumbnail instead of polling each object.
+    """
+
+    permission_classes = [
+        permissions.IsResourceAdmin | permissions.IsResourceInstructor
+    ]
+    http_method_names = ["get"]
+
+    def get(self, request):
+        """Return the upload state changes of the resource of the JWT token (long-polling).
+
+        Without "since" in the query string, the current version of the resource events is
+        returned at once. With the last version seen by the client as "since", the request
+        waits until new events are published or `UPLOAD_STATE_NOTIFICATIONS_TIMEOUT` expires.
+
+        Parameters
+        ----------
+        request : Type[django.http.request.HttpRequest]
+            The request on the API endpoint
+
+        Returns
+        -------
+        Type[rest_framework.response.Response]
+            HttpResponse carrying the current "version" and the list of the "events" published
+            since the version seen by the client. A version lower than the one seen by the
+            client means the events were reset: the client should reload the objects.
+
+        """
+        since = request.query_params.get("since")
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                since = -1
+            if since < 0:
+                return Response(
+                    {"since": ["A positive integer is required."]}, status=400
+                )
+
+        broker = get_broker()
+        if since is None:
+            version, events = broker.get_events(request.user.id)
+        else:
+            version, events = broker.wait(
+                request.user.id, since, settings.UPLOAD_STATE_NOTIFICATIONS_TIMEOUT
+            )
+
+        return Response({"version": version, "events": events})
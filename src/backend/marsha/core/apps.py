@@ -9,3 +9,8 @@ class CoreConfig(AppConfig):
 
     name = "marsha.core"
     verbose_name = _("Marsha")
+
+    def ready(self):
+        """Register the signal handlers of the app."""
+        # pylint: disable=unused-import,import-outside-toplevel
+        from . import signals  # noqa
@@ -9,11 +9,27 @@ AWS_UPLOAD_EXPIRATION_DELAY = getattr(
 
 DOCUMENT_SOURCE_MAX_SIZE = getattr(settings, "DOCUMENT_SOURCE_MAX_SIZE", 2 ** 30)  # 1GB
 VIDEO_SOURCE_MAX_SIZE = getattr(settings, "VIDEO_SOURCE_MAX_SIZE", 2 ** 30)  # 1GB
+# Videos uploaded in several parts can be larger
+VIDEO_SOURCE_MULTIPART_MAX_SIZE = getattr(
+    settings, "VIDEO_SOURCE_MULTIPART_MAX_SIZE", 20 * (2 ** 30)
+)  # 20GB
+VIDEO_MULTIPART_PART_SIZE = getattr(
+    settings, "VIDEO_MULTIPART_PART_SIZE", 100 * (2 ** 20)
+)  # 100MB
+# Maximum number of part urls that can be presigned in one request
+MULTIPART_UPLOAD_MAX_PART_URLS = getattr(
+    settings, "MULTIPART_UPLOAD_MAX_PART_URLS", 100
+)
 SUBTITLE_SOURCE_MAX_SIZE = getattr(settings, "SUBTITLE_SOURCE_MAX_SIZE", 2 ** 20)  # 1MB
 THUMBNAIL_SOURCE_MAX_SIZE = getattr(
     settings, "THUMBNAIL_SOURCE_MAX_SIZE", 10 * (2 ** 20)
 )  # 10MB
 
+# Maximum number of objects for which upload policies can be requested at once
+BULK_INITIATE_UPLOAD_MAX_OBJECTS = getattr(
+    settings, "BULK_INITIATE_UPLOAD_MAX_OBJECTS", 100
+)
+
 PENDING, PROCESSING, ERROR, READY = "pending", "processing", "error", "ready"
 STATE_CHOICES = (
     (PENDING, _("pending")),
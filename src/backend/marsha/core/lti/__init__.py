@@ -10,6 +10,7 @@ from pylti.common import LTIException, verify_request_common
 
 from ..models import ConsumerSite
 from ..models.account import ADMINISTRATOR, INSTRUCTOR, LTI_ROLES, STUDENT, LTIPassport
+from .utils import get_cached_passport
 
 
 class LTI:
@@ -76,7 +77,7 @@ class LTI:
 
         passport = self.get_passport()
         consumers = {
-            str(passport.oauth_consumer_key): {"secret": str(passport.shared_secret)}
+            passport["oauth_consumer_key"]: {"secret": passport["shared_secret"]}
         }
 
         # The LTI signature is computed using the url of the LTI launch request. But when Marsha
@@ -103,7 +104,7 @@ class LTI:
         ):
             raise LTIException("LTI verification failed.")
 
-        consumer_site = passport.consumer_site or passport.playlist.consumer_site
+        consumer_site = passport["consumer_site"]
 
         # Make sure we only accept requests from domains in which the "top parts" match
         # the URL for the consumer_site associated with the passport.
@@ -165,7 +166,15 @@ class LTI:
             raise AttributeError(name)
 
     def get_passport(self):
-        """Find and return the passport targeted by the LTI request or raise an LTIException."""
+        """Find the passport targeted by the LTI request or raise an LTIException.
+
+        Returns
+        -------
+        dictionary
+            The oauth consumer key, the shared secret and the consumer site of the passport,
+            resolved from the cache if possible (see `get_cached_passport`)
+
+        """
         consumer_key = self.request.POST.get("oauth_consumer_key", None)
 
         try:
@@ -175,9 +184,7 @@ class LTI:
 
         # find a passport related to the oauth consumer key
         try:
-            return LTIPassport.objects.get(
-                oauth_consumer_key=consumer_key, is_enabled=True
-            )
+            return get_cached_passport(consumer_key)
         except LTIPassport.DoesNotExist:
             raise LTIException(
                 "Could not find a valid passport for this oauth consumer key: {:s}.".format(
@@ -349,5 +356,5 @@ class LTIUser:
         """
         try:
             return self.token.payload[name]
-        except MultiValueDictKeyError:
+        except KeyError:
             raise AttributeError(name)
@@ -1,15 +1,180 @@
 """Helpers to create a dedicated resources."""
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS
 from django.db.models import Q
 
 from ..defaults import PENDING, READY
-from ..models import Playlist
+from ..models import ConsumerSite, LTIPassport, Playlist
 
 
 class PortabilityError(Exception):
     """An error raised when trying to access a resource that is not portable."""
 
 
-def get_or_create_resource(model, lti):
+# Fields of the consumer site of a passport that are cached with it, enough for a launch
+PASSPORT_CONSUMER_SITE_FIELDS = ["id", "name", "domain", "video_show_download_default"]
+# Passports can't be invalidated in the other processes if the cache is local to each process
+LOCAL_CACHE_PASSPORT_DURATION = 60
+
+
+def _get_passport_cache_key(consumer_key):
+    """Build the cache key under which a passport is cached."""
+    return "lti_passport|{:s}".format(consumer_key)
+
+
+def get_passport_cache_timeout():
+    """Return the duration (in seconds) for which a passport can be cached.
+
+    A passport disabled in a process must stop working in all the processes shortly, so the
+    duration is capped to `LOCAL_CACHE_PASSPORT_DURATION` when the default cache is not
+    shared by the processes.
+
+    Returns
+    -------
+    integer
+        The cache timeout
+
+    """
+    timeout = settings.LTI_PASSPORT_CACHE_DURATION
+    if isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache):
+        timeout = min(timeout, LOCAL_CACHE_PASSPORT_DURATION)
+    return timeout
+
+
+def get_cached_passport(consumer_key):
+    """Resolve an enabled passport by its oauth consumer key, from the cache if possible.
+
+    Passports almost never change so we cache what is needed to verify an LTI launch request.
+    The cache is invalidated each time a passport, its consumer site or its playlist is saved
+    or deleted (see `invalidate_cached_passports`).
+
+    Only primitive values are cached: the consumer site is rebuilt from the fields needed by
+    a launch and its other fields (e.g. the LRS credentials) are loaded from the database if
+    they are accessed.
+
+    Parameters
+    ----------
+    consumer_key : string
+        The oauth consumer key of the passport
+
+    Raises
+    ------
+    LTIPassport.DoesNotExist
+        Exception raised if there is no enabled passport for this oauth consumer key
+
+    Returns
+    -------
+    dictionary
+        The "oauth_consumer_key", the "shared_secret" and the "consumer_site" of the passport
+
+    """
+    cache_key = _get_passport_cache_key(consumer_key)
+    passport = cache.get(cache_key)
+
+    if passport is None:
+        passport = LTIPassport.objects.select_related(
+            "consumer_site", "playlist__consumer_site"
+        ).get(oauth_consumer_key=consumer_key, is_enabled=True)
+        consumer_site = passport.consumer_site or passport.playlist.consumer_site
+        passport = {
+            "oauth_consumer_key": str(passport.oauth_consumer_key),
+            "shared_secret": str(passport.shared_secret),
+            "consumer_site": {
+                field_name: ConsumerSite._meta.get_field(field_name).value_to_string(
+                    consumer_site
+                )
+                for field_name in PASSPORT_CONSUMER_SITE_FIELDS
+            },
+        }
+        cache.set(cache_key, passport, get_passport_cache_timeout())
+
+    # Fields that are not cached are deferred
+    fields = [
+        field
+        for field in ConsumerSite._meta.concrete_fields
+        if field.name in PASSPORT_CONSUMER_SITE_FIELDS
+    ]
+    return {
+        **passport,
+        "consumer_site": ConsumerSite.from_db(
+            DEFAULT_DB_ALIAS,
+            [field.attname for field in fields],
+            [
+                field.to_python(passport["consumer_site"][field.name])
+                for field in fields
+            ],
+        ),
+    }
+
+
+def invalidate_cached_passports(consumer_keys):
+    """Remove passports from the cache.
+
+    Parameters
+    ----------
+    consumer_keys : Iterable[string]
+        The oauth consumer keys of the passports to remove from the cache
+
+    """
+    cache.delete_many([_get_passport_cache_key(key) for key in consumer_keys])
+
+
+def _get_reachable_from_cache_key(consumer_site_id):
+    """Build the cache key under which the sites portable to a consumer site are cached."""
+    return "consumer_site_reachable_from|{!s}".format(consumer_site_id)
+
+
+def get_reachable_from_ids(consumer_site):
+    """Return the ids of the consumer sites that are automatically portable to a consumer site.
+
+    The result is cached to avoid a subquery through `ConsumerSitePortability` on each LTI
+    launch request. It is invalidated each time a portability link or a consumer site
+    changes (see `invalidate_reachable_from`).
+
+    Parameters
+    ----------
+    consumer_site : Type[models.ConsumerSite]
+        The consumer site from which the LTI launch request comes
+
+    Returns
+    -------
+    list
+        The ids of the consumer sites from which resources are reachable
+
+    """
+    cache_key = _get_reachable_from_cache_key(consumer_site.id)
+    site_ids = cache.get(cache_key)
+
+    if site_ids is None:
+        site_ids = list(
+            ConsumerSite.objects.filter(portable_to=consumer_site).values_list(
+                "id", flat=True
+            )
+        )
+        cache.set(
+            cache_key, site_ids, settings.CONSUMER_SITE_PORTABILITY_CACHE_DURATION
+        )
+
+    return site_ids
+
+
+def invalidate_reachable_from(consumer_site_ids):
+    """Remove from the cache the consumer sites that are portable to consumer sites.
+
+    Parameters
+    ----------
+    consumer_site_ids : Iterable[string|uuid.UUID]
+        The ids of the consumer sites for which reachability must be recomputed
+
+    """
+    cache.delete_many(
+        [_get_reachable_from_cache_key(site_id) for site_id in consumer_site_ids]
+    )
+
+
+def get_or_create_resource(model, lti, queryset=None):
     """Get or Create a resource targeted by a LTI request.
 
     This function is generic and will use the `model` argument to create
@@ -25,6 +190,11 @@ def get_or_create_resource(model, lti):
     model:
         The model we want to get or create.
 
+    queryset:
+        The queryset used to retrieve an existing resource. Defaults to all the objects of
+        the model. Pass a queryset to select or prefetch the relations needed to serialize
+        the resource.
+
     Raises
     ------
     LTIException
@@ -39,16 +209,23 @@ def get_or_create_resource(model, lti):
     filter_kwargs = (
         {} if (lti.is_instructor or lti.is_admin) else {"upload_state": READY}
     )
+    if queryset is None:
+        queryset = model.objects.all()
+
+    site_query = Q(playlist__consumer_site=lti.get_consumer_site()) | Q(
+        playlist__is_portable_to_consumer_site=True, upload_state=READY
+    )
+    reachable_from_ids = get_reachable_from_ids(lti.get_consumer_site())
+    if reachable_from_ids:
+        site_query |= Q(
+            playlist__consumer_site_id__in=reachable_from_ids, upload_state=READY
+        )
+
     try:
-        return model.objects.select_related("playlist").get(
+        return queryset.select_related("playlist").get(
             Q(playlist__lti_id=lti.context_id)
             | Q(playlist__is_portable_to_playlist=True, upload_state=READY),
-            Q(playlist__consumer_site=lti.get_consumer_site())
-            | Q(playlist__is_portable_to_consumer_site=True, upload_state=READY)
-            | Q(
-                playlist__consumer_site__in=lti.get_consumer_site().reachable_from.all(),
-                upload_state=READY,
-            ),
+            site_query,
             pk=lti.resource_id,
             **filter_kwargs,
         )
@@ -0,0 +1,220 @@
+"""Management command to load test the xAPI endpoint against a fake LRS."""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import RequestFactory
+
+from rest_framework_simplejwt.tokens import AccessToken
+from safedelete import HARD_DELETE
+
+from ...api import XAPIStatementView
+from ...models import ConsumerSite, Playlist, Video
+from ...utils.fake_lrs import FakeLRS
+from ...xapi import get_lrs_stats
+
+
+STATEMENT = {
+    "verb": {
+        "id": "http://adlnet.gov/expapi/verbs/played",
+        "display": {"en-US": "played"},
+    },
+    "context": {
+        "extensions": {"https://w3id.org/xapi/video/extensions/session-id": "load-test"}
+    },
+    "result": {"extensions": {"https://w3id.org/xapi/video/extensions/time": 42}},
+    "timestamp": "2019-08-27T10:00:00.000Z",
+}
+
+
+def percentile(values, ratio):
+    """Return the value below which a ratio of the sorted values fall (nearest rank)."""
+    if not values:
+        return 0
+    return values[min(len(values) - 1, max(0, int(round(ratio * len(values))) - 1))]
+
+
+class Command(BaseCommand):
+    """Send xAPI statements to the xAPI endpoint at a given rate and report how it copes.
+
+    A consumer site, a playlist and a video are created for the duration of the test. The LRS
+    of the consumer site is a fake LRS running in this process, so no network access is
+    required. The statements are posted by a pool of workers directly to the view, which
+    includes the JWT authentication, the validation of the statement and the call to the LRS.
+    """
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        """Add the arguments of the command."""
+        parser.add_argument(
+            "--statements", type=int, default=1000, help="Number of statements to send."
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=0,
+            help="Number of statements to send per second (0 to send them as fast as possible).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=10,
+            help="Number of concurrent workers sending statements.",
+        )
+        parser.add_argument(
+            "--lrs-latency",
+            type=float,
+            default=0.05,
+            help="Number of seconds the fake LRS waits before answering each request.",
+        )
+        parser.add_argument(
+            "--lrs-error-rate",
+            type=float,
+            default=0,
+            help="Ratio of the requests answered with a 503 error by the fake LRS.",
+        )
+        parser.add_argument(
+            "--outbox",
+            action="store_true",
+            help="Store the statements in the outbox instead of sending them to the LRS.",
+        )
+
+    def handle(self, *args, **options):
+        """Run the load test and print its report."""
+        if options["statements"] < 1 or options["workers"] < 1:
+            raise CommandError("At least one statement and one worker are required.")
+
+        with FakeLRS(
+            latency=options["lrs_latency"], error_rate=options["lrs_error_rate"]
+        ) as lrs:
+            consumer_site = ConsumerSite.objects.create(
+                name="xAPI load test",
+                domain="load-test.marsha.local",
+                lrs_url=lrs.url,
+                lrs_auth_token="Basic bG9hZDp0ZXN0",
+                lrs_outbox_active=options["outbox"],
+            )
+            playlist = Playlist.objects.create(
+                title="xAPI load test",
+                consumer_site=consumer_site,
+                lti_id="xapi-load-test",
+            )
+            video = Video.objects.create(
+                title="xAPI load test", playlist=playlist, lti_id="xapi-load-test"
+            )
+            try:
+                results, elapsed = self._run(video, options)
+            finally:
+                # Deleting the consumer site also deletes its statements in the outbox
+                for instance in [video, playlist, consumer_site]:
+                    instance.delete(force_policy=HARD_DELETE)
+
+            self._report(results, elapsed, options, lrs)
+
+    @staticmethod
+    def _get_sender(video):
+        """Return a function posting a statement about a video and timing the request."""
+        jwt_token = AccessToken()
+        jwt_token.payload["resource_id"] = str(video.id)
+        jwt_token.payload["roles"] = ["student"]
+        jwt_token.payload["user_id"] = "load-test"
+        jwt_token.payload["course"] = {
+            "school_name": None,
+            "course_name": None,
+            "course_run": None,
+        }
+        authorization = "Bearer {!s}".format(jwt_token)
+        data = json.dumps(STATEMENT)
+        request_factory = RequestFactory()
+        view = XAPIStatementView.as_view()
+
+        def send(scheduled_at):
+            started_at = time.monotonic()
+            response = view(
+                request_factory.post(
+                    "/xapi/",
+                    data=data,
+                    content_type="application/json",
+                    HTTP_AUTHORIZATION=authorization,
+                )
+            )
+            ended_at = time.monotonic()
+            # Release the database connection of the worker like at the end of a request
+            close_old_connections()
+            return {
+                "status": response.status_code,
+                "lag": started_at - scheduled_at,
+                "latency": ended_at - started_at,
+            }
+
+        return send
+
+    def _run(self, video, options):
+        """Send the statements and return the result of each request and the duration."""
+        send = self._get_sender(video)
+        interval = 1 / options["rate"] if options["rate"] else 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            start = time.monotonic()
+            futures = []
+            for index in range(options["statements"]):
+                scheduled_at = start + index * interval
+                delay = scheduled_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(executor.submit(send, max(scheduled_at, start)))
+            results = [future.result() for future in futures]
+            elapsed = time.monotonic() - start
+
+        return results, elapsed
+
+    def _report(self, results, elapsed, options, lrs):
+        """Print throughput, latency percentiles and saturation of the workers."""
+        latencies = sorted(result["latency"] for result in results)
+        lags = sorted(result["lag"] for result in results)
+        statuses = Counter(result["status"] for result in results)
+        busy = sum(latencies) / (elapsed * options["workers"])
+
+        lines = [
+            "Statements sent: {:d} in {:.2f}s with {:d} worker(s)".format(
+                len(results), elapsed, options["workers"]
+            ),
+            "Throughput: {:.1f} statements/s (target: {:s})".format(
+                len(results) / elapsed,
+                "{:.1f}/s".format(options["rate"]) if options["rate"] else "unbounded",
+            ),
+            "Responses: {:s}".format(
+                ", ".join(
+                    "{:d}: {:d}".format(status, count)
+                    for status, count in sorted(statuses.items())
+                )
+            ),
+            "Latency (ms): p50 {:.1f}, p90 {:.1f}, p99 {:.1f}, max {:.1f}".format(
+                *(
+                    1000 * value
+                    for value in [
+                        percentile(latencies, 0.5),
+                        percentile(latencies, 0.9),
+                        percentile(latencies, 0.99),
+                        latencies[-1],
+                    ]
+                )
+            ),
+            "Worker saturation: {:.0%} busy, queueing delay p99 {:.1f}ms".format(
+                busy, 1000 * percentile(lags, 0.99)
+            ),
+            "Fake LRS: {:d} request(s), {:d} statement(s) recorded".format(
+                lrs.requests_count, len(lrs.statements)
+            ),
+        ]
+        stats = get_lrs_stats().get(lrs.url)
+        if stats:
+            lines.append(
+                "LRS client: {:d} error(s), {:d} retry(ies)".format(
+                    stats["errors"], stats["retries"]
+                )
+            )
+        self.stdout.write("\n".join(lines))
@@ -0,0 +1,46 @@
+"""Management command to send the xAPI statements waiting in the outbox."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...xapi import send_outbox_statements
+
+
+class Command(BaseCommand):
+    """Send the xAPI statements of the outbox to the LRS of their consumer site."""
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        """Add the arguments of the command."""
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Maximum number of statements sent in each transaction.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep draining the outbox instead of exiting once it is empty.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1,
+            help="Number of seconds to wait when the outbox is empty in loop mode.",
+        )
+
+    def handle(self, *args, **options):
+        """Drain the outbox, forever in loop mode."""
+        while True:
+            nb_sent, nb_failed = send_outbox_statements(limit=options["batch_size"])
+            if nb_sent or nb_failed:
+                self.stdout.write(
+                    "{:d} statement(s) sent, {:d} failed".format(nb_sent, nb_failed)
+                )
+
+            if nb_sent + nb_failed < options["batch_size"]:
+                if not options["loop"]:
+                    break
+                time.sleep(options["interval"])
@@ -0,0 +1,105 @@
+# Generated by Django 2.2.5 on 2026-10-18 02:39
+
+import uuid
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("core", "0015_auto_20190904_1234")]
+
+    operations = [
+        migrations.AddField(
+            model_name="consumersite",
+            name="lrs_outbox_active",
+            field=models.BooleanField(
+                default=False,
+                help_text="if checked, xAPI statements are stored and sent to the LRS in the background instead of during the request of the player.",
+                verbose_name="send xAPI statements asynchronously",
+            ),
+        ),
+        migrations.CreateModel(
+            name="XAPIOutboxStatement",
+            fields=[
+                ("deleted", models.DateTimeField(editable=False, null=True)),
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        help_text="primary key for the record as UUID",
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="id",
+                    ),
+                ),
+                (
+                    "created_on",
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        help_text="date and time at which a record was created",
+                        verbose_name="created on",
+                    ),
+                ),
+                (
+                    "updated_on",
+                    models.DateTimeField(
+                        auto_now=True,
+                        help_text="date and time at which a record was last updated",
+                        verbose_name="updated on",
+                    ),
+                ),
+                (
+                    "statement",
+                    models.TextField(
+                        help_text="enriched xAPI statement serialized as JSON",
+                        verbose_name="statement",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(
+                        default=0,
+                        help_text="number of failed attempts to send the statement",
+                        verbose_name="attempts",
+                    ),
+                ),
+                (
+                    "next_attempt_on",
+                    models.DateTimeField(
+                        db_index=True,
+                        default=django.utils.timezone.now,
+                        help_text="date and time after which the statement can be sent",
+                        verbose_name="next attempt on",
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(
+                        blank=True,
+                        help_text="error returned by the last attempt to send the statement",
+                        verbose_name="last error",
+                    ),
+                ),
+                (
+                    "consumer_site",
+                    models.ForeignKey(
+                        help_text="consumer site whose LRS should receive the statement",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="xapi_outbox_statements",
+                        to="core.ConsumerSite",
+                        verbose_name="consumer site",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "xAPI outbox statement",
+                "verbose_name_plural": "xAPI outbox statements",
+                "db_table": "xapi_outbox_statement",
+                "ordering": ["next_attempt_on"],
+            },
+        ),
+    ]
@@ -4,3 +4,4 @@ from .account import *  # noqa isort:skip
 from .file import *  # noqa isort:skip
 from .playlist import *  # noqa isort:skip
 from .video import *  # noqa isort:skip
+from .xapi import *  # noqa isort:skip
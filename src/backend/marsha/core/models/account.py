@@ -227,6 +227,15 @@ class ConsumerSite(BaseModel):
         blank=True,
     )
 
+    lrs_outbox_active = models.BooleanField(
+        default=False,
+        verbose_name=_("send xAPI statements asynchronously"),
+        help_text=_(
+            "if checked, xAPI statements are stored and sent to the LRS in the background"
+            " instead of during the request of the player."
+        ),
+    )
+
     video_show_download_default = models.BooleanField(
         default=True,
         verbose_name=_("show video download"),
@@ -12,7 +12,7 @@ from django.utils.translation import gettext_lazy as _
 
 from safedelete.models import SOFT_DELETE_CASCADE, SafeDeleteModel
 
-from ..defaults import PENDING, STATE_CHOICES
+from ..defaults import ERROR, PENDING, PROCESSING, READY, STATE_CHOICES
 
 
 CHECKED_APPS = {"core"}
@@ -230,7 +230,77 @@ class BaseModel(SafeDeleteModel):
         return errors
 
 
-class AbstractImage(BaseModel):
+class UploadStateMixin:
+    """Order the upload state updates sent by AWS for models with an upload state.
+
+    AWS may send its state updates late, out of order or several times. An update is only
+    applied if its state can follow the current state and if it is not older than the
+    active version of the object: its stamp must be more recent than `uploaded_on`. A
+    `ready` update for a new upload can replace any state but no update can replace a
+    `ready` state for the same stamp, so a late `processing` or `error` won't trigger a
+    new upload or transcoding.
+    """
+
+    # The states from which each state sent by AWS can be reached
+    UPLOAD_STATE_TRANSITIONS = {
+        PROCESSING: (PENDING,),
+        ERROR: (PENDING, PROCESSING),
+        READY: (PENDING, PROCESSING, ERROR, READY),
+    }
+
+    @classmethod
+    def get_upload_state_filter(cls, state, stamped_on):
+        """Return the condition for an object to accept an upload state update.
+
+        Filtering an update with this condition makes it a compare-and-set applied by the
+        database in a single `UPDATE ... WHERE` query.
+
+        Parameters
+        ----------
+        state : string
+            The state sent by AWS
+        stamped_on : Type[datetime.datetime]
+            The datetime of the stamp of the upload concerned by the update
+
+        Returns
+        -------
+        Type[django.db.models.Q]
+            The condition on the current state and `uploaded_on` of the object
+
+        """
+        return models.Q(upload_state__in=cls.UPLOAD_STATE_TRANSITIONS[state]) & (
+            models.Q(uploaded_on__isnull=True) | models.Q(uploaded_on__lt=stamped_on)
+        )
+
+    @classmethod
+    def is_upload_state_update_allowed(
+        cls, upload_state, uploaded_on, state, stamped_on
+    ):
+        """Check in Python the condition returned by `get_upload_state_filter`.
+
+        Parameters
+        ----------
+        upload_state : string
+            The current state of the object
+        uploaded_on : Type[datetime.datetime]
+            The current `uploaded_on` of the object
+        state : string
+            The state sent by AWS
+        stamped_on : Type[datetime.datetime]
+            The datetime of the stamp of the upload concerned by the update
+
+        Returns
+        -------
+        boolean
+            True if the update can be applied to the object
+
+        """
+        return upload_state in cls.UPLOAD_STATE_TRANSITIONS[state] and (
+            uploaded_on is None or uploaded_on < stamped_on
+        )
+
+
+class AbstractImage(UploadStateMixin, BaseModel):
     """Abstract model for images."""
 
     uploaded_on = models.DateTimeField(
@@ -5,11 +5,11 @@ from django.utils.translation import gettext_lazy as _
 from ..defaults import PENDING, STATE_CHOICES
 from ..utils.time_utils import to_timestamp
 from .account import User
-from .base import BaseModel
+from .base import BaseModel, UploadStateMixin
 from .playlist import Playlist
 
 
-class BaseFile(BaseModel):
+class BaseFile(UploadStateMixin, BaseModel):
     """Base file model used by all our File based models."""
 
     title = models.CharField(
@@ -6,7 +6,7 @@ from django.utils.translation import gettext_lazy as _
 
 from ..defaults import PENDING, STATE_CHOICES
 from ..utils.time_utils import to_timestamp
-from .base import AbstractImage, BaseModel
+from .base import AbstractImage, BaseModel, UploadStateMixin
 from .file import BaseFile
 
 
@@ -53,7 +53,7 @@ class Video(BaseFile):
         return "{pk!s}/video/{pk!s}/{stamp:s}".format(pk=self.pk, stamp=stamp)
 
 
-class BaseTrack(BaseModel):
+class BaseTrack(UploadStateMixin, BaseModel):
     """Base model for different kinds of tracks tied to a video."""
 
     video = models.ForeignKey(
@@ -182,7 +182,7 @@ class TimedTextTrack(BaseTrack):
         """
         stamp = stamp or to_timestamp(self.uploaded_on)
         return "{video!s}/timedtexttrack/{pk!s}/{stamp:s}_{language:s}{mode:s}".format(
-            video=self.video.pk,
+            video=self.video_id,
             pk=self.pk,
             stamp=stamp,
             language=self.language,
@@ -252,5 +252,5 @@ class Thumbnail(AbstractImage):
         """
         stamp = stamp or to_timestamp(self.uploaded_on)
         return "{video!s}/thumbnail/{pk!s}/{stamp:s}".format(
-            video=self.video.pk, pk=self.pk, stamp=stamp
+            video=self.video_id, pk=self.pk, stamp=stamp
         )
@@ -0,0 +1,61 @@
+"""Declare the models related to xAPI statements in Marsha."""
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from safedelete import HARD_DELETE
+
+from .base import BaseModel
+
+
+class XAPIOutboxStatement(BaseModel):
+    """Model representing an xAPI statement waiting to be sent to the LRS of a consumer site.
+
+    Statements are written to this outbox when the LRS of a consumer site is configured to
+    receive them asynchronously. They are deleted once they were sent by the
+    `send_xapi_statements` management command.
+    """
+
+    # statements are deleted once they are sent
+    _safedelete_policy = HARD_DELETE
+
+    consumer_site = models.ForeignKey(
+        to="ConsumerSite",
+        related_name="xapi_outbox_statements",
+        verbose_name=_("consumer site"),
+        help_text=_("consumer site whose LRS should receive the statement"),
+        # statements are deleted if the consumer site is (soft-)deleted
+        on_delete=models.CASCADE,
+    )
+    statement = models.TextField(
+        verbose_name=_("statement"),
+        help_text=_("enriched xAPI statement serialized as JSON"),
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name=_("attempts"),
+        help_text=_("number of failed attempts to send the statement"),
+        default=0,
+    )
+    next_attempt_on = models.DateTimeField(
+        verbose_name=_("next attempt on"),
+        help_text=_("date and time after which the statement can be sent"),
+        default=timezone.now,
+        db_index=True,
+    )
+    last_error = models.TextField(
+        verbose_name=_("last error"),
+        help_text=_("error returned by the last attempt to send the statement"),
+        blank=True,
+    )
+
+    class Meta:
+        """Options for the ``XAPIOutboxStatement`` model."""
+
+        db_table = "xapi_outbox_statement"
+        verbose_name = _("xAPI outbox statement")
+        verbose_name_plural = _("xAPI outbox statements")
+        ordering = ["next_attempt_on"]
+
+    def __str__(self):
+        """Get the string representation of an instance."""
+        return _("xAPI statement for {site!s}").format(site=self.consumer_site)
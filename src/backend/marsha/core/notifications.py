@@ -0,0 +1,247 @@
+"""Notify the clients of a resource when the upload state of its objects changes.
+
+The state updates sent by AWS are published to a broker, on a channel per resource (a video
+or a document). Clients wait for the events of their resource on a long-polling endpoint
+instead of polling the API of each object.
+
+Each event published on a channel gets the next version of this channel. A client sends the
+last version it has seen and receives the events published since then.
+"""
+from collections import OrderedDict, deque
+from functools import partial
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+class InProcessBroker:
+    """A broker delivering the events to the clients waiting in the current process.
+
+    It is enough for tests or a single process deployment. The clients are woken up as soon
+    as an event is published.
+    """
+
+    # Number of resources and of events per resource kept in memory
+    MAX_CHANNELS = 10000
+    MAX_EVENTS = 100
+
+    def __init__(self):
+        """Initialize the channels."""
+        self._condition = threading.Condition()
+        self._channels = OrderedDict()
+
+    def publish(self, resource_id, event):
+        """Publish an event on the channel of a resource.
+
+        Parameters
+        ----------
+        resource_id : string
+            The id of the resource concerned by the event
+        event : dictionary
+            The event to deliver to the clients of the resource
+
+        """
+        with self._condition:
+            channel = self._channels.pop(resource_id, None) or {
+                "version": 0,
+                "events": deque(maxlen=self.MAX_EVENTS),
+            }
+            channel["version"] += 1
+            channel["events"].append((channel["version"], event))
+            self._channels[resource_id] = channel
+            if len(self._channels) > self.MAX_CHANNELS:
+                self._channels.popitem(last=False)
+            self._condition.notify_all()
+
+    def get_events(self, resource_id, since=None):
+        """Return the events published on the channel of a resource since a version.
+
+        Parameters
+        ----------
+        resource_id : string
+            The id of the resource
+        since : integer
+            The last version seen by the client, `None` to only get the current version
+
+        Returns
+        -------
+        tuple
+            The current version of the channel and the list of the events published since
+
+        """
+        with self._condition:
+            channel = self._channels.get(resource_id)
+            if channel is None:
+                return 0, []
+            if since is None:
+                return channel["version"], []
+            return (
+                channel["version"],
+                [event for version, event in channel["events"] if version > since],
+            )
+
+    def wait(self, resource_id, since, timeout):
+        """Wait until the version of the channel of a resource differs from a version.
+
+        The version is lower than the version seen by the client if the channel was reset
+        (e.g. when the process restarted).
+
+        Parameters
+        ----------
+        resource_id : string
+            The id of the resource
+        since : integer
+            The last version seen by the client
+        timeout : float
+            The maximum number of seconds to wait
+
+        Returns
+        -------
+        tuple
+            The current version of the channel and the list of the events published since,
+            empty if none was published before the timeout
+
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.get_events(resource_id, since)[0] != since, timeout
+            )
+            return self.get_events(resource_id, since)
+
+
+class CacheBroker:
+    """A broker delivering the events through the default cache.
+
+    The events reach the clients waiting in all the processes sharing the default cache
+    (e.g. a Redis cache, see `DJANGO_CACHE_DEFAULT_BACKEND`). The version of each channel
+    is incremented atomically by the cache and the waiting clients check it periodically.
+
+    Events are dropped if the cache can't store the version of the channel, e.g. with the
+    `DummyCache` backend.
+    """
+
+    def __init__(self):
+        """Read the settings of the broker."""
+        self.retention = settings.UPLOAD_STATE_NOTIFICATIONS_RETENTION
+        self.poll_interval = settings.UPLOAD_STATE_NOTIFICATIONS_POLL_INTERVAL
+
+    @staticmethod
+    def _get_version_key(resource_id):
+        """Return the cache key of the version of a channel."""
+        return "upload_state_events|{!s}".format(resource_id)
+
+    @staticmethod
+    def _get_event_key(resource_id, version):
+        """Return the cache key of an event of a channel."""
+        return "upload_state_events|{!s}|{:d}".format(resource_id, version)
+
+    def publish(self, resource_id, event):
+        """Publish an event on the channel of a resource (see `InProcessBroker.publish`)."""
+        version_key = self._get_version_key(resource_id)
+        cache.add(version_key, 0, self.retention)
+        try:
+            version = cache.incr(version_key)
+        except ValueError:
+            # The version expired between the two calls
+            cache.add(version_key, 0, self.retention)
+            try:
+                version = cache.incr(version_key)
+            except ValueError:
+                logger.warning(
+                    "Upload state event of resource %s dropped: the default cache does "
+                    "not store the version of its channel.",
+                    resource_id,
+                )
+                return
+        cache.set(self._get_event_key(resource_id, version), event, self.retention)
+        cache.touch(version_key, self.retention)
+
+    def get_events(self, resource_id, since=None):
+        """Return the events published since a version (see `InProcessBroker.get_events`)."""
+        version = cache.get(self._get_version_key(resource_id), 0)
+        if since is None or version <= since:
+            return version, []
+        # Clients that are too late only get the last events
+        keys = [
+            self._get_event_key(resource_id, event_version)
+            for event_version in range(
+                max(since, version - InProcessBroker.MAX_EVENTS) + 1, version + 1
+            )
+        ]
+        events = cache.get_many(keys)
+        return version, [events[key] for key in keys if key in events]
+
+    def wait(self, resource_id, since, timeout):
+        """Wait until the version of a channel changes (see `InProcessBroker.wait`)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            version, events = self.get_events(resource_id, since)
+            remaining = deadline - time.monotonic()
+            if version != since or remaining <= 0:
+                return version, events
+            time.sleep(min(self.poll_interval, remaining))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Return the broker configured with `UPLOAD_STATE_NOTIFICATIONS_BROKER`.
+
+    Returns
+    -------
+    InProcessBroker or CacheBroker
+        The broker, shared by all the requests of the process
+
+    """
+    global _broker  # pylint: disable=global-statement
+    with _broker_lock:
+        broker_class = import_string(settings.UPLOAD_STATE_NOTIFICATIONS_BROKER)
+        if not isinstance(_broker, broker_class):
+            _broker = broker_class()
+        return _broker
+
+
+def notify_upload_state(resource_id, model_name, object_id, state, uploaded_on=None):
+    """Publish the new upload state of an object to the clients of its resource.
+
+    The event is published once the current transaction is committed, so that clients don't
+    see a state that could be rolled back. A failure of the broker is logged: the state
+    update is committed anyway and clients get it from the API of the object.
+
+    Parameters
+    ----------
+    resource_id : string
+        The id of the video or document to which the object belongs
+    model_name : string
+        The name of the model of the object (e.g. "video" or "timedtexttrack")
+    object_id : string
+        The id of the object
+    state : string
+        The new upload state of the object
+    uploaded_on : Type[datetime.datetime]
+        The datetime at which the new version of the object was uploaded, for the "ready"
+        state
+
+    """
+    event = {"id": str(object_id), "model": model_name, "upload_state": state}
+    if uploaded_on is not None:
+        event["uploaded_on"] = uploaded_on.isoformat()
+    transaction.on_commit(partial(_publish, str(resource_id), event))
+
+
+def _publish(resource_id, event):
+    """Publish an event to the broker, logging any failure instead of raising it."""
+    try:
+        get_broker().publish(resource_id, event)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Impossible to publish the upload state event %s.", event)
@@ -9,11 +9,18 @@ from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.utils.text import slugify
 
-from botocore.signers import CloudFrontSigner
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from rest_framework_simplejwt.models import TokenUser
 
-from .defaults import ERROR, PROCESSING, READY, STATE_CHOICES
+from .defaults import (
+    BULK_INITIATE_UPLOAD_MAX_OBJECTS,
+    ERROR,
+    MULTIPART_UPLOAD_MAX_PART_URLS,
+    PROCESSING,
+    READY,
+    STATE_CHOICES,
+)
 from .models import Document, Thumbnail, TimedTextTrack, Video
 from .utils import cloudfront_utils, time_utils
 
@@ -25,8 +32,9 @@ EXTENSION_REGEX = '[^.\\/:*?&"<>|\r\n]+'
 # This regex matches keys in AWS for videos, timed text tracks, thumbail and document
 TIMED_TEXT_EXTENSIONS = "|".join(m[0] for m in TimedTextTrack.MODE_CHOICES)
 KEY_PATTERN = (
-    r"^{uuid:s}/(?P<model_name>video|thumbnail|timedtexttrack|document)/(?P<object_id>"
-    r"{uuid:s})/(?P<stamp>[0-9]{{10}})(_[a-z-]{{2,10}}_({tt_ex}))?"
+    r"^(?P<resource_id>{uuid:s})/"
+    r"(?P<model_name>video|thumbnail|timedtexttrack|document)/(?P<object_id>{uuid:s})/"
+    r"(?P<stamp>[0-9]{{10}})(_[a-z-]{{2,10}}_({tt_ex}))?"
     # The extension is captured and is optional. If present and the resource has an extension
     # attribute we will save it in database.
     r"(\.(?P<extension>{extension:s}))?$"
@@ -80,7 +88,46 @@ class TimestampField(serializers.DateTimeField):
             raise ValidationError(error)
 
 
-class TimedTextTrackSerializer(serializers.ModelSerializer):
+class SignedUrlsMixin:
+    """Sign all the CloudFront urls of a payload with the same expiration date.
+
+    The expiration date and the wildcard policies signed for the payload are kept in the
+    context shared by the serializer and its nested serializers, so that the wildcard policy
+    of a resource is signed once per payload whatever the cache backend.
+    """
+
+    def sign_url(self, url, resource_id):
+        """Sign a url of a resource for `CLOUDFRONT_SIGNED_URLS_VALIDITY` seconds.
+
+        Parameters
+        ----------
+        url : Type[string]
+            the url to sign
+        resource_id : Type[string|uuid.UUID]
+            the primary key of the resource under which the file is distributed
+
+        Returns
+        -------
+        string
+            The signed url
+
+        """
+        signing = self.context.get("cloudfront_signing")
+        if signing is None:
+            signing = self.context["cloudfront_signing"] = {
+                "date_less_than": timezone.now()
+                + timedelta(seconds=settings.CLOUDFRONT_SIGNED_URLS_VALIDITY),
+                "wildcard_policies": {},
+            }
+        return cloudfront_utils.sign_url(
+            url,
+            resource_id,
+            signing["date_less_than"],
+            wildcard_policies=signing["wildcard_policies"],
+        )
+
+
+class TimedTextTrackSerializer(SignedUrlsMixin, serializers.ModelSerializer):
     """Serializer to display a timed text track model."""
 
     class Meta:  # noqa
@@ -155,7 +202,7 @@ class TimedTextTrackSerializer(serializers.ModelSerializer):
             base = "{protocol:s}://{cloudfront:s}/{video!s}".format(
                 protocol=settings.AWS_S3_URL_PROTOCOL,
                 cloudfront=settings.CLOUDFRONT_DOMAIN,
-                video=obj.video.pk,
+                video=obj.video_id,
             )
             url = "{base:s}/timedtext/{stamp:s}_{language:s}{mode:s}.vtt".format(
                 base=base,
@@ -166,15 +213,7 @@ class TimedTextTrackSerializer(serializers.ModelSerializer):
 
             # Sign the url only if the functionality is activated
             if settings.CLOUDFRONT_SIGNED_URLS_ACTIVE:
-                date_less_than = timezone.now() + timedelta(
-                    seconds=settings.CLOUDFRONT_SIGNED_URLS_VALIDITY
-                )
-                cloudfront_signer = CloudFrontSigner(
-                    settings.CLOUDFRONT_ACCESS_KEY_ID, cloudfront_utils.rsa_signer
-                )
-                url = cloudfront_signer.generate_presigned_url(
-                    url, date_less_than=date_less_than
-                )
+                url = self.sign_url(url, obj.video_id)
             return url
         return None
 
@@ -250,7 +289,7 @@ class ThumbnailSerializer(serializers.ModelSerializer):
             base = "{protocol:s}://{cloudfront:s}/{video!s}".format(
                 protocol=settings.AWS_S3_URL_PROTOCOL,
                 cloudfront=settings.CLOUDFRONT_DOMAIN,
-                video=obj.video.pk,
+                video=obj.video_id,
             )
             urls = {}
             for resolution in settings.VIDEO_RESOLUTIONS:
@@ -265,7 +304,7 @@ class ThumbnailSerializer(serializers.ModelSerializer):
         return None
 
 
-class VideoSerializer(serializers.ModelSerializer):
+class VideoSerializer(SignedUrlsMixin, serializers.ModelSerializer):
     """Serializer to display a video model with all its resolution options."""
 
     class Meta:  # noqa
@@ -329,7 +368,9 @@ class VideoSerializer(serializers.ModelSerializer):
             pass
         else:
             if thumbnail.uploaded_on is not None:
-                thumbnail_serialized = ThumbnailSerializer(thumbnail)
+                thumbnail_serialized = ThumbnailSerializer(
+                    thumbnail, context=self.context
+                )
                 thumbnail_urls.update(thumbnail_serialized.data.get("urls"))
 
         urls = {"mp4": {}, "thumbnails": {}}
@@ -340,11 +381,6 @@ class VideoSerializer(serializers.ModelSerializer):
             pk=obj.pk,
         )
         stamp = time_utils.to_timestamp(obj.uploaded_on)
-
-        date_less_than = timezone.now() + timedelta(
-            seconds=settings.CLOUDFRONT_SIGNED_URLS_VALIDITY
-        )
-        stamp = time_utils.to_timestamp(obj.uploaded_on)
         filename = "{playlist_title:s}_{stamp:s}.mp4".format(
             playlist_title=slugify(obj.playlist.title), stamp=stamp
         )
@@ -370,12 +406,7 @@ class VideoSerializer(serializers.ModelSerializer):
 
             # Sign the urls of mp4 videos only if the functionality is activated
             if settings.CLOUDFRONT_SIGNED_URLS_ACTIVE:
-                cloudfront_signer = CloudFrontSigner(
-                    settings.CLOUDFRONT_ACCESS_KEY_ID, cloudfront_utils.rsa_signer
-                )
-                mp4_url = cloudfront_signer.generate_presigned_url(
-                    mp4_url, date_less_than=date_less_than
-                )
+                mp4_url = self.sign_url(mp4_url, obj.pk)
 
             urls["mp4"][resolution] = mp4_url
 
@@ -416,6 +447,62 @@ class InitiateUploadSerializer(serializers.Serializer):
     mimetype = serializers.CharField(allow_blank=True)
 
 
+class BulkInitiateUploadSerializer(serializers.Serializer):
+    """A serializer to validate data submitted on the bulk-initiate-upload API endpoints."""
+
+    ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=BULK_INITIATE_UPLOAD_MAX_OBJECTS,
+    )
+
+
+class InitiateMultipartUploadSerializer(serializers.Serializer):
+    """A serializer to validate data submitted on the initiate-multipart-upload API endpoint."""
+
+    mimetype = serializers.RegexField(r"^video/[\w.+-]+$")
+
+
+class MultipartUploadSerializer(serializers.Serializer):
+    """A serializer to validate the multipart upload targeted by a request.
+
+    The key of the object is not submitted: it is rebuilt from the stamp so a multipart upload
+    can only target the source of the video on which the endpoint is called.
+    """
+
+    stamp = serializers.RegexField(r"^\d+$")
+    upload_id = serializers.CharField(max_length=1024)
+
+
+class PresignMultipartUploadPartsSerializer(MultipartUploadSerializer):
+    """A serializer to validate data submitted on the presign-multipart-upload-parts endpoint."""
+
+    part_numbers = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=10000),
+        allow_empty=False,
+        max_length=MULTIPART_UPLOAD_MAX_PART_URLS,
+    )
+
+
+class MultipartUploadPartSerializer(serializers.Serializer):
+    """A serializer to validate a part uploaded to S3 during a multipart upload."""
+
+    part_number = serializers.IntegerField(min_value=1, max_value=10000)
+    etag = serializers.CharField(max_length=200)
+
+
+class CompleteMultipartUploadSerializer(MultipartUploadSerializer):
+    """A serializer to validate data submitted on the complete-multipart-upload endpoint."""
+
+    parts = MultipartUploadPartSerializer(many=True, allow_empty=False)
+
+    def validate_parts(self, value):
+        """Each part can only be listed once."""
+        if len({part["part_number"] for part in value}) != len(value):
+            raise serializers.ValidationError("Each part number must be unique.")
+        return value
+
+
 class VerbSerializer(serializers.Serializer):
     """Validate the verb in a xAPI statement."""
 
@@ -440,19 +527,31 @@ class XAPIStatementSerializer(serializers.Serializer):
     id = serializers.RegexField(
         re.compile("^{uuid}$".format(uuid=UUID_REGEX)),
         required=False,
-        default=str(uuid.uuid4()),
+        # The default must be computed for each statement
+        default=lambda: str(uuid.uuid4()),
     )
     timestamp = serializers.DateTimeField()
 
-    def validate(self, attrs):
-        """Check if there is no extra arguments in the submitted payload."""
-        unknown_keys = set(self.initial_data.keys()) - set(self.fields.keys())
+    def to_internal_value(self, data):
+        """Check if there is no extra arguments in the submitted payload.
+
+        The check is done on the data of each statement rather than on `initial_data` so that
+        it also works when several statements are validated at once (`many=True`).
+        """
+        attrs = super().to_internal_value(data)
+        unknown_keys = set(data.keys()) - set(self.fields.keys())
         if unknown_keys:
-            raise ValidationError("Got unknown fields: {}".format(unknown_keys))
+            raise serializers.ValidationError(
+                {
+                    api_settings.NON_FIELD_ERRORS_KEY: [
+                        "Got unknown fields: {}".format(unknown_keys)
+                    ]
+                }
+            )
         return attrs
 
 
-class DocumentSerializer(serializers.ModelSerializer):
+class DocumentSerializer(SignedUrlsMixin, serializers.ModelSerializer):
     """A serializer to display a Document resource."""
 
     class Meta:  # noqa
@@ -556,15 +655,7 @@ class DocumentSerializer(serializers.ModelSerializer):
 
         # Sign the document urls only if the functionality is activated
         if settings.CLOUDFRONT_SIGNED_URLS_ACTIVE:
-            date_less_than = timezone.now() + timedelta(
-                seconds=settings.CLOUDFRONT_SIGNED_URLS_VALIDITY
-            )
-            cloudfront_signer = CloudFrontSigner(
-                settings.CLOUDFRONT_ACCESS_KEY_ID, cloudfront_utils.rsa_signer
-            )
-            url = cloudfront_signer.generate_presigned_url(
-                url, date_less_than=date_less_than
-            )
+            url = self.sign_url(url, obj.pk)
 
         return url
 
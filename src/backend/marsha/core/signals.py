@@ -0,0 +1,188 @@
+"""Signal handlers of the ``core`` app of the Marsha project.
+
+Cached data are invalidated once the transaction that modified an object is committed.
+Otherwise, a request running concurrently could cache the data read before the commit
+for the new generation of the cache, until it expires.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .lti.utils import invalidate_cached_passports, invalidate_reachable_from
+from .models import (
+    ConsumerSite,
+    ConsumerSitePortability,
+    Document,
+    LTIPassport,
+    Playlist,
+    Thumbnail,
+    TimedTextTrack,
+    Video,
+)
+from .utils.cache_utils import invalidate_app_data
+from .xapi import invalidate_xapi_contexts
+
+
+# pylint: disable=unused-argument
+
+
+def _on_commit(invalidate, *args):
+    """Call an invalidation function once the current transaction is committed."""
+    transaction.on_commit(partial(invalidate, *args))
+
+
+def _invalidate_resources_app_data(query):
+    """Invalidate the application data cached for the documents and videos of a query."""
+    resources = [
+        (model, list(model.objects.filter(query).values_list("pk", flat=True)))
+        for model in [Document, Video]
+    ]
+
+    def invalidate():
+        for model, resource_ids in resources:
+            for resource_id in resource_ids:
+                invalidate_app_data(model, resource_id)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+def invalidate_resource_app_data(sender, instance, **kwargs):
+    """Invalidate the application data cached for a resource when it is modified."""
+    _on_commit(invalidate_app_data, sender, instance.pk)
+
+
+@receiver(post_save, sender=Thumbnail)
+@receiver(post_delete, sender=Thumbnail)
+@receiver(post_save, sender=TimedTextTrack)
+@receiver(post_delete, sender=TimedTextTrack)
+def invalidate_video_app_data(sender, instance, **kwargs):
+    """Invalidate the application data cached for a video when one of its objects changes."""
+    _on_commit(invalidate_app_data, Video, instance.video_id)
+
+
+@receiver(post_save, sender=Playlist)
+def invalidate_playlist_app_data(sender, instance, **kwargs):
+    """Invalidate the application data cached for all the resources of a playlist.
+
+    The title and portability of the playlist are used to serialize and to look up its
+    resources.
+    """
+    _invalidate_resources_app_data(Q(playlist=instance))
+
+
+@receiver(post_save, sender=LTIPassport)
+@receiver(post_delete, sender=LTIPassport)
+def invalidate_passport(sender, instance, **kwargs):
+    """Remove a passport from the cache when it is modified."""
+    _on_commit(invalidate_cached_passports, [instance.oauth_consumer_key])
+
+
+@receiver(post_save, sender=ConsumerSite)
+@receiver(pre_delete, sender=ConsumerSite)
+@receiver(post_save, sender=Playlist)
+@receiver(pre_delete, sender=Playlist)
+def invalidate_related_passports(sender, instance, **kwargs):
+    """Remove from the cache the passports related to a consumer site or a playlist.
+
+    Passports are cached with their consumer site, which is either the consumer site of the
+    passport or the consumer site of its playlist. We must look for them before deletion as
+    the relations of the passports are then set to null.
+    """
+    if sender is ConsumerSite:
+        query = Q(consumer_site=instance) | Q(playlist__consumer_site=instance)
+    else:
+        query = Q(playlist=instance)
+    _on_commit(
+        invalidate_cached_passports,
+        list(
+            LTIPassport.objects.filter(query).values_list(
+                "oauth_consumer_key", flat=True
+            )
+        ),
+    )
+
+
+@receiver(post_save, sender=ConsumerSitePortability)
+@receiver(post_delete, sender=ConsumerSitePortability)
+def invalidate_portability_reachable_from(sender, instance, **kwargs):
+    """Recompute the sites portable to the target site of a portability link.
+
+    The application data of the resources of the source site are invalidated too: they
+    were cached for the launches from the target site depending on this link.
+    """
+    _on_commit(invalidate_reachable_from, [instance.target_site_id])
+    _invalidate_resources_app_data(
+        Q(playlist__consumer_site_id=instance.source_site_id)
+    )
+
+
+@receiver(m2m_changed, sender=ConsumerSitePortability)
+def invalidate_m2m_reachable_from(sender, instance, action, reverse, pk_set, **kwargs):
+    """Recompute the sites portable to consumer sites linked through `portable_to`.
+
+    The application data of the resources of the source sites are invalidated too.
+    """
+    if action in ["post_add", "post_remove"]:
+        target_ids, source_ids = (
+            ([instance.pk], pk_set) if reverse else (pk_set, [instance.pk])
+        )
+    elif action == "pre_clear":
+        if reverse:
+            target_ids = [instance.pk]
+            source_ids = list(instance.reachable_from.values_list("id", flat=True))
+        else:
+            target_ids = list(instance.portable_to.values_list("id", flat=True))
+            source_ids = [instance.pk]
+    else:
+        return
+    _on_commit(invalidate_reachable_from, list(target_ids))
+    _invalidate_resources_app_data(Q(playlist__consumer_site_id__in=source_ids))
+
+
+@receiver(post_save, sender=ConsumerSite)
+def invalidate_site_reachable_from(sender, instance, **kwargs):
+    """Recompute the sites portable to the targets of a consumer site when it changes.
+
+    A deleted consumer site is not portable anymore.
+    """
+    _on_commit(
+        invalidate_reachable_from,
+        list(
+            ConsumerSitePortability.objects.filter(source_site=instance).values_list(
+                "target_site_id", flat=True
+            )
+        ),
+    )
+
+
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+def invalidate_video_xapi_context(sender, instance, **kwargs):
+    """Remove the xAPI context of a video from the cache when it is modified."""
+    _on_commit(invalidate_xapi_contexts, [instance.pk])
+
+
+@receiver(post_save, sender=ConsumerSite)
+@receiver(post_save, sender=Playlist)
+def invalidate_related_xapi_contexts(sender, instance, **kwargs):
+    """Remove from the cache the xAPI context of the videos of a consumer site or a playlist.
+
+    The domain and the LRS configuration of the consumer site are cached with the context of
+    each of its videos. Deleting a consumer site or a playlist deletes its videos.
+    """
+    query = (
+        Q(playlist__consumer_site=instance)
+        if sender is ConsumerSite
+        else Q(playlist=instance)
+    )
+    _on_commit(
+        invalidate_xapi_contexts,
+        list(Video.objects.filter(query).values_list("pk", flat=True)),
+    )
@@ -427,6 +427,48 @@ class ThumbnailApiTest(TestCase):
         thumbnail.refresh_from_db()
         self.assertEqual(thumbnail.upload_state, "pending")
 
+    def test_api_thumbnail_bulk_initiate_upload_instructor(self):
+        """Instructor users should be able to initiate uploads through the bulk endpoint."""
+        video = VideoFactory(
+            id="c10b79b6-9ecc-4aba-bf9d-5aab4765fd40", upload_state="ready"
+        )
+        thumbnail = ThumbnailFactory(
+            id="4ab8079e-ff4d-4d06-9922-4929e4f7a6eb", video=video, upload_state="ready"
+        )
+        jwt_token = AccessToken()
+        jwt_token.payload["resource_id"] = str(video.id)
+        jwt_token.payload["roles"] = [random.choice(["instructor", "administrator"])]
+        jwt_token.payload["permissions"] = {"can_update": True}
+
+        now = datetime(2018, 8, 8, tzinfo=pytz.utc)
+        with mock.patch.object(timezone, "now", return_value=now):
+            response = self.client.post(
+                "/api/thumbnails/bulk-initiate-upload/",
+                {"ids": [str(thumbnail.id)]},
+                content_type="application/json",
+                HTTP_AUTHORIZATION="Bearer {!s}".format(jwt_token),
+            )
+        self.assertEqual(response.status_code, 200)
+        content = response.json()
+
+        # The policy is the same as the one of the initiate-upload endpoint
+        policy = content[str(thumbnail.id)]
+        self.assertEqual(
+            json.loads(b64decode(policy["policy"]))["conditions"][-2:],
+            [
+                ["starts-with", "$Content-Type", "image/"],
+                ["content-length-range", 0, 10485760],
+            ],
+        )
+        self.assertEqual(policy["max_file_size"], 10485760)
+        self.assertEqual(
+            policy["x_amz_signature"],
+            "c2d6de925194710b939abf80b7b1218a3af93123c1da16dd2c3f35aac145dbfc",
+        )
+
+        thumbnail.refresh_from_db()
+        self.assertEqual(thumbnail.upload_state, "pending")
+
     def test_api_thumbnail_initiate_upload_instructor_read_only(self):
         """Instructor should not be able to initiate thumbnails upload in a read_only mode."""
         thumbnail = ThumbnailFactory()
@@ -13,11 +13,12 @@ from rest_framework_simplejwt.tokens import AccessToken
 from ..api import timezone
 from ..factories import TimedTextTrackFactory, UserFactory, VideoFactory
 from ..models import TimedTextTrack
+from ..utils import s3_utils
 from .test_api_video import RSA_KEY_MOCK
 
 
 # We don't enforce arguments documentation in tests
-# pylint: disable=unused-argument
+# pylint: disable=too-many-lines,unused-argument
 
 
 class TimedTextTrackAPITest(TestCase):
@@ -956,3 +957,129 @@ class TimedTextTrackAPITest(TestCase):
             HTTP_AUTHORIZATION="Bearer {!s}".format(jwt_token),
         )
         self.assertEqual(response.status_code, 403)
+
+    def test_api_timed_text_track_bulk_initiate_upload_anonymous_user(self):
+        """Anonymous users should not be allowed to initiate uploads."""
+        response = self.client.post("/api/timedtexttracks/bulk-initiate-upload/")
+        self.assertEqual(response.status_code, 401)
+
+    def test_api_timed_text_track_bulk_initiate_upload_token_user(self):
+        """A token user should be able to initiate the upload of several tracks at once."""
+        video = VideoFactory(pk="b8d40ed7-95b8-4848-98c9-50728dfee25d")
+        timed_text_tracks = [
+            TimedTextTrackFactory(
+                video=video,
+                language=language,
+                mode="st",
+                upload_state=random.choice(["ready", "error"]),
+            )
+            for language in ["fr", "en", "de"]
+        ]
+        other_ttt_for_same_video = TimedTextTrackFactory(
+            video=video, language="es", upload_state="ready"
+        )
+        jwt_token = AccessToken()
+        jwt_token.payload["resource_id"] = str(video.id)
+        jwt_token.payload["roles"] = [random.choice(["instructor", "administrator"])]
+        jwt_token.payload["permissions"] = {"can_update": True}
+
+        now = datetime(2018, 8, 8, tzinfo=pytz.utc)
+        with mock.patch.object(timezone, "now", return_value=now), mock.patch(
+            "marsha.core.utils.s3_utils.get_signature_key",
+            wraps=s3_utils.get_signature_key,
+        ) as mock_get_signature_key, self.assertNumQueries(2):
+            response = self.client.post(
+                "/api/timedtexttracks/bulk-initiate-upload/",
+                {"ids": [str(ttt.id) for ttt in timed_text_tracks]},
+                content_type="application/json",
+                HTTP_AUTHORIZATION="Bearer {!s}".format(jwt_token),
+            )
+        self.assertEqual(response.status_code, 200)
+        content = response.json()
+
+        self.assertEqual(
+            set(content.keys()), {str(ttt.id) for ttt in timed_text_tracks}
+        )
+        for ttt in timed_text_tracks:
+            policy = content[str(ttt.id)]
+            key = "{!s}/timedtexttrack/{!s}/1533686400_{:s}_st".format(
+                video.id, ttt.id, ttt.language
+            )
+            self.assertEqual(policy["key"], key)
+            self.assertEqual(policy["stamp"], "1533686400")
+            self.assertEqual(policy["max_file_size"], 1048576)
+            self.assertEqual(
+                json.loads(b64decode(policy["policy"]))["conditions"][-2:],
+                [{"key": key}, ["content-length-range", 0, 1048576]],
+            )
+        # The signing key is derived at most once for all the policies
+        self.assertLessEqual(mock_get_signature_key.call_count, 1)
+
+        # The upload state of the timed text tracks should have been reset
+        for ttt in timed_text_tracks:
+            ttt.refresh_from_db()
+            self.assertEqual(ttt.upload_state, "pending")
+        other_ttt_for_same_video.refresh_from_db()
+        self.assertEqual(other_ttt_for_same_video.upload_state, "ready")
+
+    def test_api_timed_text_track_bulk_initiate_upload_other_video(self):
+        """No upload should be initiated if one of the tracks belongs to another video."""
+        timed_text_track = TimedTextTrackFactory(upload_state="ready")
+        other_ttt_for_other_video = TimedTextTrackFactory(upload_state="ready")
+        jwt_token = AccessToken()
+        jwt_token.payload["resource_id"] = str(timed_text_track.video.id)
+        jwt_token.payload["roles"] = [random.choice(["instructor", "administrator"])]
+        jwt_token.payload["permissions"] = {"can_update": True}
+
+        response = self.client.post(
+            "/api/timedtexttracks/bulk-initiate-upload/",
+            {"ids": [str(timed_text_track.id), str(other_ttt_for_other_video.id)]},
+            content_type="application/json",
+            HTTP_AUTHORIZATION="Bearer {!s}".format(jwt_token),
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(
+            response.json(),
+            {"detail": "Not found.", "ids": [str(other_ttt_for_other_video.id)]},
+        )
+        timed_text_track.refresh_from_db()
+        self.assertEqual(timed_text_track.upload_state, "ready")
+
+    def test_api_timed_text_track_bulk_initiate_upload_invalid_payload(self):
+        """The payload should be a non empty list of primary keys."""
+        timed_text_track = TimedTextTrackFactory()
+        jwt_token = AccessToken()
+        jwt_token.payload["resource_id"] = str(timed_text_track.video.id)
+        jwt_token.payload["roles"] = [random.choice(["instructor", "administrator"])]
+        jwt_token.payload["permissions"] = {"can_update": True}
+
+        for data, errors in [
+            ({}, {"ids": ["This field is required."]}),
+            ({"ids": []}, {"ids": ["This list may not be empty."]}),
+            ({"ids": ["foo"]}, {"ids": {"0": ["Must be a valid UUID."]}}),
+        ]:
+            response = self.client.post(
+                "/api/timedtexttracks/bulk-initiate-upload/",
+                data,
+                content_type="application/json",
+                HTTP_AUTHORIZATION="Bearer {!s}".format(jwt_token),
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), errors)
+
+    def test_api_timed_text_track_bulk_initiate_upload_read_only(self):
+        """Instructors should not be able to initiate uploads in read only."""
+        timed_text_track = TimedTextTrackFactory()
+        jwt_token = AccessToken()
+        jwt_token.payload["resource_id"] = str(timed_text_track.video.id)
+        jwt_token.payload["roles"] = [random.choice(["instructor", "administrator"])]
+        jwt_token.payload["permissions"] = {"can_update": False}
+
+        response = self.client.post(
+            "/api/timedtexttracks/bulk-initiate-upload/",
+            {"ids": [str(timed_text_track.id)]},
+            content_type="application/json",
+            HTTP_AUTHORIZATION="Bearer {!s}".format(jwt_token),
+        )
+        self.assertEqual(response.status_code, 403)
@@ -1,12 +1,26 @@
 """Tests for the upload & processing state update API of the Marsha project."""
 from datetime import datetime
+import hashlib
+import hmac
 import json
 
 from django.test import TestCase, override_settings
 
 import pytz
 
-from ..factories import DocumentFactory, TimedTextTrackFactory, VideoFactory
+from ..factories import (
+    DocumentFactory,
+    ThumbnailFactory,
+    TimedTextTrackFactory,
+    VideoFactory,
+)
+
+
+def sign(key, secret="shared secret"):
+    """Sign a key like our AWS lambdas do."""
+    return hmac.new(
+        secret.encode("utf-8"), msg=key.encode("utf-8"), digestmod=hashlib.sha256
+    ).hexdigest()
 
 
 class UpdateStateAPITest(TestCase):
@@ -25,7 +39,9 @@ class UpdateStateAPITest(TestCase):
         video.refresh_from_db()
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(json.loads(response.content), {"success": True})
+        self.assertEqual(
+            json.loads(response.content), {"success": True, "applied": True}
+        )
         self.assertEqual(video.uploaded_on, datetime(2018, 8, 8, tzinfo=pytz.utc))
         self.assertEqual(video.upload_state, "ready")
 
@@ -42,7 +58,9 @@ class UpdateStateAPITest(TestCase):
         video.refresh_from_db()
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(json.loads(response.content), {"success": True})
+        self.assertEqual(
+            json.loads(response.content), {"success": True, "applied": True}
+        )
         self.assertEqual(video.uploaded_on, None)
         self.assertEqual(video.upload_state, "processing")
 
@@ -63,7 +81,9 @@ class UpdateStateAPITest(TestCase):
         video.refresh_from_db()
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(json.loads(response.content), {"success": True})
+        self.assertEqual(
+            json.loads(response.content), {"success": True, "applied": True}
+        )
         self.assertEqual(video.uploaded_on, None)
         self.assertEqual(video.upload_state, "error")
 
@@ -86,7 +106,9 @@ class UpdateStateAPITest(TestCase):
         timed_text_track.refresh_from_db()
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(json.loads(response.content), {"success": True})
+        self.assertEqual(
+            json.loads(response.content), {"success": True, "applied": True}
+        )
         self.assertEqual(
             timed_text_track.uploaded_on, datetime(2018, 8, 8, tzinfo=pytz.utc)
         )
@@ -189,3 +211,190 @@ class UpdateStateAPITest(TestCase):
         self.assertEqual(document.upload_state, "ready")
         self.assertEqual(document.extension, None)
         self.assertEqual(document.uploaded_on, datetime(2018, 8, 8, tzinfo=pytz.utc))
+
+    @override_settings(UPDATE_STATE_SHARED_SECRETS=["shared secret"])
+    def test_api_update_state_late_update(self):
+        """A retried or late update should be acknowledged without being applied."""
+        video = VideoFactory(
+            upload_state="ready", uploaded_on=datetime(2018, 8, 8, tzinfo=pytz.utc)
+        )
+        key = "{video!s}/video/{video!s}/1533686400".format(video=video.pk)
+        older_key = "{video!s}/video/{video!s}/1533600000".format(video=video.pk)
+
+        for data in [
+            {"key": key, "state": "ready", "signature": sign(key)},
+            {"key": key, "state": "processing", "signature": sign(key)},
+            {"key": key, "state": "error", "signature": sign(key)},
+            {"key": older_key, "state": "ready", "signature": sign(older_key)},
+        ]:
+            response = self.client.post("/api/update-state", data)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                json.loads(response.content), {"success": True, "applied": False}
+            )
+            video.refresh_from_db()
+            self.assertEqual(video.upload_state, "ready")
+            self.assertEqual(video.uploaded_on, datetime(2018, 8, 8, tzinfo=pytz.utc))
+
+    @override_settings(UPDATE_STATE_SHARED_SECRETS=["shared secret"])
+    def test_api_update_state_transitions(self):
+        """A state sent by AWS should only be applied if it can follow the current state."""
+        key = "{video!s}/video/{video!s}/1533686400"
+        cases = [
+            # current state, new state, applied
+            ("pending", "processing", True),
+            ("pending", "ready", True),
+            ("pending", "error", True),
+            ("processing", "processing", False),
+            ("processing", "ready", True),
+            ("processing", "error", True),
+            ("error", "processing", False),
+            ("error", "error", False),
+            ("error", "ready", True),
+        ]
+        for upload_state, state, applied in cases:
+            video = VideoFactory(upload_state=upload_state)
+            video_key = key.format(video=video.pk)
+
+            response = self.client.post(
+                "/api/update-state",
+                {"key": video_key, "state": state, "signature": sign(video_key)},
+            )
+
+            self.assertEqual(
+                json.loads(response.content), {"success": True, "applied": applied}
+            )
+            video.refresh_from_db()
+            self.assertEqual(video.upload_state, state if applied else upload_state)
+
+
+@override_settings(UPDATE_STATE_SHARED_SECRETS=["shared secret"])
+class UpdateStateBulkAPITest(TestCase):
+    """Test the API that allows to update the state of several objects in one request."""
+
+    def _post(self, data):
+        """Post a list of state updates to the bulk endpoint."""
+        return self.client.post(
+            "/api/update-state/bulk",
+            data=json.dumps(data),
+            content_type="application/json",
+        )
+
+    def test_api_update_state_bulk(self):
+        """Each item should be verified and applied, with its result in the response."""
+        videos = VideoFactory.create_batch(3)
+        timed_text_track = TimedTextTrackFactory(video=videos[0])
+        thumbnail = ThumbnailFactory(video=videos[1])
+        document = DocumentFactory()
+        keys = [
+            "{video!s}/video/{video!s}/1533686400".format(video=videos[0].pk),
+            "{video!s}/video/{video!s}/1533686400".format(video=videos[1].pk),
+            "{video!s}/video/{video!s}/1533686400".format(video=videos[2].pk),
+            "{!s}/timedtexttrack/{!s}/1533686400_fr_cc".format(
+                videos[0].pk, timed_text_track.pk
+            ),
+            "{!s}/thumbnail/{!s}/1533686400".format(videos[1].pk, thumbnail.pk),
+            "{doc!s}/document/{doc!s}/1533686400.pdf".format(doc=document.pk),
+        ]
+        data = [{"key": key, "state": "ready", "signature": sign(key)} for key in keys]
+        data[2]["state"] = "processing"
+        data[2]["signature"] = sign(keys[2])
+
+        # 1 query per model to find the objects, 1 query per identical update and the
+        # queries of the transaction
+        with self.assertNumQueries(11):
+            response = self._post(data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content),
+            [{"status": 200, "success": True, "applied": True}] * 6,
+        )
+        for instance in videos[:2] + [timed_text_track, thumbnail, document]:
+            instance.refresh_from_db()
+            self.assertEqual(instance.upload_state, "ready")
+            self.assertEqual(
+                instance.uploaded_on, datetime(2018, 8, 8, tzinfo=pytz.utc)
+            )
+        videos[2].refresh_from_db()
+        self.assertEqual(videos[2].upload_state, "processing")
+        self.assertIsNone(videos[2].uploaded_on)
+        self.assertEqual(document.extension, "pdf")
+
+    def test_api_update_state_bulk_per_item_errors(self):
+        """Invalid, unsigned or unknown items should not prevent the others from applying."""
+        video = VideoFactory()
+        key = "{video!s}/video/{video!s}/1533686400".format(video=video.pk)
+        unknown_key = "{!s}/video/{!s}/1533686400".format(
+            "9f14ad28-dd35-49b1-a723-84d57884e4cb",
+            "1ed1b113-2b87-42af-863a-11232f7bf88f",
+        )
+        data = [
+            {"key": key, "state": "reedo", "signature": sign(key)},
+            {"key": key, "state": "ready", "signature": "invalid signature"},
+            {"key": unknown_key, "state": "ready", "signature": sign(unknown_key)},
+            {"key": key, "state": "error", "signature": sign(key)},
+        ]
+
+        response = self._post(data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content),
+            [
+                {
+                    "status": 400,
+                    "errors": {"state": ['"reedo" is not a valid choice.']},
+                },
+                {"status": 403, "success": False},
+                {"status": 404, "success": False},
+                {"status": 200, "success": True, "applied": True},
+            ],
+        )
+        video.refresh_from_db()
+        self.assertEqual(video.upload_state, "error")
+        self.assertIsNone(video.uploaded_on)
+
+    def test_api_update_state_bulk_same_object(self):
+        """The items targeting an object should be applied in order if they can follow."""
+        video = VideoFactory()
+        key = "{video!s}/video/{video!s}/1533686400".format(video=video.pk)
+        new_key = "{video!s}/video/{video!s}/1533690000".format(video=video.pk)
+        data = [
+            {"key": key, "state": "processing", "signature": sign(key)},
+            {"key": key, "state": "ready", "signature": sign(key)},
+            # A retry and a late update are ignored
+            {"key": key, "state": "ready", "signature": sign(key)},
+            {"key": key, "state": "error", "signature": sign(key)},
+            # A new upload replaces the previous one
+            {"key": new_key, "state": "ready", "signature": sign(new_key)},
+        ]
+
+        with self.assertNumQueries(4):
+            response = self._post(data)
+
+        self.assertEqual(
+            [item["applied"] for item in json.loads(response.content)],
+            [True, True, False, False, True],
+        )
+        video.refresh_from_db()
+        self.assertEqual(video.upload_state, "ready")
+        self.assertEqual(video.uploaded_on, datetime(2018, 8, 8, 1, tzinfo=pytz.utc))
+
+    @override_settings(UPDATE_STATE_BULK_MAX_ITEMS=2)
+    def test_api_update_state_bulk_invalid_payload(self):
+        """The payload should be a list of limited length."""
+        response = self._post({"key": "key", "state": "ready", "signature": "123abc"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            json.loads(response.content),
+            {"reason": "A list of state updates is expected."},
+        )
+
+        response = self._post([{}] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            json.loads(response.content),
+            {"reason": "Too many state updates, the maximum is 2."},
+        )
@@ -0,0 +1,276 @@
+"""Tests for the upload state notifications of the Marsha project."""
+from datetime import datetime
+import json
+import random
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+import pytz
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .. import notifications
+from ..factories import TimedTextTrackFactory, VideoFactory
+from ..models import Video
+from .test_api_update_state import sign
+from .utils import execute_on_commit_callbacks
+
+
+class BrokerTestCase(TestCase):
+    """Test the brokers delivering the upload state changes."""
+
+    def setUp(self):
+        """Start each test with an empty cache."""
+        super().setUp()
+        cache.clear()
+
+    def _test_broker(self, broker):
+        """Publish events and wait for them with a broker."""
+        self.assertEqual(broker.get_events("resource"), (0, []))
+
+        broker.publish("resource", {"upload_state": "processing"})
+        broker.publish("resource", {"upload_state": "ready"})
+        broker.publish("other", {"upload_state": "error"})
+
+        self.assertEqual(broker.get_events("resource"), (2, []))
+        self.assertEqual(
+            broker.get_events("resource", 0),
+            (2, [{"upload_state": "processing"}, {"upload_state": "ready"}]),
+        )
+        self.assertEqual(
+            broker.get_events("resource", 1), (2, [{"upload_state": "ready"}])
+        )
+        self.assertEqual(broker.get_events("resource", 2), (2, []))
+
+        # Waiting returns at once if events were missed or if the channel was reset
+        self.assertEqual(
+            broker.wait("resource", 1, 10), (2, [{"upload_state": "ready"}])
+        )
+        self.assertEqual(broker.wait("resource", 5, 10), (2, []))
+
+        # Waiting without events returns after the timeout
+        start = time.monotonic()
+        self.assertEqual(broker.wait("resource", 2, 0.1), (2, []))
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+        # A waiting client receives the events published by another thread
+        timer = threading.Timer(
+            0.05, broker.publish, ["resource", {"upload_state": "pending"}]
+        )
+        timer.start()
+        self.assertEqual(
+            broker.wait("resource", 2, 10), (3, [{"upload_state": "pending"}])
+        )
+        timer.join()
+
+    def test_api_upload_state_events_in_process_broker(self):
+        """The in-process broker should deliver the events published in the process."""
+        self._test_broker(notifications.InProcessBroker())
+
+    @override_settings(UPLOAD_STATE_NOTIFICATIONS_POLL_INTERVAL=0.01)
+    def test_api_upload_state_events_cache_broker(self):
+        """The cache broker should deliver the events published through the cache."""
+        self._test_broker(notifications.CacheBroker())
+
+        # Events published by another process are received
+        self.assertEqual(
+            notifications.CacheBroker().get_events("resource", 2),
+            (3, [{"upload_state": "pending"}]),
+        )
+
+    def test_api_upload_state_events_broker_setting(self):
+        """The broker should be shared by the process until its setting changes."""
+        broker = notifications.get_broker()
+        self.assertIsInstance(broker, notifications.InProcessBroker)
+        self.assertIs(notifications.get_broker(), broker)
+
+        with override_settings(
+            UPLOAD_STATE_NOTIFICATIONS_BROKER="marsha.core.notifications.CacheBroker"
+        ):
+            self.assertIsInstance(notifications.get_broker(), notifications.CacheBroker)
+
+
+@override_settings(
+    UPDATE_STATE_SHARED_SECRETS=["shared secret"],
+    UPLOAD_STATE_NOTIFICATIONS_TIMEOUT=0.1,
+)
+class UploadStateEventsAPITest(TestCase):
+    """Test the API waiting for the upload state changes of a resource."""
+
+    def setUp(self):
+        """Start each test with a new broker."""
+        super().setUp()
+        notifications._broker = None  # pylint: disable=protected-access
+        self.video = VideoFactory(id="f87b5f26-da60-49f2-9d71-a816e68a207f")
+
+    def _get(self, since=None, roles=None):
+        """Get the upload state events of the video."""
+        jwt_token = AccessToken()
+        jwt_token.payload["resource_id"] = str(self.video.id)
+        jwt_token.payload["roles"] = roles or [
+            random.choice(["instructor", "administrator"])
+        ]
+        jwt_token.payload["permissions"] = {"can_update": True}
+        return self.client.get(
+            "/api/upload-state-events",
+            {} if since is None else {"since": since},
+            HTTP_AUTHORIZATION="Bearer {!s}".format(jwt_token),
+        )
+
+    def test_api_upload_state_events_anonymous_or_student(self):
+        """Only instructors and administrators of the resource should receive its events."""
+        response = self.client.get("/api/upload-state-events")
+        self.assertEqual(response.status_code, 401)
+
+        response = self._get(roles=["student"])
+        self.assertEqual(response.status_code, 403)
+
+    def test_api_upload_state_events_invalid_since(self):
+        """The version seen by the client should be a positive integer."""
+        for since in ["-1", "abc"]:
+            response = self._get(since)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(
+                json.loads(response.content),
+                {"since": ["A positive integer is required."]},
+            )
+
+    def test_api_upload_state_events_update_state(self):
+        """The state updates sent by AWS should be delivered to the clients of the resource."""
+        response = self._get()
+        self.assertEqual(json.loads(response.content), {"version": 0, "events": []})
+
+        # Waiting without events returns after the timeout
+        response = self._get(0)
+        self.assertEqual(json.loads(response.content), {"version": 0, "events": []})
+
+        timed_text_track = TimedTextTrackFactory(video=self.video)
+        video_key = "{video!s}/video/{video!s}/1533686400".format(video=self.video.pk)
+        track_key = "{!s}/timedtexttrack/{!s}/1533686400_fr_st".format(
+            self.video.pk, timed_text_track.pk
+        )
+        with execute_on_commit_callbacks():
+            self.client.post(
+                "/api/update-state",
+                {"key": video_key, "state": "processing", "signature": sign(video_key)},
+            )
+            self.client.post(
+                "/api/update-state/bulk",
+                data=json.dumps(
+                    [
+                        {
+                            "key": video_key,
+                            "state": "ready",
+                            "signature": sign(video_key),
+                        },
+                        {
+                            "key": track_key,
+                            "state": "ready",
+                            "signature": sign(track_key),
+                        },
+                    ]
+                ),
+                content_type="application/json",
+            )
+            # Ignored updates are not published
+            self.client.post(
+                "/api/update-state",
+                {"key": video_key, "state": "error", "signature": sign(video_key)},
+            )
+            # The updates of other resources are not delivered
+            other_video = VideoFactory()
+            other_key = "{video!s}/video/{video!s}/1533686400".format(
+                video=other_video.pk
+            )
+            self.client.post(
+                "/api/update-state",
+                {"key": other_key, "state": "ready", "signature": sign(other_key)},
+            )
+
+        response = self._get(0)
+
+        self.assertEqual(response.status_code, 200)
+        uploaded_on = datetime(2018, 8, 8, tzinfo=pytz.utc).isoformat()
+        self.assertEqual(
+            json.loads(response.content),
+            {
+                "version": 3,
+                "events": [
+                    {
+                        "id": str(self.video.pk),
+                        "model": "video",
+                        "upload_state": "processing",
+                    },
+                    {
+                        "id": str(self.video.pk),
+                        "model": "video",
+                        "upload_state": "ready",
+                        "uploaded_on": uploaded_on,
+                    },
+                    {
+                        "id": str(timed_text_track.pk),
+                        "model": "timedtexttrack",
+                        "upload_state": "ready",
+                        "uploaded_on": uploaded_on,
+                    },
+                ],
+            },
+        )
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+        UPLOAD_STATE_NOTIFICATIONS_BROKER="marsha.core.notifications.CacheBroker",
+    )
+    def test_api_upload_state_events_update_state_dummy_cache(self):
+        """State updates should be applied even if the cache broker can't publish them."""
+        video_key = "{video!s}/video/{video!s}/1533686400".format(video=self.video.pk)
+        with self.assertLogs(
+            "marsha.core.notifications", "WARNING"
+        ), execute_on_commit_callbacks():
+            response = self.client.post(
+                "/api/update-state",
+                {"key": video_key, "state": "processing", "signature": sign(video_key)},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Video.objects.get().upload_state, "processing")
+
+        with self.assertLogs(
+            "marsha.core.notifications", "WARNING"
+        ), execute_on_commit_callbacks():
+            response = self.client.post(
+                "/api/update-state/bulk",
+                data=json.dumps(
+                    [{"key": video_key, "state": "ready", "signature": sign(video_key)}]
+                ),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Video.objects.get().upload_state, "ready")
+
+    def test_api_upload_state_events_broker_failure(self):
+        """A failure of the broker should be logged once the state update is committed."""
+        video_key = "{video!s}/video/{video!s}/1533686400".format(video=self.video.pk)
+        with mock.patch.object(
+            notifications.InProcessBroker, "publish", side_effect=ConnectionError
+        ) as mock_publish:
+            response = self.client.post(
+                "/api/update-state",
+                {"key": video_key, "state": "processing", "signature": sign(video_key)},
+            )
+            # Nothing is published before the transaction is committed
+            mock_publish.assert_not_called()
+
+            with self.assertLogs(
+                "marsha.core.notifications", "ERROR"
+            ), execute_on_commit_callbacks():
+                response = self.client.post(
+                    "/api/update-state",
+                    {"key": video_key, "state": "ready", "signature": sign(video_key)},
+                )
+            mock_publish.assert_called_once()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Video.objects.get().upload_state, "ready")
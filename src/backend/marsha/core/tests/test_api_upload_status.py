@@ -0,0 +1,114 @@
+"""Tests for the upload status endpoints of the API of the Marsha project."""
+from datetime import datetime
+import json
+import random
+
+from django.test import TestCase
+
+import pytz
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ..factories import (
+    DocumentFactory,
+    ThumbnailFactory,
+    TimedTextTrackFactory,
+    VideoFactory,
+)
+
+
+class UploadStatusAPITest(TestCase):
+    """Test the status action of the videos, documents, timed text tracks and thumbnails."""
+
+    def _get_status(self, obj, resource, etag=None, roles=None):
+        """Get the upload status of an object with a JWT token for a resource."""
+        jwt_token = AccessToken()
+        jwt_token.payload["resource_id"] = str(resource.id)
+        jwt_token.payload["roles"] = roles or [
+            random.choice(["instructor", "administrator"])
+        ]
+        jwt_token.payload["permissions"] = {"can_update": True}
+        headers = {"HTTP_AUTHORIZATION": "Bearer {!s}".format(jwt_token)}
+        if etag:
+            headers["HTTP_IF_NONE_MATCH"] = etag
+        return self.client.get(
+            "/api/{:s}/{!s}/status/".format(obj.RESOURCE_NAME, obj.id), **headers
+        )
+
+    def _get_objects(self, **kwargs):
+        """Create an object of each kind along with its resource."""
+        video = VideoFactory(**kwargs)
+        document = DocumentFactory(**kwargs)
+        return [
+            (video, video),
+            (document, document),
+            (TimedTextTrackFactory(video=video, **kwargs), video),
+            (ThumbnailFactory(video=video, **kwargs), video),
+        ]
+
+    def test_api_upload_status_ready(self):
+        """The upload status should be read in one query without signing any url."""
+        for obj, resource in self._get_objects(
+            upload_state="ready", uploaded_on=datetime(2018, 8, 8, tzinfo=pytz.utc)
+        ):
+            with self.assertNumQueries(1):
+                response = self._get_status(obj, resource)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                json.loads(response.content),
+                {
+                    "active_stamp": "1533686400",
+                    "is_ready_to_show": True,
+                    "upload_state": "ready",
+                },
+            )
+            self.assertEqual(response["ETag"], '"ready-1533686400"')
+
+    def test_api_upload_status_pending(self):
+        """Objects not uploaded yet should have no active stamp."""
+        for obj, resource in self._get_objects():
+            response = self._get_status(obj, resource)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                json.loads(response.content),
+                {
+                    "active_stamp": None,
+                    "is_ready_to_show": False,
+                    "upload_state": "pending",
+                },
+            )
+            self.assertEqual(response["ETag"], '"pending-"')
+
+    def test_api_upload_status_not_modified(self):
+        """A client sending the ETag of the current status should get a 304 response."""
+        for obj, resource in self._get_objects(upload_state="processing"):
+            response = self._get_status(
+                obj, resource, etag='"ready-1533686400", "processing-"'
+            )
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b"")
+            self.assertEqual(response["ETag"], '"processing-"')
+
+            # The status changed
+            response = self._get_status(obj, resource, etag='"pending-"')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content)["upload_state"], "processing")
+
+    def test_api_upload_status_other_resource(self):
+        """The status of an object should not be readable with the token of another resource."""
+        other_video = VideoFactory()
+        for obj, _resource in self._get_objects():
+            response = self._get_status(obj, other_video)
+            self.assertEqual(response.status_code, 404)
+
+    def test_api_upload_status_student_or_anonymous(self):
+        """Students and anonymous users should not be allowed to read the upload status."""
+        for obj, resource in self._get_objects():
+            response = self._get_status(obj, resource, roles=["student"])
+            self.assertEqual(response.status_code, 403)
+
+            response = self.client.get(
+                "/api/{:s}/{!s}/status/".format(obj.RESOURCE_NAME, obj.id)
+            )
+            self.assertEqual(response.status_code, 401)
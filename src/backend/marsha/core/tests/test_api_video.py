@@ -5,6 +5,7 @@ import json
 import random
 from unittest import mock
 
+from django.core.cache import cache
 from django.test import TestCase, override_settings
 
 import pytz
@@ -18,6 +19,7 @@ from ..factories import (
     VideoFactory,
 )
 from ..models import Video
+from ..utils import cloudfront_utils
 
 
 RSA_KEY_MOCK = b"""
@@ -51,7 +53,7 @@ ASOu/Da3/eg8PI5Rsh6ubNVlEAMQdDFhL/TpfaHqSwim6mxbrQ==
 """
 
 # We don't enforce arguments documentation in tests
-# pylint: disable=unused-argument
+# pylint: disable=too-many-lines,unused-argument
 
 
 class VideoAPITest(TestCase):
@@ -342,6 +344,98 @@ class VideoAPITest(TestCase):
             ),
         )
 
+    @override_settings(
+        CLOUDFRONT_SIGNED_URLS_ACTIVE=True,
+        CLOUDFRONT_SIGNED_URLS_WILDCARD_POLICY=True,
+        CLOUDFRONT_ACCESS_KEY_ID="cloudfront-access-key-id",
+    )
+    @mock.patch("builtins.open", new_callable=mock.mock_open, read_data=RSA_KEY_MOCK)
+    def test_api_video_read_detail_token_user_signed_urls_wildcard_policy(
+        self, mock_open
+    ):
+        """All the mp4 urls of a video should share one signed wildcard policy."""
+        cache.clear()
+        video = VideoFactory(
+            pk="a2f27fde-973a-4e89-8dca-cc59e01d255c",
+            uploaded_on=datetime(2018, 8, 8, tzinfo=pytz.utc),
+            upload_state="ready",
+            playlist__title="foo",
+        )
+        jwt_token = AccessToken()
+        jwt_token.payload["resource_id"] = str(video.id)
+        jwt_token.payload["roles"] = [random.choice(["instructor", "administrator"])]
+        jwt_token.payload["permissions"] = {"can_update": True}
+
+        # fix the time so that the url signature is deterministic and can be checked
+        now = datetime(2018, 8, 8, tzinfo=pytz.utc)
+        with mock.patch.object(timezone, "now", return_value=now), mock.patch.object(
+            cloudfront_utils, "rsa_signer", wraps=cloudfront_utils.rsa_signer
+        ) as mock_rsa_signer:
+            response = self.client.get(
+                "/api/videos/{!s}/".format(video.id),
+                HTTP_AUTHORIZATION="Bearer {!s}".format(jwt_token),
+            )
+        self.assertEqual(response.status_code, 200)
+        content = json.loads(response.content)
+
+        # The policy is signed only once for all resolutions
+        self.assertEqual(mock_rsa_signer.call_count, 1)
+        params = (
+            "Policy=eyJTdGF0ZW1lbnQiOlt7IlJlc291cmNlIjoiaHR0cHM6Ly9hYmMuY2xvdWRmcm9udC5uZX"
+            "QvYTJmMjdmZGUtOTczYS00ZTg5LThkY2EtY2M1OWUwMWQyNTVjLyoiLCJDb25kaXRpb24iOnsiRGF0"
+            "ZUxlc3NUaGFuIjp7IkFXUzpFcG9jaFRpbWUiOjE1MzM2OTM2MDB9fX1dfQ__&Signature="
+            "DMuAMeYCa4sslOKW7X4R5kXJlYt0k8X49j-4h0x-DTkKN7cYKyDVmsUyEKn1kVBMZLQC1GwnnNjOpbsv"
+            "yg6hKo7cskwn-zkEr~FMfpzO3fAh6PHDqCJa7pBf8iiykCtj~Xm3yF0ATesAnuVda1jAmExM3j43YYFs"
+            "p2ovU9tXRfeZTD8yJ9QXdcSd6phfPNSOE091Bc1OxhBycMjQu7UgYsYYKRQg6tmizzYzv30jp5dNVKh8"
+            "DPREd1hL3V1O1XnqrCxI1WFJ-L680yBs3DzjJyiEeUWsBL2PcjSExKqa0YZkEVhN3N5jYwxmFxWiox1D"
+            "jBeQg5~mWVF6Of~-xr0XrQ__"
+            "&Key-Pair-Id=cloudfront-access-key-id"
+        )
+        for resolution in ["144", "240", "480", "720", "1080"]:
+            self.assertEqual(
+                content["urls"]["mp4"][resolution],
+                (
+                    "https://abc.cloudfront.net/a2f27fde-973a-4e89-8dca-cc59e01d255c/mp4/"
+                    "1533686400_{:s}.mp4?response-content-disposition=attachment%3B+"
+                    "filename%3Dfoo_1533686400.mp4&{:s}"
+                ).format(resolution, params),
+            )
+
+    def test_api_video_read_detail_token_user_nb_queries(self):
+        """The number of queries should not depend on the number of timed text tracks."""
+        jwt_token = AccessToken()
+        jwt_token.payload["roles"] = [random.choice(["instructor", "administrator"])]
+        jwt_token.payload["permissions"] = {"can_update": True}
+
+        for nb_tracks in [1, 4]:
+            video = VideoFactory(
+                uploaded_on=datetime(2018, 8, 8, tzinfo=pytz.utc), upload_state="ready"
+            )
+            ThumbnailFactory(
+                video=video,
+                uploaded_on=datetime(2018, 8, 8, tzinfo=pytz.utc),
+                upload_state="ready",
+            )
+            for language in ["fr", "en", "de", "es"][:nb_tracks]:
+                TimedTextTrackFactory(
+                    video=video,
+                    language=language,
+                    uploaded_on=datetime(2018, 8, 8, tzinfo=pytz.utc),
+                    upload_state="ready",
+                )
+            jwt_token.payload["resource_id"] = str(video.id)
+
+            # One query for the video, its playlist and its thumbnail + one for the tracks
+            with self.assertNumQueries(2):
+                response = self.client.get(
+                    "/api/videos/{!s}/".format(video.id),
+                    HTTP_AUTHORIZATION="Bearer {!s}".format(jwt_token),
+                )
+            self.assertEqual(response.status_code, 200)
+            content = json.loads(response.content)
+            self.assertEqual(len(content["timed_text_tracks"]), nb_tracks)
+            self.assertIsNotNone(content["thumbnail"]["urls"])
+
     def test_api_video_read_detail_staff_or_user(self):
         """Users authenticated via a session should not be allowed to read a video detail."""
         for user in [UserFactory(), UserFactory(is_staff=True)]:
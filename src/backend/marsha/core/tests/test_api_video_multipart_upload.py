@@ -0,0 +1,363 @@
+"""Tests for the multipart upload endpoints of the Video API of the Marsha project."""
+from datetime import datetime
+import json
+import random
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from django.test import TestCase
+
+from botocore.stub import Stubber
+import pytz
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .. import defaults
+from ..api import timezone
+from ..factories import VideoFactory
+from ..utils import s3_utils
+
+
+VIDEO_ID = "27a23f52-3379-46a2-94fa-697b59cfe3c7"
+KEY = "{0:s}/video/{0:s}/1533686400".format(VIDEO_ID)
+
+
+class VideoMultipartUploadAPITest(TestCase):
+    """Test the multipart upload of a video source.
+
+    AWS S3 is replaced by a stub of the S3 client checking the requests it receives and
+    answering them with the responses expected from AWS.
+    """
+
+    def setUp(self):
+        """Create a video and a token allowing to upload its source."""
+        super().setUp()
+        self.video = VideoFactory(
+            id=VIDEO_ID, upload_state=random.choice(["ready", "error"])
+        )
+        jwt_token = AccessToken()
+        jwt_token.payload["resource_id"] = VIDEO_ID
+        jwt_token.payload["roles"] = [random.choice(["instructor", "administrator"])]
+        jwt_token.payload["permissions"] = {"can_update": True}
+        self.authorization = "Bearer {!s}".format(jwt_token)
+
+    def _post(self, action, data, video_id=VIDEO_ID):
+        """Post data to a multipart upload endpoint of a video."""
+        return self.client.post(
+            "/api/videos/{!s}/{:s}/".format(video_id, action),
+            data=json.dumps(data),
+            content_type="application/json",
+            HTTP_AUTHORIZATION=self.authorization,
+        )
+
+    def test_api_video_multipart_upload_initiate(self):
+        """Initiating a multipart upload should create it on S3 and reset the upload state."""
+        now = datetime(2018, 8, 8, tzinfo=pytz.utc)
+        with Stubber(s3_utils.get_s3_client()) as stubber:
+            stubber.add_response(
+                "create_multipart_upload",
+                {"Bucket": "test-marsha-source", "Key": KEY, "UploadId": "upload-1"},
+                {
+                    "ACL": "private",
+                    "Bucket": "test-marsha-source",
+                    "ContentType": "video/mp4",
+                    "Key": KEY,
+                },
+            )
+            with mock.patch.object(timezone, "now", return_value=now):
+                response = self._post(
+                    "initiate-multipart-upload", {"mimetype": "video/mp4"}
+                )
+            stubber.assert_no_pending_responses()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content),
+            {
+                "key": KEY,
+                "max_file_size": defaults.VIDEO_SOURCE_MULTIPART_MAX_SIZE,
+                "part_size": defaults.VIDEO_MULTIPART_PART_SIZE,
+                "stamp": "1533686400",
+                "upload_id": "upload-1",
+            },
+        )
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.upload_state, "pending")
+
+    def test_api_video_multipart_upload_initiate_not_a_video(self):
+        """Only videos can be uploaded."""
+        with Stubber(s3_utils.get_s3_client()):
+            response = self._post(
+                "initiate-multipart-upload", {"mimetype": "application/pdf"}
+            )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("mimetype", json.loads(response.content))
+
+    def test_api_video_multipart_upload_read_only(self):
+        """An instructor with read_only set to true should not be able to upload a video."""
+        jwt_token = AccessToken()
+        jwt_token.payload["resource_id"] = VIDEO_ID
+        jwt_token.payload["roles"] = [random.choice(["instructor", "administrator"])]
+        jwt_token.payload["permissions"] = {"can_update": False}
+        self.authorization = "Bearer {!s}".format(jwt_token)
+
+        for action in [
+            "initiate-multipart-upload",
+            "presign-multipart-upload-parts",
+            "list-multipart-upload-parts",
+            "complete-multipart-upload",
+            "abort-multipart-upload",
+        ]:
+            response = self._post(action, {})
+            self.assertEqual(response.status_code, 403)
+
+    def test_api_video_multipart_upload_other_video(self):
+        """The token of a video should not allow to upload the source of another video."""
+        other_video = VideoFactory()
+        with Stubber(s3_utils.get_s3_client()):
+            response = self._post(
+                "presign-multipart-upload-parts",
+                {"stamp": "1533686400", "upload_id": "upload-1", "part_numbers": [1]},
+                video_id=other_video.id,
+            )
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_api_video_multipart_upload_presign_parts(self):
+        """The urls of the parts should be presigned locally for the key of the video."""
+        with Stubber(s3_utils.get_s3_client()) as stubber:
+            response = self._post(
+                "presign-multipart-upload-parts",
+                {
+                    "stamp": "1533686400",
+                    "upload_id": "upload-1",
+                    "part_numbers": [1, 2],
+                },
+            )
+            # No request is sent to AWS S3
+            stubber.assert_no_pending_responses()
+
+        self.assertEqual(response.status_code, 200)
+        urls = json.loads(response.content)["urls"]
+        self.assertEqual(set(urls), {"1", "2"})
+        url = urlparse(urls["2"])
+        self.assertTrue(url.path.endswith(KEY))
+        query = parse_qs(url.query)
+        self.assertEqual(query["partNumber"], ["2"])
+        self.assertEqual(query["uploadId"], ["upload-1"])
+        self.assertEqual(query["X-Amz-Algorithm"], ["AWS4-HMAC-SHA256"])
+        self.assertEqual(query["X-Amz-Expires"], ["86400"])
+
+    def test_api_video_multipart_upload_presign_parts_stamp(self):
+        """The stamp should be a timestamp so the key can't target another object."""
+        response = self._post(
+            "presign-multipart-upload-parts",
+            {"stamp": "../../other", "upload_id": "upload-1", "part_numbers": [1]},
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("stamp", json.loads(response.content))
+
+    def test_api_video_multipart_upload_presign_parts_limits(self):
+        """The number of urls presigned at once and the part numbers should be limited."""
+        response = self._post(
+            "presign-multipart-upload-parts",
+            {
+                "stamp": "1533686400",
+                "upload_id": "upload-1",
+                "part_numbers": list(
+                    range(1, defaults.MULTIPART_UPLOAD_MAX_PART_URLS + 2)
+                ),
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("part_numbers", json.loads(response.content))
+
+        max_parts = -(
+            -defaults.VIDEO_SOURCE_MULTIPART_MAX_SIZE
+            // defaults.VIDEO_MULTIPART_PART_SIZE
+        )
+        response = self._post(
+            "presign-multipart-upload-parts",
+            {
+                "stamp": "1533686400",
+                "upload_id": "upload-1",
+                "part_numbers": [max_parts + 1],
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            json.loads(response.content),
+            {"part_numbers": ["Part numbers can't exceed {:d}.".format(max_parts)]},
+        )
+
+    def test_api_video_multipart_upload_list_parts(self):
+        """The parts already uploaded should be listed to resume an upload."""
+        with Stubber(s3_utils.get_s3_client()) as stubber:
+            stubber.add_response(
+                "list_parts",
+                {
+                    "Parts": [
+                        {"PartNumber": 1, "ETag": '"etag-1"', "Size": 100},
+                        {"PartNumber": 3, "ETag": '"etag-3"', "Size": 50},
+                    ]
+                },
+                {"Bucket": "test-marsha-source", "Key": KEY, "UploadId": "upload-1"},
+            )
+            response = self._post(
+                "list-multipart-upload-parts",
+                {"stamp": "1533686400", "upload_id": "upload-1"},
+            )
+            stubber.assert_no_pending_responses()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content),
+            {
+                "parts": [
+                    {"part_number": 1, "etag": '"etag-1"', "size": 100},
+                    {"part_number": 3, "etag": '"etag-3"', "size": 50},
+                ]
+            },
+        )
+
+    def test_api_video_multipart_upload_complete(self):
+        """Completing an upload should assemble the parts in order on S3."""
+        with Stubber(s3_utils.get_s3_client()) as stubber:
+            stubber.add_response(
+                "list_parts",
+                {
+                    "Parts": [
+                        {"PartNumber": 1, "ETag": '"etag-1"', "Size": 100},
+                        {"PartNumber": 2, "ETag": '"etag-2"', "Size": 50},
+                    ]
+                },
+                {"Bucket": "test-marsha-source", "Key": KEY, "UploadId": "upload-1"},
+            )
+            stubber.add_response(
+                "complete_multipart_upload",
+                {"Bucket": "test-marsha-source", "Key": KEY},
+                {
+                    "Bucket": "test-marsha-source",
+                    "Key": KEY,
+                    "MultipartUpload": {
+                        "Parts": [
+                            {"ETag": '"etag-1"', "PartNumber": 1},
+                            {"ETag": '"etag-2"', "PartNumber": 2},
+                        ]
+                    },
+                    "UploadId": "upload-1",
+                },
+            )
+            response = self._post(
+                "complete-multipart-upload",
+                {
+                    "stamp": "1533686400",
+                    "upload_id": "upload-1",
+                    "parts": [
+                        {"part_number": 2, "etag": '"etag-2"'},
+                        {"part_number": 1, "etag": '"etag-1"'},
+                    ],
+                },
+            )
+            stubber.assert_no_pending_responses()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {"key": KEY})
+
+    def test_api_video_multipart_upload_complete_duplicate_parts(self):
+        """A part can't be listed twice when completing an upload."""
+        response = self._post(
+            "complete-multipart-upload",
+            {
+                "stamp": "1533686400",
+                "upload_id": "upload-1",
+                "parts": [
+                    {"part_number": 1, "etag": '"etag-1"'},
+                    {"part_number": 1, "etag": '"etag-2"'},
+                ],
+            },
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            json.loads(response.content),
+            {"parts": ["Each part number must be unique."]},
+        )
+
+    def test_api_video_multipart_upload_complete_too_large(self):
+        """An upload exceeding the maximum size should be aborted instead of completed."""
+        with Stubber(s3_utils.get_s3_client()) as stubber:
+            stubber.add_response(
+                "list_parts",
+                {
+                    "Parts": [
+                        {
+                            "PartNumber": 1,
+                            "ETag": '"etag-1"',
+                            "Size": defaults.VIDEO_SOURCE_MULTIPART_MAX_SIZE + 1,
+                        }
+                    ]
+                },
+                {"Bucket": "test-marsha-source", "Key": KEY, "UploadId": "upload-1"},
+            )
+            stubber.add_response(
+                "abort_multipart_upload",
+                {},
+                {"Bucket": "test-marsha-source", "Key": KEY, "UploadId": "upload-1"},
+            )
+            response = self._post(
+                "complete-multipart-upload",
+                {
+                    "stamp": "1533686400",
+                    "upload_id": "upload-1",
+                    "parts": [{"part_number": 1, "etag": '"etag-1"'}],
+                },
+            )
+            stubber.assert_no_pending_responses()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            json.loads(response.content),
+            {
+                "detail": "The video can't exceed {:d} bytes.".format(
+                    defaults.VIDEO_SOURCE_MULTIPART_MAX_SIZE
+                )
+            },
+        )
+
+    def test_api_video_multipart_upload_abort(self):
+        """Aborting an upload should abort it on S3."""
+        with Stubber(s3_utils.get_s3_client()) as stubber:
+            stubber.add_response(
+                "abort_multipart_upload",
+                {},
+                {"Bucket": "test-marsha-source", "Key": KEY, "UploadId": "upload-1"},
+            )
+            response = self._post(
+                "abort-multipart-upload",
+                {"stamp": "1533686400", "upload_id": "upload-1"},
+            )
+            stubber.assert_no_pending_responses()
+
+        self.assertEqual(response.status_code, 204)
+
+    def test_api_video_multipart_upload_unknown_upload(self):
+        """The errors returned by S3 should be forwarded to the client."""
+        with Stubber(s3_utils.get_s3_client()) as stubber:
+            stubber.add_client_error(
+                "abort_multipart_upload",
+                service_error_code="NoSuchUpload",
+                service_message="The specified upload does not exist.",
+                http_status_code=404,
+            )
+            response = self._post(
+                "abort-multipart-upload",
+                {"stamp": "1533686400", "upload_id": "unknown"},
+            )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(
+            json.loads(response.content),
+            {"detail": "The specified upload does not exist.", "code": "NoSuchUpload"},
+        )
@@ -2,14 +2,16 @@
 import json
 from unittest import mock
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
 import requests
 from rest_framework_simplejwt.tokens import AccessToken
 
 from ..exceptions import MissingUserIdError
 from ..factories import VideoFactory
-from ..models import Video
+from ..models import XAPIOutboxStatement
+from .utils import execute_on_commit_callbacks
 
 
 # We don't enforce arguments documentation in tests
@@ -19,6 +21,11 @@ from ..models import Video
 class XAPIStatementApiTest(TestCase):
     """Test the API for the xAPI resource."""
 
+    def setUp(self):
+        """Start each test with an empty cache."""
+        super().setUp()
+        cache.clear()
+
     def test_xapi_statement_api_with_anonymous_user(self):
         """Anonymous users should not be allowed to send xAPI statement."""
         response = self.client.post("/xapi/")
@@ -76,15 +83,10 @@ class XAPIStatementApiTest(TestCase):
             },
         )
 
-    @mock.patch("marsha.core.api.Video.objects.get", side_effect=Video.DoesNotExist)
-    def test_xapi_statement_with_invalid_video(self, video_model_mock):
+    def test_xapi_statement_with_invalid_video(self):
         """The video in the JWT Token does not exist in our database."""
-        video = VideoFactory(
-            playlist__consumer_site__lrs_url="http://lrs.com/data/xAPI",
-            playlist__consumer_site__lrs_auth_token="Basic ThisIsABasicAuth",
-        )
         jwt_token = AccessToken()
-        jwt_token.payload["resource_id"] = str(video.id)
+        jwt_token.payload["resource_id"] = "a2f27fde-973a-4e89-8dca-cc59e01d255c"
         jwt_token.payload["roles"] = ["student"]
 
         data = {
@@ -107,11 +109,8 @@ class XAPIStatementApiTest(TestCase):
 
         self.assertEqual(response.status_code, 404)
 
-    @mock.patch("marsha.core.api.Video.objects.get")
     @mock.patch("marsha.core.api.XAPI")
-    def test_xapi_statement_with_request_error_to_lrs(
-        self, xapi_mock, video_model_mock
-    ):
+    def test_xapi_statement_with_request_error_to_lrs(self, xapi_mock):
         """Sending a request to the LRS fails. The response should reflect this failure."""
         video = VideoFactory(
             playlist__consumer_site__lrs_url="http://lrs.com/data/xAPI",
@@ -137,7 +136,6 @@ class XAPIStatementApiTest(TestCase):
         mock_response.status_code.return_value = 400
 
         exception = requests.exceptions.HTTPError(response=mock_response)
-        video_model_mock.return_value = video
         xapi_instance = xapi_mock.return_value
         xapi_instance.send.side_effect = exception
 
@@ -153,11 +151,8 @@ class XAPIStatementApiTest(TestCase):
             response.json().get("status"), "Impossible to send xAPI request to LRS."
         )
 
-    @mock.patch("marsha.core.api.Video.objects.get")
     @mock.patch("marsha.core.api.XAPI")
-    def test_xapi_statement_with_request_to_lrs_successful(
-        self, xapi_mock, video_model_mock
-    ):
+    def test_xapi_statement_with_request_to_lrs_successful(self, xapi_mock):
         """Successful request should return a 204 status code."""
         video = VideoFactory(
             playlist__consumer_site__lrs_url="http://lrs.com/data/xAPI",
@@ -178,7 +173,6 @@ class XAPIStatementApiTest(TestCase):
             "timestamp": "2018-12-31T16:17:35.717Z",
         }
 
-        video_model_mock.return_value = video
         xapi_instance = xapi_mock.return_value
         xapi_instance.send.return_value = None
 
@@ -191,9 +185,8 @@ class XAPIStatementApiTest(TestCase):
 
         self.assertEqual(response.status_code, 204)
 
-    @mock.patch("marsha.core.api.Video.objects.get")
     @mock.patch("marsha.core.api.XAPI")
-    def test_xapi_statement_with_missing_user_id(self, xapi_mock, video_model_mock):
+    def test_xapi_statement_with_missing_user_id(self, xapi_mock):
         """Missing user_id parameter in JWT will fail request to LRS."""
         video = VideoFactory(
             playlist__consumer_site__lrs_url="http://lrs.com/data/xAPI",
@@ -214,7 +207,6 @@ class XAPIStatementApiTest(TestCase):
             "timestamp": "2018-12-31T16:17:35.717Z",
         }
 
-        video_model_mock.return_value = video
         xapi_instance = xapi_mock.return_value
         xapi_instance.send.side_effect = MissingUserIdError()
 
@@ -229,3 +221,270 @@ class XAPIStatementApiTest(TestCase):
         self.assertEqual(
             response.json().get("status"), "Impossible to identify the actor."
         )
+
+    def test_xapi_statement_context_cached(self):
+        """The video and its consumer site should not be looked up for each statement."""
+        video = VideoFactory(
+            playlist__consumer_site__domain="example.com",
+            playlist__consumer_site__lrs_url="http://lrs.com/data/xAPI",
+            playlist__consumer_site__lrs_auth_token="Basic ThisIsABasicAuth",
+        )
+        jwt_token = AccessToken()
+        jwt_token.payload["resource_id"] = str(video.id)
+        jwt_token.payload["roles"] = ["student"]
+        jwt_token.payload["user_id"] = "foo"
+        jwt_token.payload["course"] = {
+            "school_name": None,
+            "course_name": None,
+            "course_run": None,
+        }
+
+        data = {
+            "verb": {
+                "id": "http://adlnet.gov/expapi/verbs/initialized",
+                "display": {"en-US": "initialized"},
+            },
+            "context": {
+                "extensions": {"https://w3id.org/xapi/video/extensions/volume": 1}
+            },
+            "timestamp": "2018-12-31T16:17:35.717Z",
+        }
+
+        def post_statement():
+            with mock.patch("marsha.core.xapi.requests.Session.post") as mock_post:
+                mock_post.return_value.status_code = 200
+                response = self.client.post(
+                    "/xapi/",
+                    HTTP_AUTHORIZATION="Bearer {!s}".format(jwt_token),
+                    data=json.dumps(data),
+                    content_type="application/json",
+                )
+            self.assertEqual(response.status_code, 204)
+            return mock_post
+
+        with self.assertNumQueries(1):
+            post_statement()
+
+        with self.assertNumQueries(0):
+            mock_post = post_statement()
+        self.assertEqual(mock_post.call_args[0][0], "http://lrs.com/data/xAPI")
+        self.assertEqual(
+            mock_post.call_args[1]["json"]["actor"]["account"]["homePage"],
+            "http://example.com",
+        )
+
+        # Modifying the consumer site invalidates the context of its videos
+        consumer_site = video.playlist.consumer_site
+        consumer_site.lrs_url = "http://lrs.com/other/xAPI"
+        with execute_on_commit_callbacks():
+            consumer_site.save()
+
+        with self.assertNumQueries(1):
+            mock_post = post_statement()
+        self.assertEqual(mock_post.call_args[0][0], "http://lrs.com/other/xAPI")
+
+    def test_xapi_statement_outbox(self):
+        """Statements should be stored in the outbox if the consumer site requires it."""
+        video = VideoFactory(
+            playlist__consumer_site__domain="example.com",
+            playlist__consumer_site__lrs_url="http://lrs.com/data/xAPI",
+            playlist__consumer_site__lrs_auth_token="Basic ThisIsABasicAuth",
+            playlist__consumer_site__lrs_outbox_active=True,
+        )
+        jwt_token = AccessToken()
+        jwt_token.payload["resource_id"] = str(video.id)
+        jwt_token.payload["roles"] = ["student"]
+        jwt_token.payload["user_id"] = "foo"
+        jwt_token.payload["course"] = {
+            "school_name": None,
+            "course_name": None,
+            "course_run": None,
+        }
+
+        data = {
+            "verb": {
+                "id": "http://adlnet.gov/expapi/verbs/initialized",
+                "display": {"en-US": "initialized"},
+            },
+            "context": {
+                "extensions": {"https://w3id.org/xapi/video/extensions/volume": 1}
+            },
+            "timestamp": "2018-12-31T16:17:35.717Z",
+        }
+
+        with mock.patch("marsha.core.xapi.requests.Session.post") as mock_post:
+            response = self.client.post(
+                "/xapi/",
+                HTTP_AUTHORIZATION="Bearer {!s}".format(jwt_token),
+                data=json.dumps(data),
+                content_type="application/json",
+            )
+
+        self.assertEqual(response.status_code, 202)
+        mock_post.assert_not_called()
+        outbox_statement = XAPIOutboxStatement.objects.get()
+        self.assertEqual(outbox_statement.consumer_site, video.playlist.consumer_site)
+        statement = json.loads(outbox_statement.statement)
+        self.assertEqual(statement["timestamp"], "2018-12-31T16:17:35.717000+00:00")
+        self.assertEqual(
+            statement["actor"],
+            {
+                "objectType": "Agent",
+                "account": {"name": "foo", "homePage": "http://example.com"},
+            },
+        )
+        self.assertEqual(statement["object"]["id"], "uuid://{!s}".format(video.id))
+
+
+class XAPIStatementBulkApiTest(TestCase):
+    """Test the API sending several xAPI statements at once."""
+
+    def setUp(self):
+        """Create a video whose consumer site has an LRS and a JWT token to access it."""
+        super().setUp()
+        cache.clear()
+        self.video = VideoFactory(
+            playlist__consumer_site__domain="example.com",
+            playlist__consumer_site__lrs_url="http://lrs.com/data/xAPI",
+            playlist__consumer_site__lrs_auth_token="Basic ThisIsABasicAuth",
+        )
+        self.jwt_token = AccessToken()
+        self.jwt_token.payload["resource_id"] = str(self.video.id)
+        self.jwt_token.payload["roles"] = ["student"]
+        self.jwt_token.payload["user_id"] = "foo"
+        self.jwt_token.payload["course"] = {
+            "school_name": None,
+            "course_name": None,
+            "course_run": None,
+        }
+
+    def _get_statement(self, verb="initialized"):
+        """Not a test but utility method to build a statement payload."""
+        return {
+            "verb": {
+                "id": "http://adlnet.gov/expapi/verbs/{:s}".format(verb),
+                "display": {"en-US": verb},
+            },
+            "context": {
+                "extensions": {"https://w3id.org/xapi/video/extensions/volume": 1}
+            },
+            "timestamp": "2018-12-31T16:17:35.717Z",
+        }
+
+    def _post(self, data):
+        """Not a test but utility method to post statements to the bulk endpoint."""
+        return self.client.post(
+            "/xapi/bulk/",
+            HTTP_AUTHORIZATION="Bearer {!s}".format(self.jwt_token),
+            data=json.dumps(data),
+            content_type="application/json",
+        )
+
+    def test_xapi_statement_bulk_api_with_anonymous_user(self):
+        """Anonymous users should not be allowed to send xAPI statements."""
+        response = self.client.post("/xapi/bulk/")
+        self.assertEqual(response.status_code, 401)
+
+    def test_xapi_statement_bulk_not_a_list(self):
+        """The payload should be a list of statements."""
+        response = self._post(self._get_statement())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {"reason": "A list of statements is expected."}
+        )
+
+    @override_settings(XAPI_BULK_MAX_STATEMENTS=2)
+    def test_xapi_statement_bulk_too_many_statements(self):
+        """The number of statements sent at once should be limited."""
+        response = self._post([self._get_statement()] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {"reason": "Too many statements, the maximum is 2."}
+        )
+
+    def test_xapi_statement_bulk_with_no_lrs_configured(self):
+        """If no LRS configured a 501 status code should be returned."""
+        consumer_site = self.video.playlist.consumer_site
+        consumer_site.lrs_url = ""
+        consumer_site.save()
+
+        response = self._post([self._get_statement()])
+        self.assertEqual(response.status_code, 501)
+
+    def test_xapi_statement_bulk_sent_in_one_request(self):
+        """Valid statements should be sent to the LRS in one request, invalid ones reported."""
+        with mock.patch("marsha.core.xapi.requests.Session.post") as mock_post:
+            mock_post.return_value.status_code = 200
+            with self.assertNumQueries(1):
+                response = self._post(
+                    [
+                        self._get_statement(),
+                        {"foo": "bar"},
+                        self._get_statement("played"),
+                    ]
+                )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            [
+                {"status": 204},
+                {
+                    "status": 400,
+                    "errors": {
+                        "verb": ["This field is required."],
+                        "context": ["This field is required."],
+                        "timestamp": ["This field is required."],
+                    },
+                },
+                {"status": 204},
+            ],
+        )
+        mock_post.assert_called_once()
+        statements = mock_post.call_args[1]["json"]
+        self.assertEqual(
+            [statement["verb"]["display"]["en-US"] for statement in statements],
+            ["initialized", "played"],
+        )
+        # Each statement gets its own id
+        self.assertNotEqual(statements[0]["id"], statements[1]["id"])
+        for statement in statements:
+            self.assertEqual(
+                statement["object"]["id"], "uuid://{!s}".format(self.video.id)
+            )
+
+    def test_xapi_statement_bulk_with_request_error_to_lrs(self):
+        """All the valid statements should be reported as failed if the LRS fails."""
+        with mock.patch(
+            "marsha.core.xapi.requests.Session.post",
+            side_effect=requests.exceptions.ConnectionError(),
+        ), override_settings(XAPI_LRS_MAX_RETRIES=0):
+            response = self._post([self._get_statement(), {"foo": "bar"}])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["status"] for result in response.json()], [501, 400])
+
+    def test_xapi_statement_bulk_outbox(self):
+        """Statements should be stored in the outbox if the consumer site requires it."""
+        consumer_site = self.video.playlist.consumer_site
+        consumer_site.lrs_outbox_active = True
+        consumer_site.save()
+
+        with mock.patch("marsha.core.xapi.requests.Session.post") as mock_post:
+            response = self._post(
+                [self._get_statement(), self._get_statement("played")]
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{"status": 202}, {"status": 202}])
+        mock_post.assert_not_called()
+        statements = [
+            json.loads(outbox_statement.statement)
+            for outbox_statement in XAPIOutboxStatement.objects.filter(
+                consumer_site=consumer_site
+            )
+        ]
+        self.assertEqual(
+            sorted(statement["verb"]["display"]["en-US"] for statement in statements),
+            ["initialized", "played"],
+        )
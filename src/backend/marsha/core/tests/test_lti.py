@@ -3,16 +3,18 @@ from unittest import mock
 from urllib.parse import unquote
 import uuid
 
-from django.test import RequestFactory, TestCase
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
 
 import oauth2
 from oauthlib import oauth1
 from pylti.common import LTIException, LTIOAuthServer
 
 from ..factories import ConsumerSiteLTIPassportFactory, PlaylistLTIPassportFactory
-from ..lti import LTI
+from ..lti import LTI, utils as lti_utils
 from ..lti.utils import get_or_create_resource
 from ..models import Video
+from .utils import execute_on_commit_callbacks
 
 
 # We don't enforce arguments documentation in tests
@@ -26,6 +28,7 @@ class LTITestCase(TestCase):
         """Override the setUp method to instanciate and serve a request factory."""
         super().setUp()
         self.factory = RequestFactory()
+        cache.clear()
 
     def test_lti_request_body(self):
         """Simulate an LTI launch request with oauth in the body.
@@ -187,6 +190,87 @@ class LTITestCase(TestCase):
         self.assertEqual(lti.get_consumer_site(), passport.consumer_site)
         self.assertEqual(mock_verify.call_count, 1)
 
+    @mock.patch.object(LTIOAuthServer, "verify_request", return_value=True)
+    def test_lti_passport_cache(self, mock_verify):
+        """Passports should be resolved from the cache until they are modified."""
+        passport = PlaylistLTIPassportFactory(
+            oauth_consumer_key="ABC123",
+            shared_secret="#Y5$",
+            playlist__consumer_site__domain="example.com",
+        )
+        data = {
+            "resource_link_id": "df7",
+            "context_id": "course-v1:ufr+mathematics+0001",
+            "roles": "Student",
+            "oauth_consumer_key": "ABC123",
+        }
+
+        def verify():
+            request = self.factory.post(
+                "/", data, HTTP_REFERER="https://example.com/route"
+            )
+            lti = LTI(request, uuid.uuid4())
+            lti.verify()
+            return lti
+
+        with self.assertNumQueries(1):
+            lti = verify()
+        self.assertEqual(lti.get_consumer_site(), passport.playlist.consumer_site)
+
+        with self.assertNumQueries(0):
+            lti = verify()
+        self.assertEqual(lti.get_consumer_site(), passport.playlist.consumer_site)
+
+        # Only primitive values are cached, the credentials of the LRS are loaded if needed
+        self.assertEqual(
+            cache.get("lti_passport|ABC123"),
+            {
+                "oauth_consumer_key": "ABC123",
+                "shared_secret": "#Y5$",
+                "consumer_site": {
+                    "id": str(passport.playlist.consumer_site.id),
+                    "name": passport.playlist.consumer_site.name,
+                    "domain": "example.com",
+                    "video_show_download_default": str(
+                        passport.playlist.consumer_site.video_show_download_default
+                    ),
+                },
+            },
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                lti.get_consumer_site().lrs_auth_token,
+                passport.playlist.consumer_site.lrs_auth_token,
+            )
+
+        # Modifying the consumer site of the passport should invalidate the cache
+        consumer_site = passport.playlist.consumer_site
+        consumer_site.video_show_download_default = True
+        with execute_on_commit_callbacks():
+            consumer_site.save()
+        with self.assertNumQueries(1):
+            lti = verify()
+        self.assertTrue(lti.get_consumer_site().video_show_download_default)
+
+        # Disabling the passport should invalidate the cache
+        passport.is_enabled = False
+        with execute_on_commit_callbacks():
+            passport.save()
+        with self.assertRaises(LTIException):
+            verify()
+
+    @override_settings(LTI_PASSPORT_CACHE_DURATION=3600)
+    def test_lti_passport_cache_timeout(self):
+        """Passports should be cached for a short time if the cache is local to a process."""
+        # The tests use a local memory cache
+        self.assertEqual(lti_utils.get_passport_cache_timeout(), 60)
+
+        with mock.patch.object(lti_utils, "LocMemCache", type(None)):
+            self.assertEqual(lti_utils.get_passport_cache_timeout(), 3600)
+
+        with override_settings(LTI_PASSPORT_CACHE_DURATION=30):
+            self.assertEqual(lti_utils.get_passport_cache_timeout(), 30)
+
     @mock.patch.object(LTIOAuthServer, "verify_request", return_value=True)
     def test_lti_passport_consumer_site_video_show_download_default_False(
         self, mock_verify
@@ -3,7 +3,9 @@ import random
 from unittest import mock
 import uuid
 
+from django.db import connection
 from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from pylti.common import LTIOAuthServer
@@ -16,8 +18,13 @@ from ..factories import (
     VideoFactory,
 )
 from ..lti import LTI
-from ..lti.utils import PortabilityError, get_or_create_resource
-from ..models import ConsumerSitePortability, Document, Playlist, Video
+from ..lti.utils import (
+    PortabilityError,
+    get_or_create_resource,
+    invalidate_reachable_from,
+)
+from ..models import ConsumerSite, ConsumerSitePortability, Document, Playlist, Video
+from .utils import execute_on_commit_callbacks
 
 
 # We don't enforce arguments documentation in tests
@@ -1584,3 +1591,66 @@ class PortabilityLTITestCase(TestCase):
         The document should not be retrieved if a student tries to access an unknown document.
         """
         self._test_lti_get_resource_wrong_lti_id_student(DocumentFactory, Document)
+
+    @mock.patch.object(LTIOAuthServer, "verify_request", return_value=True)
+    def test_lti_get_resource_reachable_from_cache(self, mock_verify):
+        """Consumer sites portability should be cached and refreshed when it changes.
+
+        With thousands of portability links, the resource should be retrieved in one query
+        that does not join the portability table.
+        """
+        consumer_site = ConsumerSiteFactory(domain="example.com")
+        passport = ConsumerSiteLTIPassportFactory(consumer_site=consumer_site)
+        video = VideoFactory(
+            playlist__is_portable_to_consumer_site=False, upload_state="ready"
+        )
+
+        other_sites = ConsumerSite.objects.bulk_create(
+            ConsumerSite(name="site {:d}".format(i), domain="site{:d}.com".format(i))
+            for i in range(2000)
+        )
+        ConsumerSitePortability.objects.bulk_create(
+            ConsumerSitePortability(source_site=site, target_site=consumer_site)
+            for site in other_sites
+        )
+
+        data = {
+            "resource_link_id": video.lti_id,
+            "context_id": video.playlist.lti_id,
+            "roles": "Student",
+            "oauth_consumer_key": passport.oauth_consumer_key,
+        }
+        request = self.factory.post("/", data, HTTP_REFERER="https://example.com/route")
+        lti = LTI(request, video.pk)
+        lti.verify()
+
+        # Bulk creation does not send signals
+        invalidate_reachable_from([consumer_site.id])
+        self.assertIsNone(get_or_create_resource(Video, lti))
+
+        # Creating a portability link refreshes the cache
+        with execute_on_commit_callbacks():
+            portability = ConsumerSitePortability.objects.create(
+                source_site=video.playlist.consumer_site, target_site=consumer_site
+            )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_or_create_resource(Video, lti), video)
+        self.assertEqual(len(queries), 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_or_create_resource(Video, lti), video)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("consumersite_portability", queries[0]["sql"])
+
+        # Deleting the portability link refreshes the cache
+        with execute_on_commit_callbacks():
+            portability.delete()
+        self.assertIsNone(get_or_create_resource(Video, lti))
+
+        # So does removing the portability with the many-to-many relation
+        with execute_on_commit_callbacks():
+            consumer_site.reachable_from.add(video.playlist.consumer_site)
+        self.assertEqual(get_or_create_resource(Video, lti), video)
+        with execute_on_commit_callbacks():
+            video.playlist.consumer_site.portable_to.remove(consumer_site)
+        self.assertIsNone(get_or_create_resource(Video, lti))
@@ -1,11 +1,16 @@
 """Tests for the models in the ``core`` app of the Marsha project."""
+from datetime import datetime
+from itertools import product
+
 from django.db import transaction
 from django.db.utils import IntegrityError
 from django.test import TestCase
 
+import pytz
 from safedelete.models import SOFT_DELETE_CASCADE
 
 from ..factories import VideoFactory
+from ..models import Video
 
 
 class VideoModelsTestCase(TestCase):
@@ -38,3 +43,24 @@ class VideoModelsTestCase(TestCase):
         # Soft deleted videos should not count for unicity
         video.delete(force_policy=SOFT_DELETE_CASCADE)
         VideoFactory(lti_id=video.lti_id, playlist=video.playlist)
+
+    def test_models_video_upload_state_filter(self):
+        """The upload state filter and its Python version should accept the same updates."""
+        stamps = [None] + [
+            datetime(2018, 8, 8, hour, tzinfo=pytz.utc) for hour in range(3)
+        ]
+        for upload_state, uploaded_on in product(
+            ["pending", "processing", "error", "ready"], stamps
+        ):
+            video = VideoFactory(upload_state=upload_state, uploaded_on=uploaded_on)
+            for state, stamped_on in product(
+                ["processing", "error", "ready"], stamps[1:]
+            ):
+                self.assertEqual(
+                    Video.objects.filter(
+                        Video.get_upload_state_filter(state, stamped_on), pk=video.pk
+                    ).exists(),
+                    Video.is_upload_state_update_allowed(
+                        upload_state, uploaded_on, state, stamped_on
+                    ),
+                )
@@ -116,6 +116,7 @@ class UpdateStateSerializerTest(TestCase):
                 "extension": None,
                 "model_name": "video",
                 "object_id": str(object_id),
+                "resource_id": str(resource_id),
                 "stamp": "1533686400",
                 "uploaded_on": datetime(2018, 8, 8, tzinfo=pytz.utc),
             },
@@ -138,6 +139,7 @@ class UpdateStateSerializerTest(TestCase):
                 "extension": "pdf",
                 "model_name": "document",
                 "object_id": str(object_id),
+                "resource_id": str(resource_id),
                 "stamp": "1533686400",
                 "uploaded_on": datetime(2018, 8, 8, tzinfo=pytz.utc),
             },
@@ -0,0 +1,67 @@
+"""Test the video serializer of the Marsha project."""
+from datetime import datetime
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+import pytz
+
+from ..factories import TimedTextTrackFactory, VideoFactory
+from ..serializers import VideoSerializer
+from ..utils import cloudfront_utils
+from .test_api_video import RSA_KEY_MOCK
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+    CLOUDFRONT_SIGNED_URLS_ACTIVE=True,
+    CLOUDFRONT_SIGNED_URLS_WILDCARD_POLICY=True,
+    CLOUDFRONT_ACCESS_KEY_ID="cloudfront-access-key-id",
+)
+class VideoSerializerTestCase(TestCase):
+    """Test the serialization of the urls of a video."""
+
+    def setUp(self):
+        """Write the private key to a temporary file and start with an empty key cache."""
+        super().setUp()
+        key_file = tempfile.NamedTemporaryFile(delete=False)
+        key_file.write(RSA_KEY_MOCK)
+        key_file.close()
+        self.addCleanup(os.remove, key_file.name)
+        cloudfront_utils.private_key_cache.clear()
+        self.addCleanup(cloudfront_utils.private_key_cache.clear)
+
+        settings_override = override_settings(CLOUDFRONT_PRIVATE_KEY_PATH=key_file.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_serializers_video_wildcard_policy_signed_once(self):
+        """The wildcard policy should be signed once per payload without a shared cache."""
+        video = VideoFactory(uploaded_on=datetime(2018, 8, 8, tzinfo=pytz.utc))
+        for language in ["fr", "en"]:
+            TimedTextTrackFactory(
+                video=video,
+                language=language,
+                uploaded_on=datetime(2018, 8, 8, tzinfo=pytz.utc),
+            )
+
+        for bucket in [0, 600]:
+            with override_settings(
+                CLOUDFRONT_SIGNED_URLS_CACHE_BUCKET=bucket
+            ), mock.patch.object(
+                cloudfront_utils, "rsa_signer", wraps=cloudfront_utils.rsa_signer
+            ) as mock_rsa_signer:
+                data = VideoSerializer(video).data
+
+            self.assertEqual(mock_rsa_signer.call_count, 1)
+            # The urls of the video and of its timed text tracks share the same signature
+            params = {
+                url.split("?", 1)[1].rsplit("Policy=", 1)[1]
+                for url in [
+                    *data["urls"]["mp4"].values(),
+                    *[track["url"] for track in data["timed_text_tracks"]],
+                ]
+            }
+            self.assertEqual(len(params), 1)
@@ -0,0 +1,69 @@
+"""Test the signal handlers of the ``core`` app of the Marsha project."""
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..factories import ConsumerSiteFactory, DocumentFactory, VideoFactory
+from ..models import ConsumerSitePortability, Document, Video
+from ..utils.cache_utils import get_generation
+from .utils import execute_on_commit_callbacks
+
+
+class SignalsTestCase(TestCase):
+    """Test the invalidation of the cached data when objects are modified."""
+
+    def setUp(self):
+        """Start each test with an empty cache."""
+        super().setUp()
+        cache.clear()
+
+    def test_signals_invalidation_on_commit(self):
+        """The application data of a resource should be invalidated once committed."""
+        video = VideoFactory()
+        generation = get_generation(Video, video.pk)
+
+        # The transaction of the test is never committed
+        video.title = "new title"
+        video.save()
+        self.assertEqual(get_generation(Video, video.pk), generation)
+
+        with execute_on_commit_callbacks():
+            video.save()
+        self.assertEqual(get_generation(Video, video.pk), generation + 1)
+
+    def test_signals_portability_invalidates_app_data(self):
+        """Adding or removing a portability should invalidate the resources of the source."""
+        video = VideoFactory()
+        document = DocumentFactory(playlist=video.playlist)
+        other_video = VideoFactory()
+        source_site = video.playlist.consumer_site
+        target_site = ConsumerSiteFactory()
+
+        def assert_invalidated(change):
+            """Apply a change and check which resources were invalidated."""
+            generations = [
+                get_generation(Video, video.pk),
+                get_generation(Document, document.pk),
+                get_generation(Video, other_video.pk),
+            ]
+            with execute_on_commit_callbacks():
+                change()
+            self.assertGreater(get_generation(Video, video.pk), generations[0])
+            self.assertGreater(get_generation(Document, document.pk), generations[1])
+            self.assertEqual(get_generation(Video, other_video.pk), generations[2])
+
+        assert_invalidated(
+            lambda: ConsumerSitePortability.objects.create(
+                source_site=source_site, target_site=target_site
+            )
+        )
+        assert_invalidated(
+            ConsumerSitePortability.objects.get(source_site=source_site).delete
+        )
+
+        # Through the many-to-many relation, from both sides
+        assert_invalidated(lambda: target_site.reachable_from.add(source_site))
+        assert_invalidated(target_site.reachable_from.clear)
+        assert_invalidated(lambda: source_site.portable_to.add(target_site))
+        assert_invalidated(lambda: source_site.portable_to.remove(target_site))
+        source_site.portable_to.add(target_site)
+        assert_invalidated(source_site.portable_to.clear)
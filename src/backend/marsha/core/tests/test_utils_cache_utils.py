@@ -0,0 +1,168 @@
+"""Test the cache utils of the Marsha core app."""
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ..models import Document, Video
+from ..utils import cache_utils
+
+
+RESOURCE_ID = "a2f27fde-973a-4e89-8dca-cc59e01d255c"
+
+
+class CacheUtilsTestCase(TestCase):
+    """Test our cache utils."""
+
+    def setUp(self):
+        """Start each test with an empty cache."""
+        super().setUp()
+        cache.clear()
+
+    def _get_cache_key(self, model=Video, resource_id=RESOURCE_ID, role="student"):
+        """Not a test but utility method to build a cache key."""
+        return cache_utils.get_app_data_cache_key(
+            model, resource_id, domain="example.com", context_id="course", role=role
+        )
+
+    @mock.patch.object(cache_utils, "time", wraps=time)
+    def test_utils_cache_utils_generation_initialization(self, mock_time):
+        """The generation counter of a resource should start at the current time in ms."""
+        mock_time.time.return_value = 1533686400.123
+        self.assertEqual(cache_utils.get_generation(Video, RESOURCE_ID), 1533686400123)
+        self.assertEqual(
+            self._get_cache_key(),
+            "app_data|Video|1533686400123|example.com|course|{:s}|student".format(
+                RESOURCE_ID
+            ),
+        )
+
+    def test_utils_cache_utils_invalidate_app_data(self):
+        """Invalidating a resource should make all its cache keys unreachable at once."""
+        student_key = self._get_cache_key()
+        instructor_key = self._get_cache_key(role="instructor")
+        document_key = self._get_cache_key(model=Document)
+        cache_utils.set_app_data(student_key, "student data")
+        cache_utils.set_app_data(instructor_key, "instructor data")
+        cache_utils.set_app_data(document_key, "document data")
+
+        self.assertEqual(cache.get(self._get_cache_key())[1], "student data")
+
+        cache_utils.invalidate_app_data(Video, RESOURCE_ID)
+
+        self.assertNotEqual(self._get_cache_key(), student_key)
+        self.assertIsNone(cache.get(self._get_cache_key()))
+        self.assertIsNone(cache.get(self._get_cache_key(role="instructor")))
+        # Other resources are not impacted
+        self.assertEqual(
+            cache.get(self._get_cache_key(model=Document))[1], "document data"
+        )
+
+    def test_utils_cache_utils_invalidate_app_data_without_generation(self):
+        """Invalidating a resource for which nothing was cached should not fail."""
+        cache_utils.invalidate_app_data(Video, RESOURCE_ID)
+        self.assertIsNone(
+            cache.get("app_data_generation|Video|{:s}".format(RESOURCE_ID))
+        )
+
+    @override_settings(
+        APP_DATA_CACHE_DURATION=6 * 60 * 60,
+        CLOUDFRONT_SIGNED_URLS_VALIDITY=2 * 60 * 60,
+        CLOUDFRONT_SIGNED_URLS_ACTIVE=True,
+        CLOUDFRONT_SIGNED_COOKIES_ACTIVE=False,
+    )
+    def test_utils_cache_utils_timeout_signed_urls(self):
+        """App data with signed urls should not be cached for more than half their validity."""
+        self.assertEqual(cache_utils.get_app_data_cache_timeout(), 60 * 60)
+
+        with override_settings(APP_DATA_CACHE_DURATION=600):
+            self.assertEqual(cache_utils.get_app_data_cache_timeout(), 600)
+
+        with override_settings(CLOUDFRONT_SIGNED_COOKIES_ACTIVE=True):
+            self.assertEqual(cache_utils.get_app_data_cache_timeout(), 6 * 60 * 60)
+
+        with override_settings(CLOUDFRONT_SIGNED_URLS_ACTIVE=False):
+            self.assertEqual(cache_utils.get_app_data_cache_timeout(), 6 * 60 * 60)
+
+    @override_settings(APP_DATA_CACHE_DURATION=600)
+    def test_utils_cache_utils_get_or_compute_app_data(self):
+        """App data should be computed on a cache miss and served from the cache afterwards."""
+        compute = mock.Mock(return_value="data")
+        cache_key = self._get_cache_key()
+
+        with mock.patch.object(cache_utils, "time", wraps=time) as mock_time:
+            mock_time.time.return_value = 1533686400
+            self.assertEqual(
+                cache_utils.get_or_compute_app_data(cache_key, compute), "data"
+            )
+        self.assertEqual(cache.get(cache_key), (1533686940, "data"))
+        self.assertIsNone(cache.get("{:s}|lock".format(cache_key)))
+
+        with mock.patch.object(cache_utils, "time", wraps=time) as mock_time:
+            mock_time.time.return_value = 1533686939
+            self.assertEqual(
+                cache_utils.get_or_compute_app_data(cache_key, compute), "data"
+            )
+        self.assertEqual(compute.call_count, 1)
+
+    @override_settings(APP_DATA_CACHE_DURATION=600)
+    def test_utils_cache_utils_get_or_compute_app_data_early_recompute(self):
+        """App data close to expiration should be recomputed by one request only."""
+        compute = mock.Mock(return_value="new data")
+        cache_key = self._get_cache_key()
+        cache.set(cache_key, (1533686940, "data"))
+
+        # Another request is already recomputing the value: the cached value is served
+        cache.add("{:s}|lock".format(cache_key), 1)
+        with mock.patch.object(cache_utils, "time", wraps=time) as mock_time:
+            mock_time.time.return_value = 1533686941
+            self.assertEqual(
+                cache_utils.get_or_compute_app_data(cache_key, compute), "data"
+            )
+        compute.assert_not_called()
+
+        # Once the lock is released, the next request recomputes the value
+        cache.delete("{:s}|lock".format(cache_key))
+        with mock.patch.object(cache_utils, "time", wraps=time) as mock_time:
+            mock_time.time.return_value = 1533686941
+            self.assertEqual(
+                cache_utils.get_or_compute_app_data(cache_key, compute), "new data"
+            )
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(cache.get(cache_key), (1533687481, "new data"))
+
+    @mock.patch.object(cache_utils, "time", wraps=time)
+    def test_utils_cache_utils_get_or_compute_app_data_wait_for_lock(self, mock_time):
+        """On a cache miss, requests should wait for the one holding the lock."""
+        compute = mock.Mock(return_value="data")
+        cache_key = self._get_cache_key()
+        cache.add("{:s}|lock".format(cache_key), 1)
+        mock_sleep = mock_time.sleep
+
+        # The request holding the lock caches the value during the second poll
+        def release_lock(_interval):
+            if mock_sleep.call_count == 2:
+                cache_utils.set_app_data(cache_key, "cached data")
+
+        mock_sleep.side_effect = release_lock
+        self.assertEqual(
+            cache_utils.get_or_compute_app_data(cache_key, compute), "cached data"
+        )
+        self.assertEqual(mock_sleep.call_count, 2)
+        compute.assert_not_called()
+
+    @mock.patch.object(cache_utils, "time", wraps=time)
+    def test_utils_cache_utils_get_or_compute_app_data_lock_timeout(self, mock_time):
+        """Requests should compute app data themselves if the lock holder takes too long."""
+        compute = mock.Mock(return_value="data")
+        cache_key = self._get_cache_key()
+        cache.add("{:s}|lock".format(cache_key), 1)
+        mock_sleep = mock_time.sleep
+        mock_sleep.return_value = None
+
+        self.assertEqual(
+            cache_utils.get_or_compute_app_data(cache_key, compute), "data"
+        )
+        self.assertEqual(mock_sleep.call_count, 100)
+        compute.assert_called_once_with()
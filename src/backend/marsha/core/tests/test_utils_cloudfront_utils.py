@@ -0,0 +1,226 @@
+"""Test the CloudFront utils of the Marsha core app."""
+from base64 import b64decode
+from datetime import datetime
+import os
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+import pytz
+
+from ..utils import cloudfront_utils
+from .test_api_video import RSA_KEY_MOCK
+
+
+RESOURCE_ID = "a2f27fde-973a-4e89-8dca-cc59e01d255c"
+
+
+class CloudFrontUtilsTestCase(TestCase):
+    """Test our CloudFront utils."""
+
+    def setUp(self):
+        """Write the private key to a temporary file and start with an empty key cache."""
+        super().setUp()
+        key_file = tempfile.NamedTemporaryFile(delete=False)
+        key_file.write(RSA_KEY_MOCK)
+        key_file.close()
+        self.key_path = key_file.name
+        self.addCleanup(os.remove, self.key_path)
+        cloudfront_utils.private_key_cache.clear()
+        self.addCleanup(cloudfront_utils.private_key_cache.clear)
+        cache.clear()
+
+    def test_utils_cloudfront_utils_rsa_signer_caches_key(self):
+        """The private key should be read and parsed only once."""
+        key_cache = cloudfront_utils.private_key_cache
+        reload_count = key_cache.reload_count
+
+        with override_settings(CLOUDFRONT_PRIVATE_KEY_PATH=self.key_path):
+            signature = cloudfront_utils.rsa_signer(b"message")
+            self.assertEqual(cloudfront_utils.rsa_signer(b"message"), signature)
+            cloudfront_utils.rsa_signer(b"other message")
+
+        self.assertEqual(key_cache.reload_count, reload_count + 1)
+
+    def test_utils_cloudfront_utils_rsa_signer_reloads_key_on_change(self):
+        """The private key should be reloaded when the modification time of its file changes."""
+        key_cache = cloudfront_utils.private_key_cache
+        reload_count = key_cache.reload_count
+
+        with override_settings(CLOUDFRONT_PRIVATE_KEY_PATH=self.key_path):
+            cloudfront_utils.rsa_signer(b"message")
+            stat = os.stat(self.key_path)
+            os.utime(
+                self.key_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000)
+            )
+            cloudfront_utils.rsa_signer(b"message")
+            cloudfront_utils.rsa_signer(b"message")
+
+        self.assertEqual(key_cache.reload_count, reload_count + 2)
+
+    def test_utils_cloudfront_utils_rsa_signer_missing_key(self):
+        """A missing private key should raise a MissingRSAKey exception."""
+        with override_settings(CLOUDFRONT_PRIVATE_KEY_PATH=self.key_path + ".missing"):
+            with self.assertRaises(cloudfront_utils.MissingRSAKey):
+                cloudfront_utils.rsa_signer(b"message")
+
+    @override_settings(
+        CLOUDFRONT_SIGNED_URLS_WILDCARD_POLICY=True,
+        CLOUDFRONT_ACCESS_KEY_ID="cloudfront-access-key-id",
+    )
+    def test_utils_cloudfront_utils_sign_url_wildcard_policy(self):
+        """Urls of the same resource should share the signature of a wildcard policy."""
+        date_less_than = datetime(2018, 8, 8, 2, 0, 0, 123, tzinfo=pytz.utc)
+        with override_settings(CLOUDFRONT_PRIVATE_KEY_PATH=self.key_path):
+            signed_vtt_url = cloudfront_utils.sign_url(
+                "https://abc.cloudfront.net/{:s}/timedtext/1_fr.vtt".format(
+                    RESOURCE_ID
+                ),
+                RESOURCE_ID,
+                date_less_than,
+            )
+            signed_mp4_url = cloudfront_utils.sign_url(
+                "https://abc.cloudfront.net/{:s}/mp4/1_144.mp4?a=b".format(RESOURCE_ID),
+                RESOURCE_ID,
+                date_less_than,
+            )
+
+        vtt_url, vtt_params = signed_vtt_url.split("?")
+        _mp4_url, mp4_params = signed_mp4_url.split("?")
+        self.assertEqual(
+            vtt_url,
+            "https://abc.cloudfront.net/{:s}/timedtext/1_fr.vtt".format(RESOURCE_ID),
+        )
+        self.assertEqual(mp4_params, "a=b&{:s}".format(vtt_params))
+
+        params = dict(param.split("=", 1) for param in vtt_params.split("&"))
+        self.assertEqual(params["Key-Pair-Id"], "cloudfront-access-key-id")
+        self.assertEqual(
+            b64decode(
+                params["Policy"].replace("-", "+").replace("_", "=").replace("~", "/")
+            ),
+            b'{"Statement":[{"Resource":"https://abc.cloudfront.net/'
+            b'a2f27fde-973a-4e89-8dca-cc59e01d255c/*",'
+            b'"Condition":{"DateLessThan":{"AWS:EpochTime":1533693600}}}]}',
+        )
+
+    @override_settings(
+        CLOUDFRONT_SIGNED_URLS_CACHE_BUCKET=0,
+        CLOUDFRONT_SIGNED_URLS_WILDCARD_POLICY=True,
+        CLOUDFRONT_ACCESS_KEY_ID="cloudfront-access-key-id",
+    )
+    def test_utils_cloudfront_utils_sign_url_wildcard_policy_rotated_key(self):
+        """Wildcard policies should be signed with the new key once the key is rotated."""
+        url = "https://abc.cloudfront.net/{:s}/mp4/1_144.mp4".format(RESOURCE_ID)
+        date_less_than = datetime(2018, 8, 8, 2, 0, 1, tzinfo=pytz.utc)
+        with override_settings(CLOUDFRONT_PRIVATE_KEY_PATH=self.key_path):
+            signed_url = cloudfront_utils.sign_url(url, RESOURCE_ID, date_less_than)
+
+            new_key = rsa.generate_private_key(
+                public_exponent=65537, key_size=2048, backend=default_backend()
+            )
+            with open(self.key_path, "wb") as key_file:
+                key_file.write(
+                    new_key.private_bytes(
+                        encoding=serialization.Encoding.PEM,
+                        format=serialization.PrivateFormat.TraditionalOpenSSL,
+                        encryption_algorithm=serialization.NoEncryption(),
+                    )
+                )
+            stat = os.stat(self.key_path)
+            os.utime(
+                self.key_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000)
+            )
+
+            self.assertNotEqual(
+                cloudfront_utils.sign_url(url, RESOURCE_ID, date_less_than), signed_url
+            )
+
+    def test_utils_cloudfront_utils_round_date_less_than(self):
+        """Expiration dates should be rounded up to the next bucket of the signing cache."""
+        with override_settings(CLOUDFRONT_SIGNED_URLS_CACHE_BUCKET=600):
+            self.assertEqual(
+                cloudfront_utils.round_date_less_than(
+                    datetime(2018, 8, 8, 2, 0, 0, tzinfo=pytz.utc)
+                ),
+                datetime(2018, 8, 8, 2, 0, 0, tzinfo=pytz.utc),
+            )
+            self.assertEqual(
+                cloudfront_utils.round_date_less_than(
+                    datetime(2018, 8, 8, 2, 0, 1, 500, tzinfo=pytz.utc)
+                ),
+                datetime(2018, 8, 8, 2, 10, 0, tzinfo=pytz.utc),
+            )
+
+        with override_settings(CLOUDFRONT_SIGNED_URLS_CACHE_BUCKET=0):
+            self.assertEqual(
+                cloudfront_utils.round_date_less_than(
+                    datetime(2018, 8, 8, 2, 0, 1, 500, tzinfo=pytz.utc)
+                ),
+                datetime(2018, 8, 8, 2, 0, 1, tzinfo=pytz.utc),
+            )
+
+    @override_settings(
+        CLOUDFRONT_SIGNED_URLS_CACHE_BUCKET=600,
+        CLOUDFRONT_ACCESS_KEY_ID="cloudfront-access-key-id",
+    )
+    def test_utils_cloudfront_utils_sign_url_cache(self):
+        """Identical urls signed within the same bucket should be signed only once."""
+        url = "https://abc.cloudfront.net/{:s}/mp4/1_144.mp4".format(RESOURCE_ID)
+        with override_settings(
+            CLOUDFRONT_PRIVATE_KEY_PATH=self.key_path
+        ), mock.patch.object(
+            cloudfront_utils, "rsa_signer", wraps=cloudfront_utils.rsa_signer
+        ) as mock_rsa_signer:
+            signed_url = cloudfront_utils.sign_url(
+                url, RESOURCE_ID, datetime(2018, 8, 8, 2, 0, 1, tzinfo=pytz.utc)
+            )
+            self.assertIn("Expires=1533694200&", signed_url)
+            self.assertEqual(
+                cloudfront_utils.sign_url(
+                    url, RESOURCE_ID, datetime(2018, 8, 8, 2, 9, 59, tzinfo=pytz.utc)
+                ),
+                signed_url,
+            )
+            self.assertEqual(mock_rsa_signer.call_count, 1)
+
+            # A new bucket requires a new signature
+            self.assertIn(
+                "Expires=1533694800&",
+                cloudfront_utils.sign_url(
+                    url, RESOURCE_ID, datetime(2018, 8, 8, 2, 10, 1, tzinfo=pytz.utc)
+                ),
+            )
+            self.assertEqual(mock_rsa_signer.call_count, 2)
+
+            # Another url requires its own signature
+            cloudfront_utils.sign_url(
+                "{:s}?foo=bar".format(url),
+                RESOURCE_ID,
+                datetime(2018, 8, 8, 2, 0, 1, tzinfo=pytz.utc),
+            )
+            self.assertEqual(mock_rsa_signer.call_count, 3)
+
+    @override_settings(
+        CLOUDFRONT_SIGNED_URLS_CACHE_BUCKET=0,
+        CLOUDFRONT_ACCESS_KEY_ID="cloudfront-access-key-id",
+    )
+    def test_utils_cloudfront_utils_sign_url_cache_disabled(self):
+        """Urls should be signed each time if the signing cache is disabled."""
+        url = "https://abc.cloudfront.net/{:s}/mp4/1_144.mp4".format(RESOURCE_ID)
+        date_less_than = datetime(2018, 8, 8, 2, 0, 1, tzinfo=pytz.utc)
+        with override_settings(
+            CLOUDFRONT_PRIVATE_KEY_PATH=self.key_path
+        ), mock.patch.object(
+            cloudfront_utils, "rsa_signer", wraps=cloudfront_utils.rsa_signer
+        ) as mock_rsa_signer:
+            signed_url = cloudfront_utils.sign_url(url, RESOURCE_ID, date_less_than)
+            self.assertIn("Expires=1533693601&", signed_url)
+            cloudfront_utils.sign_url(url, RESOURCE_ID, date_less_than)
+
+        self.assertEqual(mock_rsa_signer.call_count, 2)
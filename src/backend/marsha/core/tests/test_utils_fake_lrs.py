@@ -0,0 +1,61 @@
+"""Test the fake LRS and the xAPI load test command of the Marsha core app."""
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+
+import requests
+
+from ..models import ConsumerSite, Video
+from ..utils.fake_lrs import FakeLRS
+from ..xapi import XAPI
+
+
+class FakeLRSTestCase(TestCase):
+    """Test the LRS stand-in used to test the xAPI endpoints without network access."""
+
+    def test_utils_fake_lrs_record_statements(self):
+        """The fake LRS should record the statements sent alone or in batches."""
+        with FakeLRS() as lrs:
+            xapi = XAPI(lrs.url, "Basic ThisIsABasicAuth")
+            xapi.post({"id": "1"})
+            xapi.post([{"id": "2"}, {"id": "3"}])
+
+        self.assertEqual(lrs.statements, [{"id": "1"}, {"id": "2"}, {"id": "3"}])
+        self.assertEqual(lrs.requests_count, 2)
+        self.assertEqual(lrs.headers[0]["Authorization"], "Basic ThisIsABasicAuth")
+        self.assertEqual(lrs.headers[0]["X-Experience-API-Version"], "1.0.3")
+
+    def test_utils_fake_lrs_inject_errors(self):
+        """The fake LRS should answer with errors at the configured rate."""
+        with FakeLRS(error_rate=1, error_status=500) as lrs:
+            response = requests.post(lrs.url, json={"id": "1"})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(lrs.statements, [])
+        self.assertEqual(lrs.requests_count, 1)
+
+
+class LoadTestXAPICommandTestCase(TransactionTestCase):
+    """Test the command load testing the xAPI endpoint.
+
+    The statements are sent by several threads so the data created by the command must be
+    committed to be visible by all of them.
+    """
+
+    def test_utils_fake_lrs_load_test_command(self):
+        """The command should send the statements to the fake LRS and report on it."""
+        out = StringIO()
+        call_command(
+            "load_test_xapi", statements=20, workers=2, lrs_latency=0, stdout=out
+        )
+
+        report = out.getvalue()
+        self.assertIn("Statements sent: 20 in ", report)
+        self.assertIn("Responses: 204: 20\n", report)
+        self.assertIn("Latency (ms): p50 ", report)
+        self.assertIn("Worker saturation: ", report)
+        self.assertIn("Fake LRS: 20 request(s), 20 statement(s) recorded", report)
+        # The data created for the load test are deleted
+        self.assertFalse(ConsumerSite.objects.exists())
+        self.assertFalse(Video.objects.all_with_deleted().exists())
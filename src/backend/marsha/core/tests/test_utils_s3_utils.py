@@ -0,0 +1,82 @@
+"""Test the S3 utils of the Marsha core app."""
+from datetime import datetime
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+import pytz
+
+from ..utils import s3_utils
+
+
+@override_settings(
+    AWS_ACCESS_KEY_ID="aws-access-key-id",
+    AWS_SECRET_ACCESS_KEY="aws-secret-access-key",
+    AWS_S3_REGION_NAME="eu-west-1",
+    AWS_SOURCE_BUCKET_NAME="source-bucket",
+)
+class S3UtilsTestCase(TestCase):
+    """Test our S3 utils."""
+
+    def setUp(self):
+        """Start each test without any signing key in memory."""
+        super().setUp()
+        s3_utils.get_signature_key.cache_clear()
+        s3_utils.get_daily_policy_fields.cache_clear()
+
+    def test_utils_s3_utils_signing_key_cache(self):
+        """The signing key should only be derived once a day and per secret key."""
+        with mock.patch.object(s3_utils, "sign", wraps=s3_utils.sign) as mock_sign:
+            policy = s3_utils.get_s3_upload_policy_signature(
+                datetime(2018, 8, 8, 10, 0, 0, tzinfo=pytz.utc), []
+            )
+            s3_utils.get_s3_upload_policy_signature(
+                datetime(2018, 8, 8, 23, 59, 59, tzinfo=pytz.utc), []
+            )
+            # Four chained HMACs derive the key
+            self.assertEqual(mock_sign.call_count, 4)
+
+            # A new day requires a new key
+            s3_utils.get_s3_upload_policy_signature(
+                datetime(2018, 8, 9, 0, 0, 0, tzinfo=pytz.utc), []
+            )
+            self.assertEqual(mock_sign.call_count, 8)
+
+            # A new secret key requires a new key
+            with override_settings(AWS_SECRET_ACCESS_KEY="new-secret-access-key"):
+                new_policy = s3_utils.get_s3_upload_policy_signature(
+                    datetime(2018, 8, 8, 10, 0, 0, tzinfo=pytz.utc), []
+                )
+            self.assertEqual(mock_sign.call_count, 12)
+
+        self.assertEqual(
+            policy["x_amz_credential"],
+            "aws-access-key-id/20180808/eu-west-1/s3/aws4_request",
+        )
+        self.assertEqual(new_policy["policy"], policy["policy"])
+        self.assertNotEqual(new_policy["x_amz_signature"], policy["x_amz_signature"])
+
+    def test_utils_s3_utils_signature(self):
+        """The policy signed with a memoized key should match the reference signature."""
+        now = datetime(2018, 8, 8, 10, 0, 0, tzinfo=pytz.utc)
+        conditions = [["starts-with", "$Content-Type", "video/"]]
+        policy = s3_utils.get_s3_upload_policy_signature(now, conditions)
+
+        signing_key = s3_utils.sign(
+            s3_utils.sign(
+                s3_utils.sign(
+                    s3_utils.sign(b"AWS4aws-secret-access-key", "20180808"), "eu-west-1"
+                ),
+                "s3",
+            ),
+            "aws4_request",
+        )
+        self.assertEqual(
+            s3_utils.get_s3_upload_policy_signature(now, conditions), policy
+        )
+        self.assertEqual(
+            policy["x_amz_signature"],
+            s3_utils.hmac.new(
+                signing_key, policy["policy"], s3_utils.hashlib.sha256
+            ).hexdigest(),
+        )
@@ -0,0 +1,78 @@
+"""Test the signature utils of the Marsha core app."""
+import hashlib
+import hmac
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from ..utils import signature_utils
+
+
+KEY = "{video!s}/video/{video!s}/1533686400".format(
+    video="4b8cb66c-4de4-4112-8be4-470db992a19e"
+)
+
+
+def sign(msg, secret):
+    """Sign a message like our AWS lambdas do."""
+    return hmac.new(
+        secret.encode("utf-8"), msg=msg.encode("utf-8"), digestmod=hashlib.sha256
+    ).hexdigest()
+
+
+class SignatureUtilsTestCase(TestCase):
+    """Test the verification of the messages signed by our AWS lambdas."""
+
+    def setUp(self):
+        """Start each test without any verifier in memory."""
+        super().setUp()
+        # pylint: disable=protected-access
+        signature_utils._get_signature_verifier.cache_clear()
+
+    def test_utils_signature_utils_verify(self):
+        """The generation of the secret used to sign the message should be returned."""
+        verifier = signature_utils.SignatureVerifier(
+            ["previous secret", "current secret"]
+        )
+
+        self.assertEqual(verifier.verify(KEY, sign(KEY, "previous secret")), 0)
+        self.assertEqual(verifier.verify(KEY, sign(KEY, "current secret")), 1)
+        self.assertEqual(verifier.verify(KEY, sign(KEY, "current secret")), 1)
+        self.assertIsNone(verifier.verify(KEY, sign(KEY, "other secret")))
+        self.assertIsNone(verifier.verify(KEY, "invalid signature é"))
+        self.assertIsNone(verifier.verify(KEY, sign(KEY, "current secret").upper()))
+        self.assertEqual(verifier.stats, {"generations": [1, 2], "invalid": 3})
+
+    def test_utils_signature_utils_constant_time(self):
+        """Signatures should be compared in constant time, stopping at the first match."""
+        verifier = signature_utils.SignatureVerifier(
+            ["secret 0", "secret 1", "secret 2"]
+        )
+
+        with mock.patch.object(
+            signature_utils.hmac, "compare_digest", wraps=hmac.compare_digest
+        ) as mock_compare_digest:
+            verifier.verify(KEY, sign(KEY, "secret 1"))
+            self.assertEqual(mock_compare_digest.call_count, 2)
+
+            verifier.verify(KEY, "invalid signature")
+            self.assertEqual(mock_compare_digest.call_count, 5)
+
+    def test_utils_signature_utils_update_state_verifier(self):
+        """The verifier should be shared until the secrets change."""
+        with override_settings(UPDATE_STATE_SHARED_SECRETS=["shared secret"]):
+            verifier = signature_utils.get_update_state_verifier()
+            self.assertIs(signature_utils.get_update_state_verifier(), verifier)
+            verifier.verify(KEY, sign(KEY, "shared secret"))
+            verifier.verify(KEY, "invalid signature")
+            self.assertEqual(
+                signature_utils.get_update_state_signature_stats(),
+                {"generations": [1], "invalid": 1},
+            )
+
+        with override_settings(
+            UPDATE_STATE_SHARED_SECRETS=["shared secret", "new secret"]
+        ):
+            new_verifier = signature_utils.get_update_state_verifier()
+            self.assertIsNot(new_verifier, verifier)
+            self.assertEqual(new_verifier.verify(KEY, sign(KEY, "new secret")), 1)
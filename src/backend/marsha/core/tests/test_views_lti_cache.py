@@ -1,4 +1,7 @@
 """Test caching LTI views in the ``core`` app of the Marsha project."""
+from datetime import datetime
+import hashlib
+import hmac
 from html import unescape
 import json
 import re
@@ -7,8 +10,17 @@ from unittest import mock
 
 from django.test import TestCase
 
-from ..factories import ConsumerSiteFactory, VideoFactory
+import pytz
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ..factories import (
+    ConsumerSiteFactory,
+    ThumbnailFactory,
+    TimedTextTrackFactory,
+    VideoFactory,
+)
 from ..lti import LTI
+from .utils import execute_on_commit_callbacks
 
 
 # We don't enforce arguments documentation in tests
@@ -19,7 +31,11 @@ class CacheLTIViewTestCase(TestCase):
     """Test caching in LTI views."""
 
     def _post_lti_request(self, url, data):
-        """Not a test but utility method to make an LTI request and test cache behavior."""
+        """Not a test but utility method to make an LTI request and test cache behavior.
+
+        Return the time taken by the request, the resource and the JWT token passed to the
+        frontend, if any.
+        """
         started_at = time.time()
         response = self.client.post(url, data)
         elapsed = time.time() - started_at
@@ -29,7 +45,8 @@ class CacheLTIViewTestCase(TestCase):
             '<div id="marsha-frontend-data" data-context="(.*)">', content
         )
         context = json.loads(unescape(match.group(1)))
-        return elapsed, context.get("resource")
+        jwt = AccessToken(context["jwt"]) if "jwt" in context else None
+        return elapsed, context.get("resource"), jwt
 
     @mock.patch.object(LTI, "verify")
     @mock.patch.object(LTI, "get_consumer_site")
@@ -52,39 +69,40 @@ class CacheLTIViewTestCase(TestCase):
             "user_id": "111",
         }
 
+        # The consumer sites portable to the consumer site are queried once and cached
         with self.assertNumQueries(3):
-            elapsed, resource_origin = self._post_lti_request(url, data)
+            elapsed, resource_origin, _jwt = self._post_lti_request(url, data)
         self.assertEqual(resource_origin["id"], str(video1.id))
         self.assertTrue(elapsed < 0.1)
 
         # Calling the same resource a second time with the same LTI parameters
         # should hit the cache and be ultra fast
         with self.assertNumQueries(0):
-            elapsed, resource = self._post_lti_request(url, data)
+            elapsed, resource, _jwt = self._post_lti_request(url, data)
         self.assertEqual(resource, resource_origin)
         self.assertTrue(elapsed < 0.01)
 
         # The cache should not be hit on first call if we change the playlist id
         data["context_id"] = "other_playlist"
-        with self.assertNumQueries(3):
-            elapsed, resource = self._post_lti_request(url, data)
+        with self.assertNumQueries(2):
+            elapsed, resource, _jwt = self._post_lti_request(url, data)
         self.assertEqual(resource, resource_origin)
         self.assertTrue(elapsed < 0.1)
 
         with self.assertNumQueries(0):
-            elapsed, resource = self._post_lti_request(url, data)
+            elapsed, resource, _jwt = self._post_lti_request(url, data)
         self.assertEqual(resource, resource_origin)
         self.assertTrue(elapsed < 0.01)
 
         # The cache should not be hit on first call if we change the domain
         mock_get_consumer_site.return_value = ConsumerSiteFactory()
         with self.assertNumQueries(3):
-            elapsed, resource = self._post_lti_request(url, data)
+            elapsed, resource, _jwt = self._post_lti_request(url, data)
         self.assertEqual(resource, resource_origin)
         self.assertTrue(elapsed < 0.1)
 
         with self.assertNumQueries(0):
-            elapsed, resource = self._post_lti_request(
+            elapsed, resource, _jwt = self._post_lti_request(
                 url, {**data, "context_id": "other_playlist"}
             )
         self.assertEqual(resource, resource_origin)
@@ -92,27 +110,27 @@ class CacheLTIViewTestCase(TestCase):
 
         # The cache should not be hit on first call if we change the resource id
         url = "/lti/videos/{!s}".format(video2.pk)
-        with self.assertNumQueries(3):
-            elapsed, resource_video2 = self._post_lti_request(url, data)
+        with self.assertNumQueries(2):
+            elapsed, resource_video2, _jwt = self._post_lti_request(url, data)
         self.assertEqual(resource_video2["id"], str(video2.id))
         self.assertTrue(elapsed < 0.1)
 
         with self.assertNumQueries(0):
-            elapsed, resource = self._post_lti_request(url, data)
+            elapsed, resource, _jwt = self._post_lti_request(url, data)
         self.assertEqual(resource, resource_video2)
         self.assertTrue(elapsed < 0.01)
 
         # The cache should STILL be hit if the user changes
         data["user_id"] = "222"
         with self.assertNumQueries(0):
-            elapsed, resource = self._post_lti_request(url, data)
+            elapsed, resource, _jwt = self._post_lti_request(url, data)
         self.assertEqual(resource, resource_video2)
         self.assertTrue(elapsed < 0.01)
 
     @mock.patch.object(LTI, "verify")
     @mock.patch.object(LTI, "get_consumer_site")
     def test_views_lti_cache_instructor(self, mock_get_consumer_site, mock_verify):
-        """Validate that responses are not cached for instructors."""
+        """Validate that responses are cached for instructors with per request permissions."""
         video = VideoFactory(upload_state="ready")
 
         mock_get_consumer_site.return_value = video.playlist.consumer_site
@@ -126,13 +144,132 @@ class CacheLTIViewTestCase(TestCase):
         }
 
         with self.assertNumQueries(3):
-            elapsed, resource_origin = self._post_lti_request(url, data)
+            _elapsed, resource_origin, jwt = self._post_lti_request(url, data)
         self.assertEqual(resource_origin["id"], str(video.id))
-        self.assertTrue(elapsed < 0.1)
+        self.assertEqual(
+            jwt.payload["permissions"],
+            {"can_access_dashboard": True, "can_update": True},
+        )
 
         # Calling the same resource a second time with the same LTI parameters
-        # should not hit the cache
-        with self.assertNumQueries(3):
-            elapsed, resource = self._post_lti_request(url, data)
+        # should hit the cache
+        with self.assertNumQueries(0):
+            _elapsed, resource, jwt = self._post_lti_request(url, data)
         self.assertEqual(resource, resource_origin)
-        self.assertTrue(elapsed < 0.1)
+        self.assertEqual(
+            jwt.payload["permissions"],
+            {"can_access_dashboard": True, "can_update": True},
+        )
+        self.assertEqual(jwt.payload["user_id"], "111")
+
+        # The cache should STILL be hit if the user changes
+        with self.assertNumQueries(0):
+            _elapsed, resource, jwt = self._post_lti_request(
+                url, {**data, "user_id": "222"}
+            )
+        self.assertEqual(resource, resource_origin)
+        self.assertEqual(jwt.payload["user_id"], "222")
+
+        # Students don't share the cache of instructors
+        with self.assertNumQueries(2):
+            _elapsed, resource, jwt = self._post_lti_request(
+                url, {**data, "roles": "student"}
+            )
+        self.assertEqual(resource, resource_origin)
+        self.assertEqual(
+            jwt.payload["permissions"],
+            {"can_access_dashboard": False, "can_update": False},
+        )
+
+    @mock.patch.object(LTI, "verify")
+    @mock.patch.object(LTI, "get_consumer_site")
+    def test_views_lti_cache_invalidation(self, mock_get_consumer_site, mock_verify):
+        """The cache should be invalidated as soon as the video or its relations change."""
+        video = VideoFactory(upload_state="pending")
+
+        mock_get_consumer_site.return_value = video.playlist.consumer_site
+
+        url = "/lti/videos/{!s}".format(video.pk)
+        data = {
+            "resource_link_id": video.lti_id,
+            "context_id": video.playlist.lti_id,
+            "roles": "student",
+            "user_id": "111",
+        }
+        instructor_data = {**data, "roles": "instructor"}
+
+        # The video is not ready: students can't see it
+        _elapsed, resource, _jwt = self._post_lti_request(url, data)
+        self.assertIsNone(resource)
+        _elapsed, resource, _jwt = self._post_lti_request(url, instructor_data)
+        self.assertEqual(resource["upload_state"], "pending")
+
+        # AWS notifies us that the video is ready
+        key = "{!s}/video/{!s}/1533686400".format(video.pk, video.pk)
+        signature = hmac.new(
+            "dummy".encode("utf-8"), msg=key.encode("utf-8"), digestmod=hashlib.sha256
+        ).hexdigest()
+        with execute_on_commit_callbacks():
+            response = self.client.post(
+                "/api/update-state",
+                {"key": key, "state": "ready", "signature": signature},
+            )
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(2):
+            _elapsed, resource, _jwt = self._post_lti_request(url, data)
+        self.assertEqual(resource["upload_state"], "ready")
+        with self.assertNumQueries(2):
+            _elapsed, resource, _jwt = self._post_lti_request(url, instructor_data)
+        self.assertEqual(resource["upload_state"], "ready")
+        self.assertEqual(resource["timed_text_tracks"], [])
+
+        # Adding a timed text track to the video should invalidate the cache
+        with execute_on_commit_callbacks():
+            TimedTextTrackFactory(video=video)
+        _elapsed, resource, _jwt = self._post_lti_request(url, data)
+        self.assertEqual(len(resource["timed_text_tracks"]), 1)
+
+        # Renaming the video should invalidate the cache
+        video.title = "new title"
+        with execute_on_commit_callbacks():
+            video.save()
+        _elapsed, resource, _jwt = self._post_lti_request(url, instructor_data)
+        self.assertEqual(resource["title"], "new title")
+
+    @mock.patch.object(LTI, "verify")
+    @mock.patch.object(LTI, "get_consumer_site")
+    def test_views_lti_nb_queries_timed_text_tracks(
+        self, mock_get_consumer_site, mock_verify
+    ):
+        """The number of queries should not depend on the number of timed text tracks."""
+        for nb_tracks in [1, 4]:
+            video = VideoFactory(
+                upload_state="ready", uploaded_on=datetime(2018, 8, 8, tzinfo=pytz.utc)
+            )
+            ThumbnailFactory(
+                video=video,
+                uploaded_on=datetime(2018, 8, 8, tzinfo=pytz.utc),
+                upload_state="ready",
+            )
+            for language in ["fr", "en", "de", "es"][:nb_tracks]:
+                TimedTextTrackFactory(
+                    video=video,
+                    language=language,
+                    uploaded_on=datetime(2018, 8, 8, tzinfo=pytz.utc),
+                    upload_state="ready",
+                )
+            mock_get_consumer_site.return_value = video.playlist.consumer_site
+
+            with self.assertNumQueries(3):
+                _elapsed, resource, _jwt = self._post_lti_request(
+                    "/lti/videos/{!s}".format(video.pk),
+                    {
+                        "resource_link_id": video.lti_id,
+                        "context_id": video.playlist.lti_id,
+                        "roles": "instructor",
+                        "user_id": "111",
+                    },
+                )
+            self.assertEqual(len(resource["timed_text_tracks"]), nb_tracks)
+            self.assertIsNotNone(resource["thumbnail"]["urls"])
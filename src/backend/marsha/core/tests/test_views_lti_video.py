@@ -1,4 +1,6 @@
 """Test the LTI video view."""
+from base64 import b64decode
+from datetime import datetime
 from html import unescape
 import json
 from logging import Logger
@@ -8,9 +10,12 @@ from unittest import mock
 import uuid
 
 from django.contrib.staticfiles.storage import staticfiles_storage
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.text import slugify
 
 from pylti.common import LTIException
+import pytz
 from rest_framework_simplejwt.tokens import AccessToken
 
 from ..factories import (
@@ -19,6 +24,7 @@ from ..factories import (
     VideoFactory,
 )
 from ..lti import LTI
+from ..utils import cloudfront_utils
 
 
 # We don't enforce arguments documentation in tests
@@ -432,6 +438,77 @@ class VideoLTIViewTestCase(TestCase):
         )
         self.assertEqual(context.get("modelName"), "videos")
 
+    @override_settings(
+        CLOUDFRONT_SIGNED_URLS_ACTIVE=True,
+        CLOUDFRONT_SIGNED_COOKIES_ACTIVE=True,
+        CLOUDFRONT_SIGNED_COOKIES_DOMAIN=".marsha.education",
+        CLOUDFRONT_DOMAIN="cdn.marsha.education",
+        CLOUDFRONT_ACCESS_KEY_ID="cloudfront-access-key-id",
+    )
+    @mock.patch.object(cloudfront_utils, "rsa_signer", return_value=b"signature")
+    @mock.patch.object(LTI, "verify")
+    @mock.patch.object(LTI, "get_consumer_site")
+    def test_views_lti_video_signed_cookies(
+        self, mock_get_consumer_site, mock_verify, mock_rsa_signer
+    ):
+        """Signed cookies should grant access to the video files instead of signed urls."""
+        passport = ConsumerSiteLTIPassportFactory()
+        video = VideoFactory(
+            playlist__lti_id="course-v1:ufr+mathematics+00001",
+            playlist__consumer_site=passport.consumer_site,
+            upload_state="ready",
+            uploaded_on=datetime(2018, 8, 8, tzinfo=pytz.utc),
+        )
+        data = {
+            "resource_link_id": video.lti_id,
+            "context_id": video.playlist.lti_id,
+            "roles": random.choice(["student", "instructor"]),
+            "oauth_consumer_key": passport.oauth_consumer_key,
+            "user_id": "56255f3807599c377bf0e5bf072359fd",
+        }
+        mock_get_consumer_site.return_value = passport.consumer_site
+
+        now = datetime(2018, 8, 8, tzinfo=pytz.utc)
+        with mock.patch.object(timezone, "now", return_value=now):
+            response = self.client.post("/lti/videos/{!s}".format(video.pk), data)
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode("utf-8")
+
+        match = re.search(
+            '<div id="marsha-frontend-data" data-context="(.*)">', content
+        )
+        context = json.loads(unescape(match.group(1)))
+        self.assertEqual(
+            context["resource"]["urls"]["mp4"]["144"],
+            "https://cdn.marsha.education/{!s}/mp4/1533686400_144.mp4"
+            "?response-content-disposition=attachment%3B+filename%3D{:s}_1533686400.mp4".format(
+                video.pk, slugify(video.playlist.title)
+            ),
+        )
+
+        self.assertEqual(
+            sorted(response.cookies.keys()),
+            ["CloudFront-Key-Pair-Id", "CloudFront-Policy", "CloudFront-Signature"],
+        )
+        for cookie in response.cookies.values():
+            self.assertEqual(cookie["path"], "/{!s}/".format(video.pk))
+            self.assertEqual(cookie["domain"], ".marsha.education")
+            self.assertEqual(cookie["max-age"], 7200)
+            self.assertTrue(cookie["secure"])
+            self.assertTrue(cookie["httponly"])
+        self.assertEqual(
+            response.cookies["CloudFront-Key-Pair-Id"].value, "cloudfront-access-key-id"
+        )
+        self.assertEqual(response.cookies["CloudFront-Signature"].value, "c2lnbmF0dXJl")
+        policy = response.cookies["CloudFront-Policy"].value
+        self.assertEqual(
+            b64decode(policy.replace("-", "+").replace("_", "=").replace("~", "/")),
+            '{{"Statement":[{{"Resource":"https://cdn.marsha.education/{!s}/*",'
+            '"Condition":{{"DateLessThan":{{"AWS:EpochTime":1533693600}}}}}}]}}'.format(
+                video.pk
+            ).encode("utf-8"),
+        )
+
     @mock.patch.object(LTI, "verify")
     @mock.patch.object(LTI, "get_consumer_site")
     @mock.patch.object(staticfiles_storage, "url")
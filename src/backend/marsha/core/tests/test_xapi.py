@@ -0,0 +1,504 @@
+"""Test the xAPI module of the Marsha core app."""
+from datetime import datetime, timedelta
+from io import StringIO
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+import pytz
+import requests
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .. import xapi
+from ..exceptions import MissingUserIdError
+from ..factories import ConsumerSiteFactory, PlaylistFactory, VideoFactory
+from ..lti import LTIUser
+from ..models import Video, XAPIOutboxStatement
+from .utils import execute_on_commit_callbacks
+
+
+class LRSClientTestCase(TestCase):
+    """Test the pooled client used to send statements to an LRS."""
+
+    def _get_response(self, status_code):
+        """Not a test but utility method to build a response from the LRS."""
+        response = requests.Response()
+        response.status_code = status_code
+        return response
+
+    def test_xapi_get_lrs_client_shared(self):
+        """The client of an LRS, and thus its pool of connections, should be reused."""
+        client = xapi.get_lrs_client("http://lrs.com/shared/xAPI")
+        self.assertIs(xapi.get_lrs_client("http://lrs.com/shared/xAPI"), client)
+        self.assertIsNot(xapi.get_lrs_client("http://lrs.com/other/xAPI"), client)
+
+    @override_settings(
+        XAPI_LRS_CONNECT_TIMEOUT=1,
+        XAPI_LRS_READ_TIMEOUT=5,
+        XAPI_LRS_MAX_RETRIES=2,
+        XAPI_LRS_RETRY_BACKOFF=0.5,
+    )
+    @mock.patch.object(xapi.time, "sleep")
+    def test_xapi_lrs_client_retry(self, mock_sleep):
+        """Transient failures should be retried with an exponential backoff."""
+        client = xapi.LRSClient("http://lrs.com/data/xAPI")
+        with mock.patch.object(
+            client.session,
+            "post",
+            side_effect=[
+                requests.ConnectionError(),
+                self._get_response(503),
+                self._get_response(200),
+            ],
+        ) as mock_post:
+            response = client.post(data={"foo": "bar"}, headers={})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_post.call_count, 3)
+        mock_post.assert_called_with(
+            "http://lrs.com/data/xAPI", json={"foo": "bar"}, headers={}, timeout=(1, 5)
+        )
+        self.assertEqual([call[0][0] for call in mock_sleep.call_args_list], [0.5, 1.0])
+        self.assertEqual(client.stats["requests"], 3)
+        self.assertEqual(client.stats["errors"], 2)
+        self.assertEqual(client.stats["retries"], 2)
+
+    @override_settings(XAPI_LRS_MAX_RETRIES=2)
+    @mock.patch.object(xapi.time, "sleep")
+    def test_xapi_lrs_client_no_retry_client_error(self, mock_sleep):
+        """Client errors should not be retried."""
+        client = xapi.LRSClient("http://lrs.com/data/xAPI")
+        with mock.patch.object(
+            client.session, "post", return_value=self._get_response(400)
+        ) as mock_post:
+            with self.assertRaises(requests.HTTPError):
+                client.post(data={}, headers={})
+
+        self.assertEqual(mock_post.call_count, 1)
+        mock_sleep.assert_not_called()
+        self.assertEqual(client.stats["errors"], 1)
+
+    @override_settings(XAPI_LRS_MAX_RETRIES=1)
+    @mock.patch.object(xapi.time, "sleep")
+    def test_xapi_lrs_client_retries_exhausted(self, _mock_sleep):
+        """The last failure should be raised once all retries are exhausted."""
+        client = xapi.LRSClient("http://lrs.com/exhausted/xAPI")
+        with mock.patch.object(
+            client.session, "post", side_effect=requests.Timeout()
+        ) as mock_post:
+            with self.assertRaises(requests.Timeout):
+                client.post(data={}, headers={})
+        self.assertEqual(mock_post.call_count, 2)
+
+        with mock.patch.object(
+            client.session, "post", return_value=self._get_response(502)
+        ):
+            with self.assertRaises(requests.HTTPError):
+                client.post(data={}, headers={})
+
+        with mock.patch.object(xapi, "_lrs_clients", {client.url: client}):
+            stats = xapi.get_lrs_stats()[client.url]
+        self.assertEqual(stats["requests"], 4)
+        self.assertEqual(stats["errors"], 4)
+        self.assertEqual(stats["retries"], 2)
+
+
+class XAPIOutboxTestCase(TestCase):
+    """Test sending the statements of the outbox."""
+
+    def _create_outbox_statement(self, consumer_site, name="statement", **kwargs):
+        """Not a test but utility method to store a statement in the outbox."""
+        return XAPIOutboxStatement.objects.create(
+            consumer_site=consumer_site, statement=json.dumps({"id": name}), **kwargs
+        )
+
+    @override_settings(
+        XAPI_OUTBOX_MAX_ATTEMPTS=3,
+        XAPI_OUTBOX_RETRY_DELAY=60,
+        XAPI_OUTBOX_BATCH_SIZE=1,
+        XAPI_OUTBOX_BATCH_MAX_WAIT=0,
+    )
+    @mock.patch.object(xapi.XAPI, "post")
+    def test_xapi_send_outbox_statements(self, mock_post):
+        """Sent statements should be deleted and failed ones retried later."""
+        consumer_site = ConsumerSiteFactory(
+            lrs_url="http://lrs.com/data/xAPI",
+            lrs_auth_token="Basic ThisIsABasicAuth",
+            lrs_xapi_version="1.0.3",
+        )
+        sent = self._create_outbox_statement(consumer_site, "sent")
+        unavailable = self._create_outbox_statement(
+            consumer_site, "unavailable", attempts=1
+        )
+        refused = self._create_outbox_statement(consumer_site, "refused")
+        now = timezone.now()
+        # Statements that are not due or that failed too many times are ignored
+        self._create_outbox_statement(
+            consumer_site, "not due", next_attempt_on=now + timedelta(minutes=1)
+        )
+        self._create_outbox_statement(consumer_site, "given up", attempts=3)
+
+        def post(statements):
+            name = statements[0]["id"]
+            if name in ["unavailable", "refused"]:
+                response = requests.Response()
+                response.status_code = 503 if name == "unavailable" else 400
+                raise requests.HTTPError(response=response)
+
+        mock_post.side_effect = post
+        with mock.patch.object(xapi.timezone, "now", return_value=now):
+            self.assertEqual(xapi.send_outbox_statements(), (1, 2))
+
+        self.assertEqual(
+            [call[0][0] for call in mock_post.call_args_list],
+            [[{"id": "sent"}], [{"id": "unavailable"}], [{"id": "refused"}]],
+        )
+        self.assertFalse(XAPIOutboxStatement.objects.filter(id=sent.id).exists())
+
+        unavailable.refresh_from_db()
+        self.assertEqual(unavailable.attempts, 2)
+        self.assertEqual(unavailable.next_attempt_on, now + timedelta(seconds=120))
+        self.assertIn("503", unavailable.last_error)
+        refused.refresh_from_db()
+        self.assertEqual(refused.attempts, 3)
+        self.assertEqual(XAPIOutboxStatement.objects.count(), 4)
+
+    @override_settings(XAPI_OUTBOX_BATCH_SIZE=1, XAPI_OUTBOX_BATCH_MAX_WAIT=0)
+    @mock.patch.object(xapi.XAPI, "post")
+    def test_xapi_send_xapi_statements_command(self, mock_post):
+        """The management command should drain the outbox."""
+        consumer_site = ConsumerSiteFactory(lrs_url="http://lrs.com/data/xAPI")
+        for _i in range(3):
+            self._create_outbox_statement(consumer_site)
+
+        out = StringIO()
+        call_command("send_xapi_statements", "--batch-size", "2", stdout=out)
+
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertFalse(XAPIOutboxStatement.objects.exists())
+        self.assertEqual(
+            out.getvalue(),
+            "2 statement(s) sent, 0 failed\n1 statement(s) sent, 0 failed\n",
+        )
+
+    @override_settings(XAPI_OUTBOX_BATCH_SIZE=2, XAPI_OUTBOX_BATCH_MAX_WAIT=5)
+    @mock.patch.object(xapi.XAPI, "post")
+    def test_xapi_send_outbox_statements_batches(self, mock_post):
+        """Statements should be sent in batches grouped by LRS."""
+        consumer_site = ConsumerSiteFactory(lrs_url="http://lrs.com/data/xAPI")
+        # Another consumer site using the same LRS
+        same_lrs_site = ConsumerSiteFactory(lrs_url="http://lrs.com/data/xAPI")
+        other_lrs_site = ConsumerSiteFactory(lrs_url="http://other-lrs.com/data/xAPI")
+        self._create_outbox_statement(consumer_site, "1")
+        self._create_outbox_statement(other_lrs_site, "2")
+        self._create_outbox_statement(same_lrs_site, "3")
+        self._create_outbox_statement(consumer_site, "4")
+
+        # The incomplete batches are held back until their oldest statement is old enough
+        self.assertEqual(xapi.send_outbox_statements(), (2, 0))
+        self.assertEqual(
+            mock_post.call_args_list, [mock.call([{"id": "1"}, {"id": "3"}])]
+        )
+        self.assertEqual(
+            list(XAPIOutboxStatement.objects.values_list("statement", flat=True)),
+            ['{"id": "2"}', '{"id": "4"}'],
+        )
+
+        mock_post.reset_mock()
+        with mock.patch.object(
+            xapi.timezone, "now", return_value=timezone.now() + timedelta(seconds=5)
+        ):
+            self.assertEqual(xapi.send_outbox_statements(), (2, 0))
+        self.assertCountEqual(
+            mock_post.call_args_list,
+            [mock.call([{"id": "2"}]), mock.call([{"id": "4"}])],
+        )
+        self.assertFalse(XAPIOutboxStatement.objects.exists())
+
+    @override_settings(
+        XAPI_OUTBOX_RETRY_DELAY=60,
+        XAPI_OUTBOX_BATCH_SIZE=2,
+        XAPI_OUTBOX_BATCH_MAX_WAIT=0,
+    )
+    @mock.patch.object(xapi.XAPI, "post")
+    def test_xapi_send_outbox_statements_claimed(self, mock_post):
+        """Statements should be claimed before being sent outside of any transaction."""
+        consumer_site = ConsumerSiteFactory(lrs_url="http://lrs.com/data/xAPI")
+        for name in ["1", "2"]:
+            self._create_outbox_statement(consumer_site, name)
+        now = timezone.now()
+
+        def post(_statements):
+            # Another worker would not pick up the statements being sent
+            self.assertEqual(
+                list(
+                    XAPIOutboxStatement.objects.values_list(
+                        "next_attempt_on", flat=True
+                    )
+                ),
+                [now + timedelta(seconds=60)] * 2,
+            )
+            self.assertEqual(xapi.send_outbox_statements(), (0, 0))
+
+        mock_post.side_effect = post
+        with mock.patch.object(xapi.timezone, "now", return_value=now):
+            self.assertEqual(xapi.send_outbox_statements(), (2, 0))
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertFalse(XAPIOutboxStatement.objects.exists())
+
+    @override_settings(XAPI_OUTBOX_BATCH_SIZE=3, XAPI_OUTBOX_BATCH_MAX_WAIT=0)
+    @mock.patch.object(xapi.XAPI, "post")
+    def test_xapi_send_outbox_statements_batch_refused(self, mock_post):
+        """The statements of a refused batch should be sent one by one."""
+        consumer_site = ConsumerSiteFactory(lrs_url="http://lrs.com/data/xAPI")
+        for name in ["1", "invalid", "3"]:
+            self._create_outbox_statement(consumer_site, name)
+
+        def post(statement):
+            if statement == {"id": "invalid"} or isinstance(statement, list):
+                response = requests.Response()
+                response.status_code = 400
+                raise requests.HTTPError(response=response)
+
+        mock_post.side_effect = post
+        self.assertEqual(xapi.send_outbox_statements(), (2, 1))
+
+        self.assertEqual(mock_post.call_count, 4)
+        invalid = XAPIOutboxStatement.objects.get()
+        self.assertEqual(invalid.statement, '{"id": "invalid"}')
+        self.assertEqual(invalid.attempts, 10)
+
+    @override_settings(XAPI_OUTBOX_BATCH_SIZE=3, XAPI_OUTBOX_BATCH_MAX_WAIT=0)
+    @mock.patch.object(xapi.XAPI, "post")
+    def test_xapi_send_outbox_statements_batch_unavailable(self, mock_post):
+        """All the statements of a batch should be retried if the LRS is unavailable."""
+        consumer_site = ConsumerSiteFactory(lrs_url="http://lrs.com/data/xAPI")
+        for name in ["1", "2", "3"]:
+            self._create_outbox_statement(consumer_site, name)
+
+        mock_post.side_effect = requests.ConnectionError()
+        self.assertEqual(xapi.send_outbox_statements(), (0, 3))
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(
+            list(XAPIOutboxStatement.objects.values_list("attempts", flat=True)),
+            [1, 1, 1],
+        )
+
+
+class XAPIContextTestCase(TestCase):
+    """Test the cache of the information needed to send the xAPI statements of a video."""
+
+    def setUp(self):
+        """Start each test with an empty cache."""
+        super().setUp()
+        cache.clear()
+
+    def test_xapi_get_xapi_context(self):
+        """The xAPI context of a video should be looked up in one query then cached."""
+        video = VideoFactory(
+            playlist__consumer_site__domain="example.com",
+            playlist__consumer_site__lrs_url="http://lrs.com/data/xAPI",
+            playlist__consumer_site__lrs_auth_token="Basic ThisIsABasicAuth",
+            playlist__consumer_site__lrs_xapi_version="1.0.3",
+        )
+        consumer_site = video.playlist.consumer_site
+
+        with self.assertNumQueries(1):
+            xapi_context = xapi.get_xapi_context(video.id)
+        self.assertEqual(
+            xapi_context,
+            {
+                "video_id": str(video.id),
+                "consumer_site_id": consumer_site.id,
+                "domain": "example.com",
+                "lrs_url": "http://lrs.com/data/xAPI",
+                "lrs_auth_token": "Basic ThisIsABasicAuth",
+                "lrs_xapi_version": "1.0.3",
+                "lrs_outbox_active": False,
+            },
+        )
+
+        with self.assertNumQueries(0):
+            self.assertEqual(xapi.get_xapi_context(video.id), xapi_context)
+
+    def test_xapi_get_xapi_context_missing_video(self):
+        """Looking up the xAPI context of a video that does not exist should fail."""
+        with self.assertRaises(Video.DoesNotExist):
+            xapi.get_xapi_context("a2f27fde-973a-4e89-8dca-cc59e01d255c")
+
+    def test_xapi_get_xapi_context_invalidation(self):
+        """The xAPI context should be invalidated when the video or its playlist changes."""
+        video = VideoFactory(playlist__consumer_site__domain="example.com")
+        self.assertEqual(xapi.get_xapi_context(video.id)["domain"], "example.com")
+
+        # Moving the video to a playlist of another consumer site
+        video.playlist = PlaylistFactory(consumer_site__domain="other.com")
+        with execute_on_commit_callbacks():
+            video.save()
+        self.assertEqual(xapi.get_xapi_context(video.id)["domain"], "other.com")
+
+        # Moving the playlist to another consumer site
+        playlist = video.playlist
+        playlist.consumer_site = ConsumerSiteFactory(domain="third.com")
+        with execute_on_commit_callbacks():
+            playlist.save()
+        self.assertEqual(xapi.get_xapi_context(video.id)["domain"], "third.com")
+
+        with execute_on_commit_callbacks():
+            video.delete()
+        with self.assertRaises(Video.DoesNotExist):
+            xapi.get_xapi_context(video.id)
+
+
+class StatementEnrichmentTestCase(TestCase):
+    """Test the enrichment of the statements sent by the video player."""
+
+    xapi_context = {
+        "video_id": "a2f27fde-973a-4e89-8dca-cc59e01d255c",
+        "consumer_site_id": "f1a2b3c4-973a-4e89-8dca-cc59e01d255c",
+        "domain": "example.com",
+        "lrs_url": "http://lrs.com/data/xAPI",
+        "lrs_auth_token": "Basic ThisIsABasicAuth",
+        "lrs_xapi_version": "1.0.3",
+        "lrs_outbox_active": False,
+    }
+
+    def _get_lti_user(self, **payload):
+        """Not a test but utility method to build the LTI user of a JWT token."""
+        jwt_token = AccessToken()
+        jwt_token.payload.update(payload)
+        return LTIUser(TokenUser(jwt_token))
+
+    def _get_statement(self, verb="initialized"):
+        """Not a test but utility method to build a statement validated by the serializer."""
+        return {
+            "id": "3f2b5c8a-dd81-459c-9ff4-9c02c5cba07b",
+            "verb": {
+                "id": "http://adlnet.gov/expapi/verbs/{:s}".format(verb),
+                "display": {"en-US": verb},
+            },
+            "context": {
+                "extensions": {"https://w3id.org/xapi/video/extensions/volume": 1}
+            },
+            "timestamp": datetime(2018, 12, 31, 16, 17, 35, 717000, tzinfo=pytz.utc),
+        }
+
+    def test_xapi_enrich_statement(self):
+        """A statement should be merged into the template of its video and user."""
+        lti_user = self._get_lti_user(
+            user_id="foo",
+            course={
+                "school_name": "ufr",
+                "course_name": "mathematics",
+                "course_run": None,
+            },
+        )
+        template = xapi.get_statement_template(self.xapi_context, lti_user)
+        statement = self._get_statement()
+
+        enriched_statement = xapi.enrich_statement(statement, template)
+
+        self.assertEqual(
+            enriched_statement,
+            {
+                "id": "3f2b5c8a-dd81-459c-9ff4-9c02c5cba07b",
+                "verb": {
+                    "id": "http://adlnet.gov/expapi/verbs/initialized",
+                    "display": {"en-US": "initialized"},
+                },
+                "context": {
+                    "extensions": {"https://w3id.org/xapi/video/extensions/volume": 1},
+                    "contextActivities": {
+                        "category": [{"id": "https://w3id.org/xapi/video"}]
+                    },
+                },
+                "timestamp": "2018-12-31T16:17:35.717000+00:00",
+                "actor": {
+                    "objectType": "Agent",
+                    "account": {"name": "foo", "homePage": "http://example.com"},
+                },
+                "object": {
+                    "definition": {
+                        "type": "https://w3id.org/xapi/video/activity-type/video",
+                        "extensions": {
+                            "https://w3id.org/xapi/acrossx/extensions/school": "ufr",
+                            "http://adlnet.gov/expapi/activities/course": "mathematics",
+                        },
+                    },
+                    "id": "uuid://a2f27fde-973a-4e89-8dca-cc59e01d255c",
+                    "objectType": "Activity",
+                },
+            },
+        )
+        # The statement sent by the video player is left untouched
+        self.assertEqual(statement, self._get_statement())
+
+    def test_xapi_get_statement_template_homepage(self):
+        """The homepage of the actor should keep the scheme of the consumer site domain."""
+        lti_user = self._get_lti_user(
+            user_id="foo",
+            course={"school_name": None, "course_name": None, "course_run": None},
+        )
+        template = xapi.get_statement_template(
+            dict(self.xapi_context, domain="https://example.com"), lti_user
+        )
+        self.assertEqual(
+            template["actor"]["account"]["homePage"], "https://example.com"
+        )
+        self.assertNotIn("extensions", template["object"]["definition"])
+
+    def test_xapi_get_statement_template_missing_user_id(self):
+        """A JWT token without user id should not allow building statements."""
+        with self.assertRaises(MissingUserIdError):
+            xapi.get_statement_template(self.xapi_context, self._get_lti_user())
+
+    def test_xapi_enrich_statements_batch_queries(self):
+        """A batch of statements should cost as many queries as a single statement.
+
+        The context of the video is read once per request and the template is built once per
+        batch, whatever the number of statements.
+        """
+        video = VideoFactory(
+            playlist__consumer_site__domain="example.com",
+            playlist__consumer_site__lrs_url="http://lrs.com/data/xAPI",
+            playlist__consumer_site__lrs_auth_token="Basic ThisIsABasicAuth",
+        )
+        jwt_token = AccessToken()
+        jwt_token.payload.update(
+            resource_id=str(video.id),
+            roles=["student"],
+            user_id="foo",
+            course={"school_name": None, "course_name": None, "course_run": None},
+        )
+        statement = self._get_statement()
+        del statement["id"]
+        statement["timestamp"] = "2018-12-31T16:17:35.717Z"
+
+        for size in [1, 10, 100]:
+            cache.clear()
+            with mock.patch(
+                "marsha.core.xapi.requests.Session.post"
+            ) as mock_post, mock.patch.object(
+                xapi, "get_statement_template", wraps=xapi.get_statement_template
+            ) as mock_get_template:
+                mock_post.return_value.status_code = 200
+                with self.assertNumQueries(1):
+                    response = self.client.post(
+                        "/xapi/bulk/",
+                        HTTP_AUTHORIZATION="Bearer {!s}".format(jwt_token),
+                        data=json.dumps([statement] * size),
+                        content_type="application/json",
+                    )
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), [{"status": 204}] * size)
+            mock_get_template.assert_called_once()
+            mock_post.assert_called_once()
+            self.assertEqual(len(mock_post.call_args[1]["json"]), size)
@@ -0,0 +1,27 @@
+"""Helpers shared by the tests of the ``core`` app of the Marsha project."""
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+@contextmanager
+def execute_on_commit_callbacks(using=DEFAULT_DB_ALIAS):
+    """Run the ``on_commit`` callbacks registered in the block when it exits.
+
+    ``TestCase`` wraps each test in a transaction that is never committed, so the callbacks
+    registered with ``transaction.on_commit`` would otherwise never run.
+
+    Parameters
+    ----------
+    using : string
+        The alias of the database connection on which the callbacks are registered.
+
+    """
+    connection = connections[using]
+    start = len(connection.run_on_commit)
+    yield
+    while len(connection.run_on_commit) > start:
+        callbacks = connection.run_on_commit[start:]
+        del connection.run_on_commit[start:]
+        for _savepoint_ids, callback in callbacks:
+            callback()
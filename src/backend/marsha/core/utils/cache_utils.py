@@ -0,0 +1,196 @@
+"""Utils to cache the application data passed to the frontend by LTI views.
+
+Cache keys are versioned with a generation counter per resource. Invalidating the application
+data of a resource only increments its counter: all the entries cached for the previous
+generation become unreachable at once, whatever the LTI context, and expire by themselves.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Ratio of the cache timeout before expiration during which a cached value gets recomputed
+EARLY_RECOMPUTE_RATIO = 0.1
+# Duration (in seconds) for which a request computing application data holds its lock
+LOCK_TIMEOUT = 5
+# Interval (in seconds) at which requests waiting for the lock check the cache
+LOCK_POLL_INTERVAL = 0.05
+
+
+def _get_generation_cache_key(model, resource_id):
+    """Build the cache key of the generation counter of a resource."""
+    return "app_data_generation|{model:s}|{resource!s}".format(
+        model=model.__name__, resource=resource_id
+    )
+
+
+def get_generation(model, resource_id):
+    """Return the current generation of the application data cached for a resource.
+
+    The counter is initialized with the current time in milliseconds instead of 0. If the
+    counter is ever evicted from the cache, it starts again above all the generations that
+    were previously used so stale entries can't be reached anymore.
+
+    Parameters
+    ----------
+    model : Type[models.Model]
+        The model of the resource (Video, Document,...)
+    resource_id : Type[string|uuid.UUID]
+        The primary key of the resource
+
+    Returns
+    -------
+    integer
+        The current generation of the resource
+
+    """
+    generation_key = _get_generation_cache_key(model, resource_id)
+    generation = cache.get(generation_key)
+    if generation is None:
+        # Another process may initialize the counter at the same time: the first one wins
+        cache.add(generation_key, int(time.time() * 1000), None)
+        generation = cache.get(generation_key)
+    return generation
+
+
+def get_app_data_cache_key(model, resource_id, domain, context_id, role):
+    """Build the cache key for the application data of a resource in an LTI context.
+
+    Parameters
+    ----------
+    model : Type[models.Model]
+        The model of the resource targeted by the LTI launch request (Video, Document,...)
+    resource_id : Type[string|uuid.UUID]
+        The primary key of the resource targeted by the LTI launch request
+    domain : string
+        The domain of the consumer site from which the LTI launch request comes
+    context_id : string
+        The LTI context (i.e. playlist) of the LTI launch request
+    role : string
+        The role that determines which resources are reachable ("instructor" or "student")
+
+    Returns
+    -------
+    string
+        The cache key, including the current generation of the resource
+
+    """
+    return (
+        "app_data|{model:s}|{generation!s}|{domain:s}|{context:s}|{resource!s}|{role:s}"
+    ).format(
+        model=model.__name__,
+        generation=get_generation(model, resource_id),
+        domain=domain,
+        context=context_id,
+        resource=resource_id,
+        role=role,
+    )
+
+
+def get_app_data_cache_timeout():
+    """Return the duration (in seconds) for which application data can be cached.
+
+    Application data include urls signed for `CLOUDFRONT_SIGNED_URLS_VALIDITY` seconds so
+    they can't be cached for more than half of this duration. This leaves at least half of
+    the validity to watch a video served from the cache.
+
+    Returns
+    -------
+    integer
+        The cache timeout
+
+    """
+    timeout = settings.APP_DATA_CACHE_DURATION
+    if (
+        settings.CLOUDFRONT_SIGNED_URLS_ACTIVE
+        and not settings.CLOUDFRONT_SIGNED_COOKIES_ACTIVE
+    ):
+        timeout = min(timeout, settings.CLOUDFRONT_SIGNED_URLS_VALIDITY // 2)
+    return timeout
+
+
+def set_app_data(cache_key, value):
+    """Cache application data under a key returned by `get_app_data_cache_key`.
+
+    The value is stored along with the time after which it should be recomputed ahead of
+    its expiration (see `get_or_compute_app_data`).
+
+    Parameters
+    ----------
+    cache_key : string
+        The cache key as returned by `get_app_data_cache_key`
+    value : any
+        The value to cache
+
+    """
+    timeout = get_app_data_cache_timeout()
+    refresh_at = time.time() + timeout * (1 - EARLY_RECOMPUTE_RATIO)
+    cache.set(cache_key, (refresh_at, value), timeout)
+
+
+def get_or_compute_app_data(cache_key, compute):
+    """Return application data from the cache or compute them, protecting against stampedes.
+
+    When many LTI launch requests target the same resource at the same time (e.g. a course
+    opening), only the request that acquires a lock computes the application data:
+
+    - on a cache miss, the other requests wait for the value to be cached and only compute it
+      themselves if it does not show up before the lock expires,
+    - when a cached value approaches its expiration, it is recomputed by one request while
+      the others keep being served the cached value.
+
+    Parameters
+    ----------
+    cache_key : string
+        The cache key as returned by `get_app_data_cache_key`
+    compute : callable
+        A function without arguments returning the application data
+
+    Returns
+    -------
+    any
+        The application data
+
+    """
+    lock_key = "{:s}|lock".format(cache_key)
+    cached = cache.get(cache_key)
+
+    if cached is not None:
+        refresh_at, value = cached
+        if time.time() < refresh_at or not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            return value
+    elif not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        for _attempt in range(int(LOCK_TIMEOUT / LOCK_POLL_INTERVAL)):
+            time.sleep(LOCK_POLL_INTERVAL)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached[1]
+        # The request holding the lock did not manage to compute the value in time
+        return compute()
+
+    try:
+        value = compute()
+        set_app_data(cache_key, value)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+def invalidate_app_data(model, resource_id):
+    """Invalidate all the application data cached for a resource, whatever the LTI context.
+
+    Parameters
+    ----------
+    model : Type[models.Model]
+        The model of the resource (Video, Document,...)
+    resource_id : Type[string|uuid.UUID]
+        The primary key of the resource
+
+    """
+    try:
+        cache.incr(_get_generation_cache_key(model, resource_id))
+    except ValueError:
+        # The counter does not exist: nothing can have been cached for this resource since
+        # the counter was evicted, and it will be initialized above any previous generation.
+        pass
@@ -4,12 +4,25 @@ Utils to sign CloudFront urls and cookies.
 Following boto3's documentation to sign CloudFront urls
 https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/cloudfront.html
 """
+from base64 import b64encode
+import hashlib
+import logging
+import os
+import threading
+
 from django.conf import settings
+from django.core.cache import cache
 
+from botocore.signers import CloudFrontSigner
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding
 
+from . import time_utils
+
+
+logger = logging.getLogger(__name__)
+
 
 class MissingRSAKey(Exception):
     """Exception raised when an RSA key is missing."""
@@ -17,6 +30,84 @@ class MissingRSAKey(Exception):
     pass
 
 
+class PrivateKeyCache:
+    """Process-wide cache for the private key used to sign CloudFront urls.
+
+    Reading and parsing the PEM file is costly compared to the signature itself so we keep
+    the parsed key in memory. The modification time of the key file is checked on each access
+    and the key is reloaded when it changes, which allows rotating the key without restarting
+    the application.
+
+    The number of times the key was (re)loaded is exposed in the `reload_count` attribute.
+    """
+
+    def __init__(self):
+        """Initialize an empty cache."""
+        self._lock = threading.Lock()
+        self._key = None
+        self._version = None
+        self.reload_count = 0
+
+    def get(self, path):
+        """Return the private key found at the given path, parsing it only if necessary.
+
+        Parameters
+        ----------
+        path : string
+            Path to the PEM encoded private key on the file system
+
+        Returns
+        -------
+        cryptography.hazmat.primitives.asymmetric.rsa.RSAPrivateKey
+            The parsed private key
+
+        Raises
+        ------
+        MissingRSAKey
+            Raised if the private key can't be found at the given path
+
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            # Don't cache a key whose file we can't stat, we would never know when to reload it
+            mtime = None
+
+        with self._lock:
+            if mtime is not None and self._version == (path, mtime):
+                return self._key
+
+            try:
+                with open(path, "rb") as key_file:
+                    key = serialization.load_pem_private_key(
+                        key_file.read(), password=None, backend=default_backend()
+                    )
+            except FileNotFoundError:
+                raise MissingRSAKey()
+
+            self.reload_count += 1
+            logger.info(
+                "CloudFront private key loaded from %s (%d load(s) in this process)",
+                path,
+                self.reload_count,
+            )
+
+            if mtime is not None:
+                self._key = key
+                self._version = (path, mtime)
+
+            return key
+
+    def clear(self):
+        """Forget the cached key so that it is reloaded on next access."""
+        with self._lock:
+            self._key = None
+            self._version = None
+
+
+private_key_cache = PrivateKeyCache()
+
+
 def rsa_signer(message):
     """Sign a message with an rsa key pair found on the file system for CloudFront signed urls.
 
@@ -31,12 +122,225 @@ def rsa_signer(message):
         The rsa signature
 
     """
-    try:
-        with open(settings.CLOUDFRONT_PRIVATE_KEY_PATH, "rb") as key_file:
-            private_key = serialization.load_pem_private_key(
-                key_file.read(), password=None, backend=default_backend()
-            )
-    except FileNotFoundError:
-        raise MissingRSAKey()
-
+    private_key = private_key_cache.get(settings.CLOUDFRONT_PRIVATE_KEY_PATH)
     return private_key.sign(message, padding.PKCS1v15(), hashes.SHA1())
+
+
+def url_b64encode(data):
+    """Encode bytes in the url safe flavour of base64 expected by CloudFront.
+
+    Parameters
+    ----------
+    data : Type[bytes]
+        the data to encode
+
+    Returns
+    -------
+    string
+        The data encoded in base64 with "+", "=" and "/" replaced by "-", "_" and "~"
+
+    """
+    return (
+        b64encode(data)
+        .replace(b"+", b"-")
+        .replace(b"=", b"_")
+        .replace(b"/", b"~")
+        .decode("utf-8")
+    )
+
+
+def get_resource_base_url(resource_id):
+    """Build the base url under which all the files of a resource are distributed.
+
+    Parameters
+    ----------
+    resource_id : Type[string|uuid.UUID]
+        the primary key of the resource (e.g. a video or a document)
+
+    Returns
+    -------
+    string
+        The CloudFront url of the folder holding all the files of the resource
+
+    """
+    return "{protocol:s}://{cloudfront:s}/{pk!s}".format(
+        protocol=settings.AWS_S3_URL_PROTOCOL,
+        cloudfront=settings.CLOUDFRONT_DOMAIN,
+        pk=resource_id,
+    )
+
+
+def round_date_less_than(date_less_than):
+    """Round an expiration date up to the next bucket of the signing cache.
+
+    All the urls signed within the same bucket get the same expiration date so that their
+    signature can be reused from the cache (see `CLOUDFRONT_SIGNED_URLS_CACHE_BUCKET`).
+
+    Parameters
+    ----------
+    date_less_than : Type[datetime.datetime]
+        the date and time at which the signature should expire
+
+    Returns
+    -------
+    datetime.datetime
+        The expiration date truncated to the second and rounded up to the next bucket
+
+    """
+    expires = int(date_less_than.timestamp())
+    bucket = settings.CLOUDFRONT_SIGNED_URLS_CACHE_BUCKET
+    if bucket:
+        expires += -expires % bucket
+    return time_utils.to_datetime(expires)
+
+
+def _get_or_sign(resource, date_less_than, sign):
+    """Look for a signature in the cache or compute it with the "sign" callable.
+
+    Signatures are cached for the duration of a bucket. Once the bucket is over, newly
+    signed urls get a later expiration date and thus a different cache key.
+    """
+    bucket = settings.CLOUDFRONT_SIGNED_URLS_CACHE_BUCKET
+    if not bucket:
+        return sign()
+
+    cache_key = "cloudfront_signature|{key_pair_id!s}|{expires:s}|{resource:s}".format(
+        key_pair_id=settings.CLOUDFRONT_ACCESS_KEY_ID,
+        expires=time_utils.to_timestamp(date_less_than),
+        resource=hashlib.sha1(resource.encode("utf-8")).hexdigest(),
+    )
+    signature = cache.get(cache_key)
+    if signature is None:
+        signature = sign()
+        cache.set(cache_key, signature, bucket)
+    return signature
+
+
+def _sign_policy(resource, date_less_than, key_pair_id):
+    """Sign a custom policy granting access to the resource until the expiration date.
+
+    The signature is shared through the cache by all the urls of the resource signed within
+    the same bucket. It is not memoized in the process, which would keep signing with a key
+    that was rotated.
+    """
+
+    def sign():
+        cloudfront_signer = CloudFrontSigner(key_pair_id, rsa_signer)
+        policy = cloudfront_signer.build_policy(resource, date_less_than).encode(
+            "utf-8"
+        )
+        return (
+            ("Policy", url_b64encode(policy)),
+            ("Signature", url_b64encode(rsa_signer(policy))),
+            ("Key-Pair-Id", key_pair_id),
+        )
+
+    return _get_or_sign(resource, date_less_than, sign)
+
+
+def get_wildcard_policy_params(resource_id, date_less_than):
+    """Sign a custom policy granting access to all the files of a resource.
+
+    Parameters
+    ----------
+    resource_id : Type[string|uuid.UUID]
+        the primary key of the resource (e.g. a video or a document)
+    date_less_than : Type[datetime.datetime]
+        the date and time at which the signature expires
+
+    Returns
+    -------
+    Tuple
+        The "Policy", "Signature" and "Key-Pair-Id" parameters as (name, value) pairs
+
+    """
+    return _sign_policy(
+        "{base:s}/*".format(base=get_resource_base_url(resource_id)),
+        round_date_less_than(date_less_than),
+        settings.CLOUDFRONT_ACCESS_KEY_ID,
+    )
+
+
+def sign_url(url, resource_id, date_less_than, wildcard_policies=None):
+    """Sign a CloudFront url.
+
+    By default, each url is signed with its own canned policy. If the
+    `CLOUDFRONT_SIGNED_URLS_WILDCARD_POLICY` setting is activated, the url is signed with a
+    custom policy covering all the files of the resource so that the same signature is shared
+    by all the urls of the resource. The policies signed for a payload are kept in the
+    `wildcard_policies` dictionary, if any, so that each resource is signed only once.
+
+    If the `CLOUDFRONT_SIGNED_COOKIES_ACTIVE` setting is activated, the url is returned
+    unsigned as access is granted by signed cookies (see `get_signed_cookies`).
+
+    In all other cases, the expiration date is rounded up to the next bucket of the signing cache
+    and the signature is reused for identical urls signed within the same bucket.
+
+    Parameters
+    ----------
+    url : Type[string]
+        the url to sign
+    resource_id : Type[string|uuid.UUID]
+        the primary key of the resource under which the file is distributed
+    date_less_than : Type[datetime.datetime]
+        the date and time at which the signature expires
+    wildcard_policies : Dictionary
+        the wildcard policy parameters already signed for the payload, by resource id. They
+        must all expire at `date_less_than`.
+
+    Returns
+    -------
+    string
+        The signed url
+
+    """
+    if settings.CLOUDFRONT_SIGNED_COOKIES_ACTIVE:
+        # Access to the files is granted by the signed cookies issued on LTI launch
+        return url
+
+    if settings.CLOUDFRONT_SIGNED_URLS_WILDCARD_POLICY:
+        if wildcard_policies is None:
+            params = get_wildcard_policy_params(resource_id, date_less_than)
+        else:
+            params = wildcard_policies.get(str(resource_id))
+            if params is None:
+                params = get_wildcard_policy_params(resource_id, date_less_than)
+                wildcard_policies[str(resource_id)] = params
+        return "{url:s}{separator:s}{params:s}".format(
+            url=url,
+            separator="&" if "?" in url else "?",
+            params="&".join("{:s}={:s}".format(*param) for param in params),
+        )
+
+    date_less_than = round_date_less_than(date_less_than)
+    cloudfront_signer = CloudFrontSigner(settings.CLOUDFRONT_ACCESS_KEY_ID, rsa_signer)
+    return _get_or_sign(
+        url,
+        date_less_than,
+        lambda: cloudfront_signer.generate_presigned_url(
+            url, date_less_than=date_less_than
+        ),
+    )
+
+
+def get_signed_cookies(resource_id, date_less_than):
+    """Build CloudFront signed cookies granting access to all the files of a resource.
+
+    Parameters
+    ----------
+    resource_id : Type[string|uuid.UUID]
+        the primary key of the resource (e.g. a video or a document)
+    date_less_than : Type[datetime.datetime]
+        the date and time at which the signature expires
+
+    Returns
+    -------
+    Dictionary
+        The values of the "CloudFront-Policy", "CloudFront-Signature" and
+        "CloudFront-Key-Pair-Id" cookies
+
+    """
+    return {
+        "CloudFront-{:s}".format(name): value
+        for name, value in get_wildcard_policy_params(resource_id, date_less_than)
+    }
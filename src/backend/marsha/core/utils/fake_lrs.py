@@ -0,0 +1,188 @@
+"""A local stand-in for a Learning Record Store (LRS).
+
+It is meant for tests and load tests of the xAPI endpoints, to reproduce the behavior of an
+LRS without network access: it runs an HTTP server on the loopback interface, in a thread of
+the current process, records the statements it receives and can be configured to answer
+slowly or with errors.
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import random
+import socketserver
+import threading
+import time
+import uuid
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """An HTTP server handling each request in a thread (built in only from Python 3.7)."""
+
+    daemon_threads = True
+
+
+class FakeLRSServer(ThreadingHTTPServer):
+    """The HTTP server of a fake LRS, giving access to the LRS to the request handlers.
+
+    Parameters
+    ----------
+    server_address : tuple
+        The host and port on which the server listens
+
+    lrs : FakeLRS
+        The fake LRS whose configuration and records are used to answer the requests
+
+    """
+
+    def __init__(self, server_address, lrs):
+        """Bind the server to its address and keep a reference to its LRS."""
+        self.lrs = lrs
+        super().__init__(server_address, FakeLRSRequestHandler)
+
+
+class FakeLRSRequestHandler(BaseHTTPRequestHandler):
+    """Answer the requests sent to the fake LRS like an LRS storing statements."""
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Record the statement(s) of the request unless an error should be injected."""
+        lrs = self.server.lrs
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if lrs.latency:
+            time.sleep(lrs.latency)
+
+        if lrs.should_fail():
+            self._respond(lrs.error_status, {"error": "Injected error"})
+            return
+
+        try:
+            statements = json.loads(body)
+        except ValueError:
+            self._respond(400, {"error": "Invalid JSON"})
+            return
+        if not isinstance(statements, list):
+            statements = [statements]
+
+        lrs.record(statements, self.headers)
+        self._respond(
+            200, [statement.get("id", str(uuid.uuid4())) for statement in statements]
+        )
+
+    def _respond(self, status, content):
+        """Send a JSON response."""
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Don't log each request on stderr."""
+
+
+class FakeLRSRecords:
+    """The requests received by a fake LRS, shared by the threads answering them."""
+
+    def __init__(self):
+        """Start without any request."""
+        self.statements = []
+        self.headers = []
+        self.requests_count = 0
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def count_request(self, error_rate):
+        """Count a request and decide whether it should be answered with an error."""
+        with self._lock:
+            self.requests_count += 1
+            return error_rate > 0 and self._random.random() < error_rate
+
+    def record(self, statements, headers):
+        """Store the statements received in a request and the headers of this request."""
+        with self._lock:
+            self.statements.extend(statements)
+            self.headers.append(dict(headers))
+
+
+class FakeLRS:
+    """An LRS running in a thread of the current process.
+
+    It can be used as a context manager:
+
+        with FakeLRS(latency=0.05, error_rate=0.1) as lrs:
+            consumer_site.lrs_url = lrs.url
+            ...
+            self.assertEqual(len(lrs.statements), 1)
+
+    Parameters
+    ----------
+    latency : float
+        Number of seconds to wait before answering each request
+
+    error_rate : float
+        Ratio of the requests (between 0 and 1) answered with `error_status` instead of
+        recording their statements
+
+    error_status : integer
+        The HTTP status of the injected errors
+
+    """
+
+    def __init__(self, latency=0, error_rate=0, error_status=503):
+        """Configure the fake LRS without starting it."""
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.records = FakeLRSRecords()
+        self._server = None
+        self._thread = None
+
+    @property
+    def statements(self):
+        """Return the statements recorded by the fake LRS."""
+        return self.records.statements
+
+    @property
+    def headers(self):
+        """Return the headers of the requests whose statements were recorded."""
+        return self.records.headers
+
+    @property
+    def requests_count(self):
+        """Return the number of requests received by the fake LRS."""
+        return self.records.requests_count
+
+    @property
+    def url(self):
+        """Return the url to configure as LRS url on a consumer site."""
+        host, port = self._server.server_address[:2]
+        return "http://{:s}:{:d}/data/xAPI/statements".format(host, port)
+
+    def start(self):
+        """Start listening on a free port of the loopback interface."""
+        self._server = FakeLRSServer(("127.0.0.1", 0), self)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server and wait for its thread to exit."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        """Start the server when entering the context."""
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        """Stop the server when leaving the context."""
+        self.stop()
+
+    def should_fail(self):
+        """Decide whether the current request should be answered with an error."""
+        return self.records.count_request(self.error_rate)
+
+    def record(self, statements, headers):
+        """Store the statements received in a request and the headers of this request."""
+        self.records.record(statements, headers)
@@ -1,15 +1,23 @@
 """Utils for direct upload to AWS S3."""
 from base64 import b64encode
 from datetime import timedelta
+from functools import lru_cache
 import hashlib
 import hmac
 import json
 
 from django.conf import settings
 
+import boto3
+from botocore.config import Config
+
 from ..defaults import AWS_UPLOAD_EXPIRATION_DELAY
 
 
+ACL = "private"
+X_AMZ_ALGORITHM = "AWS4-HMAC-SHA256"
+
+
 def sign(key, message):
     """Return a SHA256 hmac updated with the message.
 
@@ -29,6 +37,7 @@ def sign(key, message):
     return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
 
 
+@lru_cache(maxsize=16)
 def get_signature_key(secret_key, date_stamp, region_name, service_name):
     """AWS Signature v4 Key derivation function.
 
@@ -36,6 +45,9 @@ def get_signature_key(secret_key, date_stamp, region_name, service_name):
     version 4, the signing key is derived from the secret access key, which improves the security
     of the secret access key.
 
+    The key only depends on the arguments and changes once a day, so it is memoized: a new key
+    is derived when the date changes or when the secret key is rotated.
+
     Parameters
     ----------
     secret_key : string
@@ -62,6 +74,46 @@ def get_signature_key(secret_key, date_stamp, region_name, service_name):
     return k_signing
 
 
+@lru_cache(maxsize=16)
+def get_daily_policy_fields(access_key_id, secret_key, date_stamp, region, bucket):
+    """Compute the parts of the upload policies that are the same for all the uploads of a day.
+
+    Parameters
+    ----------
+    access_key_id : string
+        The AWS access key id
+    secret_key : string
+        The AWS secret access key
+    date_stamp : string
+        The date at which the policy is signed with a format "%Y%m%d"
+    region : string
+        The AWS region name
+    bucket : string
+        The name of the bucket to which files are uploaded
+
+    Returns
+    -------
+    Tuple
+        The "x-amz-credential" field, the conditions imposed to all our objects except the
+        date and the key to sign the policies
+
+    """
+    x_amz_credential = "{key:s}/{date:s}/{region:s}/s3/aws4_request".format(
+        key=access_key_id, date=date_stamp, region=region
+    )
+    base_conditions = (
+        {"acl": ACL},
+        {"bucket": bucket},
+        {"x-amz-credential": x_amz_credential},
+        {"x-amz-algorithm": X_AMZ_ALGORITHM},
+    )
+    return (
+        x_amz_credential,
+        base_conditions,
+        get_signature_key(secret_key, date_stamp, region, "s3"),
+    )
+
+
 def get_s3_upload_policy_signature(now, conditions):
     """Build a S3 policy to allow uploading a video to our video source bucket.
 
@@ -80,45 +132,33 @@ def get_s3_upload_policy_signature(now, conditions):
         signautre.
 
     """
-    acl = "private"
     expires_at = now + timedelta(seconds=AWS_UPLOAD_EXPIRATION_DELAY)
-    x_amz_algorithm = "AWS4-HMAC-SHA256"
-    x_amz_credential = "{key:s}/{date:%Y%m%d}/{region:s}/s3/aws4_request".format(
-        date=now, key=settings.AWS_ACCESS_KEY_ID, region=settings.AWS_S3_REGION_NAME
+    x_amz_credential, base_conditions, signature_key = get_daily_policy_fields(
+        settings.AWS_ACCESS_KEY_ID,
+        settings.AWS_SECRET_ACCESS_KEY,
+        now.strftime("%Y%m%d"),
+        settings.AWS_S3_REGION_NAME,
+        settings.AWS_SOURCE_BUCKET_NAME,
     )
     x_amz_date = now.strftime("%Y%m%dT%H%M%SZ")
 
     policy = {
         "expiration": expires_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-        "conditions": [
-            {"acl": acl},
-            {"bucket": settings.AWS_SOURCE_BUCKET_NAME},
-            {"x-amz-credential": x_amz_credential},
-            {"x-amz-algorithm": x_amz_algorithm},
-            {"x-amz-date": x_amz_date},
-        ]
-        + conditions,
+        "conditions": [*base_conditions, {"x-amz-date": x_amz_date}, *conditions],
     }
 
     policy_b64 = b64encode(
         json.dumps(policy).replace("\n", "").replace("\r", "").encode()
     )
 
-    signature_key = get_signature_key(
-        settings.AWS_SECRET_ACCESS_KEY,
-        now.strftime("%Y%m%d"),
-        settings.AWS_S3_REGION_NAME,
-        "s3",
-    )
-
     signature = hmac.new(signature_key, policy_b64, hashlib.sha256).hexdigest()
 
     return {
-        "acl": acl,
+        "acl": ACL,
         "bucket": settings.AWS_SOURCE_BUCKET_NAME,
         "policy": policy_b64,
         "s3_endpoint": get_s3_endpoint(settings.AWS_S3_REGION_NAME),
-        "x_amz_algorithm": x_amz_algorithm,
+        "x_amz_algorithm": X_AMZ_ALGORITHM,
         "x_amz_credential": x_amz_credential,
         "x_amz_date": x_amz_date,
         "x_amz_expires": AWS_UPLOAD_EXPIRATION_DELAY,
@@ -143,3 +183,162 @@ def get_s3_endpoint(region):
     if region == "us-east-1":
         return "s3.amazonaws.com"
     return "s3.{:s}.amazonaws.com".format(region)
+
+
+@lru_cache(maxsize=4)
+def _get_s3_client(access_key_id, secret_key, region):
+    """Build a S3 client, reused as long as the credentials and the region don't change."""
+    return boto3.client(
+        "s3",
+        aws_access_key_id=access_key_id,
+        aws_secret_access_key=secret_key,
+        region_name=region,
+        config=Config(signature_version="s3v4"),
+    )
+
+
+def get_s3_client():
+    """Return a S3 client configured with our credentials and region.
+
+    Returns
+    -------
+    botocore.client.S3
+        The S3 client, shared by all the requests of the process
+
+    """
+    return _get_s3_client(
+        settings.AWS_ACCESS_KEY_ID,
+        settings.AWS_SECRET_ACCESS_KEY,
+        settings.AWS_S3_REGION_NAME,
+    )
+
+
+def create_multipart_upload(key, content_type):
+    """Start a multipart upload to our source bucket.
+
+    Parameters
+    ----------
+    key : string
+        The key of the object to upload in the source bucket
+    content_type : string
+        The content type of the object
+
+    Returns
+    -------
+    string
+        The id of the multipart upload, to pass to the other multipart upload functions
+
+    """
+    response = get_s3_client().create_multipart_upload(
+        ACL=ACL,
+        Bucket=settings.AWS_SOURCE_BUCKET_NAME,
+        ContentType=content_type,
+        Key=key,
+    )
+    return response["UploadId"]
+
+
+def get_multipart_upload_part_urls(key, upload_id, part_numbers):
+    """Presign the urls to which the parts of a multipart upload should be sent with PUT.
+
+    The urls are signed locally, without any request to AWS.
+
+    Parameters
+    ----------
+    key : string
+        The key of the object in the source bucket
+    upload_id : string
+        The id of the multipart upload
+    part_numbers : Iterable
+        The numbers of the parts (between 1 and 10000)
+
+    Returns
+    -------
+    Dictionary
+        The presigned url of each part, indexed by part number
+
+    """
+    client = get_s3_client()
+    return {
+        part_number: client.generate_presigned_url(
+            "upload_part",
+            Params={
+                "Bucket": settings.AWS_SOURCE_BUCKET_NAME,
+                "Key": key,
+                "PartNumber": part_number,
+                "UploadId": upload_id,
+            },
+            ExpiresIn=AWS_UPLOAD_EXPIRATION_DELAY,
+        )
+        for part_number in part_numbers
+    }
+
+
+def list_multipart_upload_parts(key, upload_id):
+    """List the parts uploaded so far for a multipart upload.
+
+    It allows a client to resume an interrupted upload by only sending the missing parts.
+
+    Parameters
+    ----------
+    key : string
+        The key of the object in the source bucket
+    upload_id : string
+        The id of the multipart upload
+
+    Returns
+    -------
+    List
+        The "part_number", "etag" and "size" of each uploaded part, ordered by part number
+
+    """
+    paginator = get_s3_client().get_paginator("list_parts")
+    return [
+        {"part_number": part["PartNumber"], "etag": part["ETag"], "size": part["Size"]}
+        for page in paginator.paginate(
+            Bucket=settings.AWS_SOURCE_BUCKET_NAME, Key=key, UploadId=upload_id
+        )
+        for part in page.get("Parts", [])
+    ]
+
+
+def complete_multipart_upload(key, upload_id, parts):
+    """Assemble the parts of a multipart upload into the object.
+
+    Parameters
+    ----------
+    key : string
+        The key of the object in the source bucket
+    upload_id : string
+        The id of the multipart upload
+    parts : List
+        The "part_number" and the "etag" returned by S3 for each part
+
+    """
+    get_s3_client().complete_multipart_upload(
+        Bucket=settings.AWS_SOURCE_BUCKET_NAME,
+        Key=key,
+        MultipartUpload={
+            "Parts": [
+                {"ETag": part["etag"], "PartNumber": part["part_number"]}
+                for part in sorted(parts, key=lambda part: part["part_number"])
+            ]
+        },
+        UploadId=upload_id,
+    )
+
+
+def abort_multipart_upload(key, upload_id):
+    """Abort a multipart upload and free the storage used by its parts.
+
+    Parameters
+    ----------
+    key : string
+        The key of the object in the source bucket
+    upload_id : string
+        The id of the multipart upload
+
+    """
+    get_s3_client().abort_multipart_upload(
+        Bucket=settings.AWS_SOURCE_BUCKET_NAME, Key=key, UploadId=upload_id
+    )
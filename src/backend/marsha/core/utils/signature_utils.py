@@ -0,0 +1,106 @@
+"""Utils to verify the messages signed by our AWS lambdas."""
+from functools import lru_cache
+import hashlib
+import hmac
+import threading
+
+from django.conf import settings
+
+
+class SignatureVerifier:
+    """Verify HMAC-SHA256 signatures against several shared secrets.
+
+    The secrets are encoded and their HMAC objects initialized once, so verifying a signature
+    only hashes the message. Signatures are compared in constant time.
+
+    The index of a secret in the list is its generation: the number of signatures verified
+    with each generation is counted so the progress of a secret rotation can be measured
+    without logging any secret.
+
+    Parameters
+    ----------
+    secrets : Iterable
+        The shared secrets, as strings
+
+    """
+
+    def __init__(self, secrets):
+        """Pre-compute an HMAC object for each secret."""
+        self._macs = tuple(
+            hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+            for secret in secrets
+        )
+        self._lock = threading.Lock()
+        self.stats = {"generations": [0] * len(self._macs), "invalid": 0}
+
+    def verify(self, msg, signature):
+        """Check the signature of a message, stopping at the first secret that matches.
+
+        Parameters
+        ----------
+        msg : string
+            The signed message
+        signature : string
+            The hexadecimal HMAC-SHA256 signature of the message
+
+        Returns
+        -------
+        integer or `None`
+            The generation of the secret used to sign the message or `None` if the
+            signature is invalid
+
+        """
+        msg = msg.encode("utf-8")
+        signature = signature.encode("utf-8", "replace")
+        for generation, mac in enumerate(self._macs):
+            candidate = mac.copy()
+            candidate.update(msg)
+            if hmac.compare_digest(candidate.hexdigest().encode("ascii"), signature):
+                self._record(generation)
+                return generation
+        self._record(None)
+        return None
+
+    def _record(self, generation):
+        """Count a verified signature in the counters of its secret generation."""
+        with self._lock:
+            if generation is None:
+                self.stats["invalid"] += 1
+            else:
+                self.stats["generations"][generation] += 1
+
+
+@lru_cache(maxsize=4)
+def _get_signature_verifier(secrets):
+    """Build a verifier, reused as long as the secrets don't change."""
+    return SignatureVerifier(secrets)
+
+
+def get_update_state_verifier():
+    """Return the verifier of the state updates signed with `UPDATE_STATE_SHARED_SECRETS`.
+
+    Returns
+    -------
+    SignatureVerifier
+        The verifier, shared by all the requests of the process
+
+    """
+    return _get_signature_verifier(tuple(settings.UPDATE_STATE_SHARED_SECRETS))
+
+
+def get_update_state_signature_stats():
+    """Return the counters of the state update signatures verified by the process.
+
+    Returns
+    -------
+    dictionary
+        The number of signatures verified with each secret generation, in the order of
+        `UPDATE_STATE_SHARED_SECRETS`, and the number of invalid signatures
+
+    """
+    verifier = get_update_state_verifier()
+    with verifier._lock:  # pylint: disable=protected-access
+        return {
+            "generations": list(verifier.stats["generations"]),
+            "invalid": verifier.stats["invalid"],
+        }
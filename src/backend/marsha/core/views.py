@@ -1,13 +1,14 @@
 """Views of the ``core`` app of the Marsha project."""
 from abc import ABC, abstractmethod
+from datetime import timedelta
 import json
 from logging import getLogger
 import uuid
 
 from django.conf import settings
 from django.contrib.staticfiles.storage import staticfiles_storage
-from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views.decorators.clickjacking import xframe_options_exempt
 from django.views.decorators.csrf import csrf_exempt
@@ -21,6 +22,7 @@ from .lti import LTI
 from .lti.utils import PortabilityError, get_or_create_resource
 from .models import Document, Video
 from .serializers import DocumentSerializer, VideoSerializer
+from .utils import cache_utils, cloudfront_utils
 from .utils.react_locales_utils import react_locale
 
 
@@ -48,6 +50,13 @@ class BaseLTIView(ABC, TemplateResponseMixin, View):
     def serializer_class(self):
         """Return the serializer used by the view."""
 
+    def get_queryset(self):
+        """Return the queryset used to retrieve the resource targeted by the launch request.
+
+        Views should override it to load the relations needed by their serializer.
+        """
+        return self.model.objects.all()
+
     def get_context_data(self):
         """Build context for template rendering of configuration data for the frontend.
 
@@ -69,11 +78,57 @@ class BaseLTIView(ABC, TemplateResponseMixin, View):
 
         static_base_url = staticfiles_storage.url("").rstrip("/")
 
-        return {
+        context = {
             "app_data": json.dumps(app_data),
             "static_base_url": f"{static_base_url}/",
         }
 
+        if (
+            app_data["resource"] is not None
+            and settings.CLOUDFRONT_SIGNED_URLS_ACTIVE
+            and settings.CLOUDFRONT_SIGNED_COOKIES_ACTIVE
+        ):
+            context["cloudfront_signed_cookies"] = self._get_cloudfront_signed_cookies(
+                app_data["resource"]["id"]
+            )
+
+        return context
+
+    def _get_cloudfront_signed_cookies(self, resource_id):
+        """Build the CloudFront signed cookies granting access to the files of the resource.
+
+        One signature covers all the files of the resource (including adaptive bitrate
+        manifests and segments) so the urls in the resource representation are not signed.
+
+        Parameters
+        ----------
+        resource_id : string
+            The primary key of the resource targeted by the LTI launch request
+
+        Returns
+        -------
+        dictionary
+            The keyword arguments to pass to `set_cookie` for each cookie, by cookie name
+
+        """
+        now = timezone.now()
+        date_less_than = cloudfront_utils.round_date_less_than(
+            now + timedelta(seconds=settings.CLOUDFRONT_SIGNED_URLS_VALIDITY)
+        )
+        return {
+            name: {
+                "value": value,
+                "max_age": int((date_less_than - now).total_seconds()),
+                "path": "/{!s}/".format(resource_id),
+                "domain": settings.CLOUDFRONT_SIGNED_COOKIES_DOMAIN,
+                "secure": settings.AWS_S3_URL_PROTOCOL == "https",
+                "httponly": True,
+            }
+            for name, value in cloudfront_utils.get_signed_cookies(
+                resource_id, date_less_than
+            ).items()
+        }
+
     def _get_app_data(self):
         """Build app data for the frontend with information retrieved from the LTI launch request.
 
@@ -100,32 +155,41 @@ class BaseLTIView(ABC, TemplateResponseMixin, View):
         lti = LTI(self.request, self.kwargs["uuid"])
         lti.verify()
 
-        app_data = None
-        if lti.is_student:
-            cache_key = "app_data|{model:s}|{domain:s}|{context:s}|{resource!s}".format(
-                model=self.model.__name__,
-                domain=lti.get_consumer_site().domain,
-                context=lti.context_id,
-                resource=lti.resource_id,
+        # The serialized resource is cached for all roles. Only the lookup rules differ
+        # between students (ready resources only) and instructors, so the role is part of
+        # the cache key. Permissions and the JWT token are computed for each request.
+        is_instructor_or_admin = lti.is_instructor or lti.is_admin
+        cache_key = cache_utils.get_app_data_cache_key(
+            self.model,
+            lti.resource_id,
+            domain=lti.get_consumer_site().domain,
+            context_id=lti.context_id,
+            role="instructor" if is_instructor_or_admin else "student",
+        )
+
+        def compute():
+            resource = get_or_create_resource(
+                self.model, lti, queryset=self.get_queryset()
             )
+            return {
+                "app_data": {
+                    "modelName": self.model.RESOURCE_NAME,
+                    "resource": self.serializer_class(resource).data
+                    if resource
+                    else None,
+                    "state": "success",
+                },
+                "playlist_lti_id": resource.playlist.lti_id if resource else None,
+            }
 
-            app_data = cache.get(cache_key)
-            permissions = {"can_access_dashboard": False, "can_update": False}
+        cached = cache_utils.get_or_compute_app_data(cache_key, compute)
 
-        if not app_data:
-            resource = get_or_create_resource(self.model, lti)
-            permissions = {
-                "can_access_dashboard": lti.is_instructor or lti.is_admin,
-                "can_update": (lti.is_instructor or lti.is_admin)
-                and resource.playlist.lti_id == lti.context_id,
-            }
-            app_data = {
-                "modelName": self.model.RESOURCE_NAME,
-                "resource": self.serializer_class(resource).data if resource else None,
-                "state": "success",
-            }
-            if lti.is_student:
-                cache.set(cache_key, app_data, settings.APP_DATA_CACHE_DURATION)
+        app_data = cached["app_data"]
+        permissions = {
+            "can_access_dashboard": is_instructor_or_admin,
+            "can_update": is_instructor_or_admin
+            and cached["playlist_lti_id"] == lti.context_id,
+        }
 
         if app_data["resource"] is not None:
             try:
@@ -176,7 +240,11 @@ class BaseLTIView(ABC, TemplateResponseMixin, View):
             generated from applying the data to the template
 
         """
-        return self.render_to_response(self.get_context_data())
+        context = self.get_context_data()
+        response = self.render_to_response(context)
+        for name, cookie in context.get("cloudfront_signed_cookies", {}).items():
+            response.set_cookie(name, **cookie)
+        return response
 
 
 class VideoLTIView(BaseLTIView):
@@ -185,6 +253,12 @@ class VideoLTIView(BaseLTIView):
     model = Video
     serializer_class = VideoSerializer
 
+    def get_queryset(self):
+        """Load the thumbnail and timed text tracks serialized along with the video."""
+        return Video.objects.select_related("thumbnail").prefetch_related(
+            "timedtexttracks"
+        )
+
 
 class DocumentLTIView(BaseLTIView):
     """Document view called by an LTI launch request."""
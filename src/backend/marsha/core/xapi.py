@@ -1,10 +1,331 @@
 """XAPI module."""
-import re
+from datetime import timedelta
+import json
+from logging import getLogger
+import threading
+import time
 import uuid
 
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
 import requests
 
 from .exceptions import MissingUserIdError
+from .models import Video, XAPIOutboxStatement
+
+
+logger = getLogger(__name__)
+
+# Statuses returned by an LRS for which sending the statement again may succeed
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LRSClient:
+    """Send statements to an LRS through a pool of keep-alive connections.
+
+    Transient failures (connection errors, timeouts and 5xx responses) are retried with an
+    exponential backoff. Retrying a POST is safe because all our statements have an id and
+    an LRS must not store twice a statement with the same id.
+
+    Counters of requests, errors, retries and latency are kept for each LRS and can be read
+    with `get_lrs_stats`.
+    """
+
+    def __init__(self, url):
+        """Initialize the client and its pool of connections.
+
+        Parameters
+        ----------
+        url: string
+            The LRS endpoint to fetch
+
+        """
+        self.url = url
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.XAPI_LRS_POOL_MAXSIZE,
+            max_retries=0,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "errors": 0,
+            "retries": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+        }
+
+    def _record(self, latency, error=False, retry=False):
+        """Update the counters of the LRS after an attempt."""
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["errors"] += int(error)
+            self.stats["retries"] += int(retry)
+            self.stats["latency_total"] += latency
+            self.stats["latency_max"] = max(self.stats["latency_max"], latency)
+
+    def post(self, data, headers):
+        """Post data to the LRS, retrying transient failures.
+
+        Parameters
+        ----------
+        data: any
+            The data to send, serialized as JSON
+
+        headers: dictionary
+            The headers of the request
+
+        Returns
+        -------
+        requests.Response
+            The response of the LRS
+
+        Raises
+        ------
+        requests.exceptions.RequestException
+            Raised if the LRS responded with an error status or could not be reached after all
+            retries
+
+        """
+        attempt = 0
+        while True:
+            can_retry = attempt < settings.XAPI_LRS_MAX_RETRIES
+            start = time.monotonic()
+            try:
+                response = self.session.post(
+                    self.url,
+                    json=data,
+                    headers=headers,
+                    timeout=(
+                        settings.XAPI_LRS_CONNECT_TIMEOUT,
+                        settings.XAPI_LRS_READ_TIMEOUT,
+                    ),
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(time.monotonic() - start, error=True, retry=can_retry)
+                if not can_retry:
+                    raise
+            else:
+                error = response.status_code >= 400
+                retry = can_retry and response.status_code in RETRY_STATUSES
+                self._record(time.monotonic() - start, error=error, retry=retry)
+                if not retry:
+                    response.raise_for_status()
+                    return response
+
+            logger.warning(
+                "Retrying request to LRS %s (attempt %d)", self.url, attempt + 1
+            )
+            time.sleep(settings.XAPI_LRS_RETRY_BACKOFF * 2 ** attempt)
+            attempt += 1
+
+
+_lrs_clients = {}
+_lrs_clients_lock = threading.Lock()
+
+
+def get_lrs_client(url):
+    """Return the client of an LRS, shared by all the threads of the process.
+
+    Parameters
+    ----------
+    url: string
+        The LRS endpoint to fetch
+
+    Returns
+    -------
+    LRSClient
+        The client holding the pool of connections to the LRS
+
+    """
+    with _lrs_clients_lock:
+        if url not in _lrs_clients:
+            _lrs_clients[url] = LRSClient(url)
+        return _lrs_clients[url]
+
+
+def get_lrs_stats():
+    """Return the counters of all the LRS contacted by the process.
+
+    Returns
+    -------
+    dictionary
+        For each LRS url, the number of requests, errors and retries, and the total and
+        maximum latency in seconds
+
+    """
+    with _lrs_clients_lock:
+        clients = list(_lrs_clients.values())
+    stats = {}
+    for client in clients:
+        with client._lock:  # pylint: disable=protected-access
+            stats[client.url] = dict(client.stats)
+    return stats
+
+
+def _get_xapi_context_cache_key(video_id):
+    """Build the cache key under which the xAPI context of a video is cached."""
+    return "xapi_context|{!s}".format(video_id)
+
+
+def get_xapi_context(video_id):
+    """Return what is needed to build and send the xAPI statements of a video.
+
+    The video player sends statements all along the playback so the context is cached to
+    avoid looking up the video, its playlist and its consumer site on each statement. The
+    cache is invalidated each time the video, its playlist or its consumer site is saved or
+    deleted (see `invalidate_xapi_contexts`).
+
+    Parameters
+    ----------
+    video_id : Type[string|uuid.UUID]
+        The primary key of the video
+
+    Returns
+    -------
+    dictionary
+        The id of the video, the id and domain of its consumer site and the configuration of
+        the LRS of this consumer site
+
+    Raises
+    ------
+    Video.DoesNotExist
+        Raised if the video does not exist
+
+    """
+    cache_key = _get_xapi_context_cache_key(video_id)
+    xapi_context = cache.get(cache_key)
+    if xapi_context is None:
+        xapi_context = Video.objects.values(
+            consumer_site_id=F("playlist__consumer_site_id"),
+            domain=F("playlist__consumer_site__domain"),
+            lrs_url=F("playlist__consumer_site__lrs_url"),
+            lrs_auth_token=F("playlist__consumer_site__lrs_auth_token"),
+            lrs_xapi_version=F("playlist__consumer_site__lrs_xapi_version"),
+            lrs_outbox_active=F("playlist__consumer_site__lrs_outbox_active"),
+        ).get(pk=video_id)
+        xapi_context["video_id"] = str(video_id)
+        cache.set(cache_key, xapi_context, settings.XAPI_CONTEXT_CACHE_DURATION)
+    return xapi_context
+
+
+def invalidate_xapi_contexts(video_ids):
+    """Remove the xAPI context of videos from the cache.
+
+    Parameters
+    ----------
+    video_ids : Iterable
+        The primary keys of the videos whose xAPI context should be removed from the cache
+
+    """
+    cache.delete_many([_get_xapi_context_cache_key(video_id) for video_id in video_ids])
+
+
+# Parts of the enriched statements that are the same for all videos
+VIDEO_CONTEXT_ACTIVITIES = {"category": [{"id": "https://w3id.org/xapi/video"}]}
+VIDEO_ACTIVITY_TYPE = "https://w3id.org/xapi/video/activity-type/video"
+# Extensions of the object of the statements, built from the course of the LTI user
+COURSE_EXTENSIONS = (
+    ("school_name", "https://w3id.org/xapi/acrossx/extensions/school"),
+    ("course_name", "http://adlnet.gov/expapi/activities/course"),
+    ("course_run", "http://adlnet.gov/expapi/activities/module"),
+)
+
+
+def get_statement_template(xapi_context, lti_user):
+    """Build the parts of the statements that only depend on the video and on the user.
+
+    The template is built once for all the statements sent by a user about a video and only
+    the fields specific to each statement are then merged into it (see `enrich_statement`).
+
+    Parameters
+    ----------
+    xapi_context : dictionary
+        The xAPI context of the video, as returned by `get_xapi_context`
+
+    lti_user : Type[lti.LTIUser]
+        Object representing data stored in the JWT Token and related to the user authenticated
+        with LTI
+
+    Returns
+    -------
+    dictionary
+        The "actor" and "object" of the statements
+
+    Raises
+    ------
+    MissingUserIdError
+        Raised if the JWT token does not identify the user
+
+    """
+    try:
+        user_id = lti_user.user_id
+    except AttributeError:
+        raise MissingUserIdError()
+
+    homepage = xapi_context["domain"]
+    if not homepage.startswith(("http://", "https://")):
+        homepage = f"http://{homepage}"
+
+    definition = {"type": VIDEO_ACTIVITY_TYPE}
+    course = lti_user.course
+    object_extensions = {
+        extension: course[key]
+        for key, extension in COURSE_EXTENSIONS
+        if course[key] is not None
+    }
+    if object_extensions:
+        definition["extensions"] = object_extensions
+
+    return {
+        "actor": {
+            "objectType": "Agent",
+            "account": {"name": user_id, "homePage": homepage},
+        },
+        "object": {
+            "definition": definition,
+            "id": "uuid://{id}".format(id=xapi_context["video_id"]),
+            "objectType": "Activity",
+        },
+    }
+
+
+def enrich_statement(statement, template):
+    """Merge a statement sent by the video player into a template.
+
+    The statement is not modified: a new statement is returned, sharing the parts of the
+    template with all the other statements built from it.
+
+    Parameters
+    ----------
+    statement : dictionary
+        Statement containing base information to send to the LRS (see `XAPI.send`)
+
+    template : dictionary
+        The parts of the statement that only depend on the video and on the user, as returned
+        by `get_statement_template`
+
+    Returns
+    -------
+    dictionary
+        The enriched statement, ready to be sent to the LRS
+
+    """
+    enriched_statement = dict(statement, **template)
+    enriched_statement["timestamp"] = statement["timestamp"].isoformat()
+    enriched_statement["context"] = dict(
+        statement["context"], contextActivities=VIDEO_CONTEXT_ACTIVITIES
+    )
+    if "id" not in statement:
+        enriched_statement["id"] = str(uuid.uuid4())
+    return enriched_statement
 
 
 class XAPI:
@@ -29,13 +350,13 @@ class XAPI:
         self.auth_token = auth_token
         self.xapi_version = xapi_version
 
-    def send(self, video, statement, lti_user):
+    def send(self, xapi_context, statement, lti_user):
         """Send the statement to a LRS.
 
         Parameters
         ----------
-        video : Type[.models/videos]
-            The video object used in the xAPI statement
+        xapi_context : dictionary
+            The xAPI context of the video, as returned by `get_xapi_context`
 
         statement : dictionary
             Statement containing base information to send to the LRS
@@ -60,66 +381,276 @@ class XAPI:
             with LTI
 
         """
-        enrich_statement = self._enrich_statement(statement, video, lti_user)
+        self.post(self._enrich_statements([statement], xapi_context, lti_user)[0])
+
+    def send_many(self, xapi_context, statements, lti_user):
+        """Send several statements related to the same video to the LRS in one request.
+
+        Parameters
+        ----------
+        xapi_context : dictionary
+            The xAPI context of the video, as returned by `get_xapi_context`
+
+        statements : list
+            Statements containing base information to send to the LRS (see `send`)
+
+        lti_user : Type[lti.LTIUser]
+            Object representing data stored in the JWT Token and related to the user authenticated
+            with LTI
+
+        """
+        self.post(self._enrich_statements(statements, xapi_context, lti_user))
+
+    def enqueue_many(self, xapi_context, statements, lti_user):
+        """Enrich several statements and store them in the outbox to send them asynchronously.
+
+        Parameters
+        ----------
+        xapi_context : dictionary
+            The xAPI context of the video, as returned by `get_xapi_context`. The statements
+            are sent to the LRS of its consumer site
+
+        statements : list
+            Statements containing base information to send to the LRS (see `send`)
+
+        lti_user : Type[lti.LTIUser]
+            Object representing data stored in the JWT Token and related to the user authenticated
+            with LTI
+
+        Returns
+        -------
+        list
+            The statements stored in the outbox
+
+        """
+        return XAPIOutboxStatement.objects.bulk_create(
+            XAPIOutboxStatement(
+                consumer_site_id=xapi_context["consumer_site_id"],
+                statement=json.dumps(statement),
+            )
+            for statement in self._enrich_statements(statements, xapi_context, lti_user)
+        )
+
+    def enqueue(self, xapi_context, statement, lti_user):
+        """Enrich the statement and store it in the outbox to send it asynchronously.
+
+        Parameters
+        ----------
+        xapi_context : dictionary
+            The xAPI context of the video, as returned by `get_xapi_context`. The statement
+            is sent to the LRS of its consumer site
+
+        statement : dictionary
+            Statement containing base information to send to the LRS (see `send`)
+
+        lti_user : Type[lti.LTIUser]
+            Object representing data stored in the JWT Token and related to the user authenticated
+            with LTI
+
+        Returns
+        -------
+        Type[.models/XAPIOutboxStatement]
+            The statement stored in the outbox
+
+        """
+        return XAPIOutboxStatement.objects.create(
+            consumer_site_id=xapi_context["consumer_site_id"],
+            statement=json.dumps(
+                self._enrich_statements([statement], xapi_context, lti_user)[0]
+            ),
+        )
+
+    def post(self, statement):
+        """Post enriched statements to the LRS.
+
+        Parameters
+        ----------
+        statement : dictionary or list
+            The enriched statement, ready to be sent to the LRS, or a list of statements
+            to send them in one request
+
+        """
         headers = {
             "Authorization": self.auth_token,
             "Content-Type": "application/json",
             "X-Experience-API-Version": self.xapi_version,
         }
 
-        response = requests.post(self.url, json=enrich_statement, headers=headers)
+        get_lrs_client(self.url).post(statement, headers)
+
+    def _enrich_statements(self, statements, xapi_context, lti_user):
+        """Add additionnal information to statements related to the same video and user."""
+        template = get_statement_template(xapi_context, lti_user)
+        return [enrich_statement(statement, template) for statement in statements]
+
+
+def _record_failure(outbox_statement, error):
+    """Reschedule a statement that could not be sent, or give up if it can't be sent."""
+    max_attempts = settings.XAPI_OUTBOX_MAX_ATTEMPTS
+    response = getattr(error, "response", None)
+    if response is not None and response.status_code not in RETRY_STATUSES:
+        # The LRS refused the statement, sending it again won't help
+        outbox_statement.attempts = max_attempts
+    else:
+        outbox_statement.attempts += 1
+    outbox_statement.next_attempt_on = timezone.now() + timedelta(
+        seconds=settings.XAPI_OUTBOX_RETRY_DELAY * 2 ** (outbox_statement.attempts - 1)
+    )
+    outbox_statement.last_error = (
+        repr(error)
+        if response is None
+        else "{:d}: {:s}".format(response.status_code, response.text)
+    )
+    outbox_statement.save()
+    if outbox_statement.attempts >= max_attempts:
+        logger.error(
+            "Giving up sending xAPI statement %s to LRS %s: %s",
+            outbox_statement.id,
+            outbox_statement.consumer_site.lrs_url,
+            outbox_statement.last_error,
+        )
+
+
+def _send_statement(xapi, outbox_statement):
+    """Send a statement of the outbox alone and record the failure if it can't be sent.
+
+    Returns
+    -------
+    boolean
+        True if the statement was stored by the LRS
 
-        response.raise_for_status()
+    """
+    try:
+        xapi.post(json.loads(outbox_statement.statement))
+    except requests.exceptions.RequestException as error:
+        _record_failure(outbox_statement, error)
+        return False
+    return True
 
-    def _enrich_statement(self, statement, video, lti_user):
-        """Add additionnal information to the existing statement."""
-        try:
-            user_id = lti_user.user_id
-        except AttributeError:
-            raise MissingUserIdError()
 
-        homepage = video.playlist.consumer_site.domain
+def _send_batch(xapi, batch):
+    """Send a batch of statements to an LRS in one request.
 
-        if re.match(r"^http(s?):\/\/.*", homepage) is None:
-            homepage = f"http://{homepage}"
+    An LRS stores all the statements of a batch or none of them. If the batch is refused,
+    its statements are sent one by one so that only the faulty statements are held back.
 
-        if "id" not in statement:
-            statement["id"] = str(uuid.uuid4())
+    Returns
+    -------
+    tuple
+        The list of the statements sent and the number of statements that failed
 
-        statement["timestamp"] = statement["timestamp"].isoformat()
+    """
+    try:
+        xapi.post([json.loads(s.statement) for s in batch])
+    except requests.exceptions.RequestException as error:
+        response = getattr(error, "response", None)
+        if (
+            len(batch) == 1
+            or response is None
+            or response.status_code in RETRY_STATUSES
+        ):
+            for outbox_statement in batch:
+                _record_failure(outbox_statement, error)
+            return [], len(batch)
+    else:
+        return batch, 0
 
-        statement["context"].update(
-            {"contextActivities": {"category": [{"id": "https://w3id.org/xapi/video"}]}}
+    sent = [s for s in batch if _send_statement(xapi, s)]
+    return sent, len(batch) - len(sent)
+
+
+def _claim_outbox_batches(limit):
+    """Claim the statements of the outbox that are due and group them in batches.
+
+    Parameters
+    ----------
+    limit : integer
+        The maximum number of statements to consider
+
+    Returns
+    -------
+    list
+        A list of tuples, each with the url, auth token and xAPI version of an LRS and a
+        batch of statements to send to it
+
+    """
+    batch_size = settings.XAPI_OUTBOX_BATCH_SIZE
+    now = timezone.now()
+    flush_before = now - timedelta(seconds=settings.XAPI_OUTBOX_BATCH_MAX_WAIT)
+
+    with transaction.atomic():
+        # Only lock the statements: locking their consumer site would block the requests
+        # adding statements to the outbox
+        outbox_statements = (
+            XAPIOutboxStatement.objects.select_for_update(
+                skip_locked=True, of=("self",)
+            )
+            .select_related("consumer_site")
+            .filter(
+                next_attempt_on__lte=now, attempts__lt=settings.XAPI_OUTBOX_MAX_ATTEMPTS
+            )
+        )[:limit]
+
+        groups = {}
+        for outbox_statement in outbox_statements:
+            consumer_site = outbox_statement.consumer_site
+            lrs = (
+                consumer_site.lrs_url,
+                consumer_site.lrs_auth_token,
+                consumer_site.lrs_xapi_version,
+            )
+            groups.setdefault(lrs, []).append(outbox_statement)
+
+        batches = []
+        for lrs, group in groups.items():
+            for start in range(0, len(group), batch_size):
+                batch = group[start : start + batch_size]  # noqa: E203
+                if len(batch) < batch_size and batch[0].created_on > flush_before:
+                    continue
+                batches.append((lrs, batch))
+
+        XAPIOutboxStatement.objects.filter(
+            id__in=[s.id for _lrs, batch in batches for s in batch]
+        ).update(
+            next_attempt_on=now + timedelta(seconds=settings.XAPI_OUTBOX_RETRY_DELAY)
         )
 
-        statement["actor"] = {
-            "objectType": "Agent",
-            "account": {"name": user_id, "homePage": homepage},
-        }
+    return batches
 
-        statement["object"] = {
-            "definition": {"type": "https://w3id.org/xapi/video/activity-type/video"},
-            "id": "uuid://{id}".format(id=str(video.id)),
-            "objectType": "Activity",
-        }
 
-        object_extensions = {}
-        if lti_user.course["school_name"] is not None:
-            object_extensions[
-                "https://w3id.org/xapi/acrossx/extensions/school"
-            ] = lti_user.course["school_name"]
+def send_outbox_statements(limit=100):
+    """Send to their LRS the statements waiting in the outbox.
+
+    Statements are claimed in a short transaction so that several workers can drain the
+    outbox concurrently: their next attempt is postponed by `XAPI_OUTBOX_RETRY_DELAY`, so the
+    statements claimed by a worker that crashed are retried later like failed ones. They are
+    then sent outside of any transaction, so no lock is held during the requests to the LRS.
+
+    Statements are grouped by LRS and sent in batches of `XAPI_OUTBOX_BATCH_SIZE`
+    statements. An incomplete batch is held back until its oldest statement has waited for
+    `XAPI_OUTBOX_BATCH_MAX_WAIT` seconds.
+
+    Sent statements are deleted. Statements that could not be sent are retried later with an
+    exponential backoff, until `XAPI_OUTBOX_MAX_ATTEMPTS` is reached. They are then kept in
+    the outbox for inspection.
+
+    Parameters
+    ----------
+    limit : integer
+        The maximum number of statements to consider
 
-        if lti_user.course["course_name"] is not None:
-            object_extensions[
-                "http://adlnet.gov/expapi/activities/course"
-            ] = lti_user.course["course_name"]
+    Returns
+    -------
+    tuple
+        The number of statements sent and the number of statements that failed
 
-        if lti_user.course["course_run"] is not None:
-            object_extensions[
-                "http://adlnet.gov/expapi/activities/module"
-            ] = lti_user.course["course_run"]
+    """
+    sent, nb_failed = [], 0
+    for lrs, batch in _claim_outbox_batches(limit):
+        batch_sent, batch_nb_failed = _send_batch(XAPI(*lrs), batch)
+        sent.extend(batch_sent)
+        nb_failed += batch_nb_failed
 
-        if object_extensions:
-            statement["object"]["definition"]["extensions"] = object_extensions
+    XAPIOutboxStatement.objects.filter(id__in=[s.id for s in sent]).delete()
 
-        return statement
+    return len(sent), nb_failed
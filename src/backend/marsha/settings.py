@@ -197,6 +197,20 @@ class Base(Configuration):
     AWS_S3_URL_PROTOCOL = values.Value("https")
     AWS_SOURCE_BUCKET_NAME = values.Value()
     UPDATE_STATE_SHARED_SECRETS = values.ListValue()
+    # Maximum number of state updates accepted in one request by the bulk endpoint
+    UPDATE_STATE_BULK_MAX_ITEMS = values.PositiveIntegerValue(100)
+    # Upload state changes are published to this broker, which shares them between the
+    # processes through the default cache
+    UPLOAD_STATE_NOTIFICATIONS_BROKER = values.Value(
+        "marsha.core.notifications.CacheBroker"
+    )
+    # Maximum number of seconds a client waits for upload state changes in one request. Each
+    # waiting client holds a gunicorn thread so this timeout must stay short.
+    UPLOAD_STATE_NOTIFICATIONS_TIMEOUT = values.FloatValue(5)
+    # Number of seconds the upload state changes are kept by the cache broker and interval
+    # at which the waiting clients check for changes
+    UPLOAD_STATE_NOTIFICATIONS_RETENTION = values.PositiveIntegerValue(3600)
+    UPLOAD_STATE_NOTIFICATIONS_POLL_INTERVAL = values.FloatValue(0.5)
 
     # Cloud Front key pair for signed urls
     CLOUDFRONT_ACCESS_KEY_ID = values.Value(None)
@@ -205,13 +219,68 @@ class Base(Configuration):
     )
     CLOUDFRONT_SIGNED_URLS_ACTIVE = values.BooleanValue(True)
     CLOUDFRONT_SIGNED_URLS_VALIDITY = 2 * 60 * 60  # 2 hours
+    # Signed urls expiration dates are rounded to buckets of this duration (in seconds) so that
+    # identical urls signed within the same bucket can be reused from the cache (0 to disable)
+    CLOUDFRONT_SIGNED_URLS_CACHE_BUCKET = values.PositiveIntegerValue(10 * 60)
+    # Grant access to the files of a resource with signed cookies issued on LTI launch instead
+    # of signing each url. The cookies domain must be a parent domain of CLOUDFRONT_DOMAIN.
+    CLOUDFRONT_SIGNED_COOKIES_ACTIVE = values.BooleanValue(False)
+    CLOUDFRONT_SIGNED_COOKIES_DOMAIN = values.Value(None)
+    # Sign all the urls of a resource with one custom policy instead of one canned policy per url
+    CLOUDFRONT_SIGNED_URLS_WILDCARD_POLICY = values.BooleanValue(False)
 
     CLOUDFRONT_DOMAIN = values.Value(None)
 
     BYPASS_LTI_VERIFICATION = values.BooleanValue(False)
 
+    # xAPI
+    # Timeouts (in seconds) to connect to an LRS and to wait for its response
+    XAPI_LRS_CONNECT_TIMEOUT = values.FloatValue(3.05)
+    XAPI_LRS_READ_TIMEOUT = values.FloatValue(10)
+    # Number of times a statement is sent again to an LRS after a transient failure and
+    # backoff factor (in seconds) between retries
+    XAPI_LRS_MAX_RETRIES = values.PositiveIntegerValue(2)
+    XAPI_LRS_RETRY_BACKOFF = values.FloatValue(0.5)
+    # Maximum number of keep-alive connections to each LRS in each process
+    XAPI_LRS_POOL_MAXSIZE = values.PositiveIntegerValue(10)
+    # Statements in the outbox are retried with an exponential backoff starting at this
+    # delay (in seconds) and kept for inspection after this number of failed attempts
+    XAPI_OUTBOX_RETRY_DELAY = values.PositiveIntegerValue(60)
+    XAPI_OUTBOX_MAX_ATTEMPTS = values.PositiveIntegerValue(10)
+    # Statements of the outbox are sent to each LRS in batches of this size. An incomplete
+    # batch is sent once its oldest statement has waited for this number of seconds
+    XAPI_OUTBOX_BATCH_SIZE = values.PositiveIntegerValue(50)
+    XAPI_OUTBOX_BATCH_MAX_WAIT = values.PositiveIntegerValue(5)
+    # Maximum number of statements accepted in one request by the bulk xAPI endpoint
+    XAPI_BULK_MAX_STATEMENTS = values.PositiveIntegerValue(100)
+
     # Cache
-    APP_DATA_CACHE_DURATION = values.Value(60)  # 60 secondes
+    # The default cache must be shared by all the processes serving the application in
+    # production (e.g. "django_redis.cache.RedisCache" with "redis://redis:6379/1" as location)
+    # or the versioned app data cache is invalidated only in the process that changed a resource.
+    CACHES = {
+        "default": {
+            "BACKEND": values.Value(
+                "django.core.cache.backends.locmem.LocMemCache",
+                environ_name="CACHE_DEFAULT_BACKEND",
+            ),
+            "LOCATION": values.Value("", environ_name="CACHE_DEFAULT_LOCATION"),
+            "KEY_PREFIX": values.Value("marsha", environ_name="CACHE_KEY_PREFIX"),
+        }
+    }
+    # App data are invalidated each time a resource changes so they can live for long.
+    # The duration is capped to half the validity of CloudFront signed urls.
+    APP_DATA_CACHE_DURATION = values.PositiveIntegerValue(60 * 60)  # 1 hour
+    # Passports are invalidated each time they change. The duration is capped to 1 minute
+    # if the cache is local to each process.
+    LTI_PASSPORT_CACHE_DURATION = values.PositiveIntegerValue(60 * 60)  # 1 hour
+    # Consumer sites portability is invalidated each time a portability link changes
+    CONSUMER_SITE_PORTABILITY_CACHE_DURATION = values.PositiveIntegerValue(
+        24 * 60 * 60
+    )  # 1 day
+    # The xAPI context of a video is invalidated when the video, its playlist or its consumer
+    # site changes
+    XAPI_CONTEXT_CACHE_DURATION = values.PositiveIntegerValue(24 * 60 * 60)  # 1 day
 
     # pylint: disable=invalid-name
     @property
@@ -268,7 +337,20 @@ class Development(Base):
     AWS_SOURCE_BUCKET_NAME = values.Value("development-marsha-source")
     DEBUG = values.BooleanValue(True)
     CLOUDFRONT_SIGNED_URLS_ACTIVE = values.BooleanValue(False)
-    CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+    CACHES = {
+        "default": {
+            "BACKEND": values.Value(
+                "django.core.cache.backends.dummy.DummyCache",
+                environ_name="CACHE_DEFAULT_BACKEND",
+            ),
+            "LOCATION": values.Value("", environ_name="CACHE_DEFAULT_LOCATION"),
+            "KEY_PREFIX": values.Value("marsha", environ_name="CACHE_KEY_PREFIX"),
+        }
+    }
+    # The default dummy cache can't share upload state changes between processes
+    UPLOAD_STATE_NOTIFICATIONS_BROKER = values.Value(
+        "marsha.core.notifications.InProcessBroker"
+    )
 
     LOGGING = values.DictValue(
         {
@@ -292,6 +374,15 @@ class Test(Base):
 
     CLOUDFRONT_SIGNED_URLS_ACTIVE = False
     AWS_SOURCE_BUCKET_NAME = values.Value("test-marsha-source")
+    # An in-memory cache stands in for the shared cache used in production
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "marsha-test",
+        }
+    }
+    # Tests run in one process and are notified as soon as an upload state changes
+    UPLOAD_STATE_NOTIFICATIONS_BROKER = "marsha.core.notifications.InProcessBroker"
 
 
 class Production(Base):
@@ -337,6 +428,18 @@ class Production(Base):
     SESSION_COOKIE_SECURE = True
     CSRF_COOKIE_SECURE = True
 
+    # The default cache must be shared by all the processes serving the application (see
+    # `Base.CACHES`) so there is no default backend in production
+    CACHE_DEFAULT_BACKEND = values.Value(environ_required=True)
+
+    # pylint: disable=invalid-name
+    @property
+    def CACHES(self):
+        """Use the cache backend required by the `DJANGO_CACHE_DEFAULT_BACKEND` variable."""
+        return {
+            "default": {**Base.CACHES["default"], "BACKEND": self.CACHE_DEFAULT_BACKEND}
+        }
+
 
 class Staging(Production):
     """Staging environment settings."""
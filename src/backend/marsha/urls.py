@@ -14,8 +14,13 @@ from marsha.core.api import (
     ThumbnailViewSet,
     TimedTextTrackViewSet,
     VideoViewSet,
+    XAPIStatementBulkView,
     XAPIStatementView,
+)
+from marsha.core.api.upload_state import (
+    UploadStateEventsView,
     update_state,
+    update_state_bulk,
 )
 from marsha.core.views import DevelopmentLTIView, DocumentLTIView, VideoLTIView
 
@@ -40,6 +45,12 @@ urlpatterns = [
     ),
     # API
     path("api/update-state", update_state, name="update_state"),
+    path("api/update-state/bulk", update_state_bulk, name="update_state_bulk"),
+    path(
+        "api/upload-state-events",
+        UploadStateEventsView.as_view(),
+        name="upload_state_events",
+    ),
     path(
         "api/schema",
         get_schema_view(title="Marsha API", renderer_classes=[CoreJSONRenderer]),
@@ -47,6 +58,7 @@ urlpatterns = [
     ),
     path("api/", include(router.urls)),
     path("xapi/", XAPIStatementView.as_view(), name="xapi"),
+    path("xapi/bulk/", XAPIStatementBulkView.as_view(), name="xapi_bulk"),
 ]
 
 if settings.DEBUG: